@@ -0,0 +1,74 @@
+"""
+Per-materia acceptance rates, persisted across runs.
+
+The acceptance rate is the share of generated questions that survive the
+local rules and verification. Plans use it to over-generate just enough in
+the first round to reach the requested count.
+"""
+
+import json
+import math
+import os
+from pathlib import Path
+from typing import Optional
+
+from . import config
+
+# Pseudo-counts of the prior, so a materia with few samples stays near the default rate
+_PRIOR_WEIGHT = 10
+# Halve the counts above this many samples, so old runs fade out
+_MAX_SAMPLES = 500
+
+
+class AcceptanceTracker:
+    """
+    Generated/accepted counts per materia, stored as JSON in the cache directory.
+
+    With ``persist`` False the stored rates are neither read nor written, so the
+    run starts from the default rate and leaves the file untouched.
+    """
+
+    def __init__(self, path: Optional[Path] = None, persist: bool = True):
+        self.path = Path(path or Path(config.CACHE_DIR) / "acceptance.json")
+        self.persist = persist
+        self.counts: dict[str, dict[str, float]] = {}
+        if not persist:
+            return
+        try:
+            self.counts: dict[str, dict[str, float]] = json.loads(self.path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            self.counts = {}
+
+    def rate(self, materia: str) -> float:
+        """Smoothed acceptance rate, clamped to [MIN_ACCEPTANCE_RATE, 1]."""
+        c = self.counts.get(materia, {})
+        generated = c.get("generated", 0)
+        accepted = c.get("accepted", 0)
+        rate = (accepted + config.DEFAULT_ACCEPTANCE_RATE * _PRIOR_WEIGHT) / (generated + _PRIOR_WEIGHT)
+        return min(1.0, max(config.MIN_ACCEPTANCE_RATE, rate))
+
+    def record(self, materia: str, generated: int, accepted: int) -> None:
+        if generated <= 0:
+            return
+        c = self.counts.setdefault(materia, {"generated": 0, "accepted": 0})
+        c["generated"] += generated
+        c["accepted"] += min(accepted, generated)
+        if c["generated"] > _MAX_SAMPLES:
+            c["generated"] /= 2
+            c["accepted"] /= 2
+
+    def save(self) -> None:
+        if not self.persist:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.counts, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+
+
+def speculative_count(target: int, rate: float) -> int:
+    """How many questions to generate so that about ``target`` are accepted."""
+    if target <= 0:
+        return 0
+    count = math.ceil(target / rate)
+    return min(count, math.ceil(target * config.MAX_OVERGENERATION_FACTOR))
@@ -0,0 +1,292 @@
+"""
+Cohort analytics over exported ``user_progress`` rows.
+
+The quiz computes the projected score and weak materie in the browser, one
+user at a time. This module loads an export of the whole table (Supabase
+JSON or CSV, jsonb columns as JSON or JSON strings) into NumPy arrays and
+computes, for every user at once:
+
+- per-materia accuracy distributions (users, mean, percentiles);
+- the SSM-weighted projected score, with the same rules as index.html
+  (+1 / -0.25, the user's overall rate for materie without answers);
+- per-question p-values (share answering correctly) across users.
+
+``wrong_ids`` holds indexes into the bank lines, and stats_data does not
+record which questions were answered, so a question's exposure is
+estimated as the answers given in its materia divided by the materia's
+size in the bank. A question then has p = 1 - missed_by / exposure. Because
+review mode removes questions from wrong_ids once they are answered
+correctly, these p-values lean slightly easy.
+
+Usage:
+    python -m ssm.generator.analytics user_progress.json --out analisi/
+"""
+
+import argparse
+import csv
+import json
+import sys
+import warnings
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from . import codec, config
+from .bank import default_bank_path
+
+CORRECT_POINTS = 1.0
+WRONG_POINTS = -0.25
+PERCENTILES = (10, 25, 50, 75, 90)
+
+# Questions with fewer estimated exposures get no p-value
+MIN_EXPOSURE = 5.0
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise ImportError("NumPy is required for analytics. Install with: pip install numpy")
+
+
+def _jsonb(value, default):
+    """Supabase CSV exports jsonb columns as JSON strings."""
+    if value is None or value == "":
+        return default
+    if isinstance(value, str):
+        try:
+            return codec.loads(value)
+        except ValueError:
+            return default
+    return value
+
+
+def load_progress_rows(path: Path) -> list[dict]:
+    """Rows of a user_progress export: a JSON array (or {"rows": [...]}), JSONL or CSV."""
+    path = Path(path)
+    if path.suffix.lower() == ".csv":
+        csv.field_size_limit(sys.maxsize)
+        with open(path, newline="", encoding="utf-8") as f:
+            return list(csv.DictReader(f))
+
+    text = path.read_text(encoding="utf-8")
+    if path.suffix.lower() == ".jsonl":
+        return [codec.loads(line) for line in text.splitlines() if line.strip()]
+    data = codec.loads(text)
+    return data.get("rows", []) if isinstance(data, dict) else data
+
+
+@dataclass
+class ProgressArrays:
+    """Columnar view of the export: one row per user, one column per materia."""
+
+    user_ids: list[str]
+    materie: list[str]
+    correct: "np.ndarray"  # users x materie
+    total: "np.ndarray"  # users x materie
+    wrong_user: "np.ndarray"  # one entry per (user, wrong question) pair
+    wrong_question: "np.ndarray"
+    simulation_scores: "np.ndarray"
+
+
+def to_arrays(rows: list[dict]) -> ProgressArrays:
+    """Fill preallocated arrays in a single pass over the rows."""
+    _require_numpy()
+    materie = list(config.SSM_DISTRIBUTION)
+    column = {m: i for i, m in enumerate(materie)}
+
+    stats = [_jsonb(row.get("stats_data"), {}) for row in rows]
+    for s in stats:
+        for materia in (s.get("materie") or {}):
+            if materia not in column:
+                column[materia] = len(materie)
+                materie.append(materia)
+
+    correct = np.zeros((len(rows), len(materie)), dtype=np.int32)
+    total = np.zeros((len(rows), len(materie)), dtype=np.int32)
+    wrong_user, wrong_question, simulation_scores = [], [], []
+
+    for u, (row, s) in enumerate(zip(rows, stats)):
+        for materia, counts in (s.get("materie") or {}).items():
+            correct[u, column[materia]] = int(counts.get("correct", 0))
+            total[u, column[materia]] = int(counts.get("total", 0))
+        wrong_ids = [i for i in _jsonb(row.get("wrong_ids"), []) if isinstance(i, int) and i >= 0]
+        wrong_user.extend([u] * len(wrong_ids))
+        wrong_question.extend(wrong_ids)
+        simulation_scores.extend(
+            float(sim["score"]) for sim in _jsonb(row.get("simulations"), []) if isinstance(sim, dict) and "score" in sim
+        )
+
+    return ProgressArrays(
+        user_ids=[str(row.get("user_id", u)) for u, row in enumerate(rows)],
+        materie=materie,
+        correct=correct,
+        total=total,
+        wrong_user=np.asarray(wrong_user, dtype=np.int64),
+        wrong_question=np.asarray(wrong_question, dtype=np.int64),
+        simulation_scores=np.asarray(simulation_scores, dtype=np.float64),
+    )
+
+
+def projected_scores(arrays: ProgressArrays) -> "np.ndarray":
+    """Projected SSM score per user, as calculateProjectedScore() in index.html."""
+    quota = np.array([config.SSM_DISTRIBUTION.get(m, 0) for m in arrays.materie], dtype=np.float64)
+    answered = arrays.total.sum(axis=1)
+    overall = np.divide(arrays.correct.sum(axis=1), answered, out=np.zeros(len(answered)), where=answered > 0)
+    accuracy = np.divide(arrays.correct, arrays.total, out=np.zeros(arrays.total.shape), where=arrays.total > 0)
+    rate = np.where(arrays.total > 0, accuracy, overall[:, None])
+    points = rate * CORRECT_POINTS + (1 - rate) * WRONG_POINTS
+    return np.maximum(0.0, points @ quota)
+
+
+def materia_distributions(arrays: ProgressArrays) -> list[dict]:
+    """Accuracy percentiles per materia over the users who answered it."""
+    accuracy = np.divide(
+        arrays.correct, arrays.total, out=np.full(arrays.total.shape, np.nan), where=arrays.total > 0
+    )
+    users = (arrays.total > 0).sum(axis=0)
+    table = []
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # Materie nobody answered are all-NaN
+        means = np.nanmean(accuracy, axis=0)
+        percentiles = np.nanpercentile(accuracy, PERCENTILES, axis=0)
+    for j, materia in enumerate(arrays.materie):
+        row = {
+            "materia": materia,
+            "users": int(users[j]),
+            "answered": int(arrays.total[:, j].sum()),
+            "mean_accuracy": None if np.isnan(means[j]) else round(float(means[j]), 4),
+        }
+        for p, values in zip(PERCENTILES, percentiles):
+            row[f"p{p}"] = None if np.isnan(values[j]) else round(float(values[j]), 4)
+        table.append(row)
+    return table
+
+
+def question_pvalues(arrays: ProgressArrays, bank: list[dict]) -> list[dict]:
+    """Estimated share of correct answers per bank question (None below MIN_EXPOSURE)."""
+    column = {m: i for i, m in enumerate(arrays.materie)}
+    # Bank questions of materie nobody has stats for map to an extra, empty column
+    materia_index = np.array([column.get(q.get("materia"), len(arrays.materie)) for q in bank], dtype=np.int64)
+    bank_sizes = np.bincount(materia_index, minlength=len(arrays.materie) + 1)
+    answers = np.append(arrays.total.sum(axis=0), 0)
+
+    per_question_exposure = np.divide(answers, bank_sizes, out=np.zeros(len(bank_sizes)), where=bank_sizes > 0)
+    exposure = per_question_exposure[materia_index]
+
+    valid = arrays.wrong_question < len(bank)
+    missed_by = np.bincount(arrays.wrong_question[valid], minlength=len(bank))[:len(bank)]
+    p_value = np.clip(1.0 - np.divide(missed_by, exposure, out=np.zeros(len(bank)), where=exposure > 0), 0.0, 1.0)
+    reliable = exposure >= MIN_EXPOSURE
+
+    table = []
+    for i, question in enumerate(bank):
+        table.append({
+            "index": i,
+            "materia": question.get("materia", ""),
+            "argomenti": question.get("argomenti", ""),
+            "domanda": str(question.get("domanda", ""))[:80],
+            "missed_by": int(missed_by[i]),
+            "exposure": round(float(exposure[i]), 2),
+            "p_value": round(float(p_value[i]), 4) if reliable[i] else None,
+        })
+    return table
+
+
+def load_bank_questions(bank_path: Path) -> list[dict]:
+    """Bank questions indexed like the quiz does: one per non-empty line."""
+    questions = []
+    with open(bank_path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            # Invalid records stay as {} to keep indexes aligned with the quiz
+            questions.append(codec.decode_question(line) or {})
+    return questions
+
+
+def _write_csv(path: Path, rows: list[dict]) -> None:
+    if not rows:
+        return
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def summarize(arrays: ProgressArrays, bank: Optional[list[dict]], out_dir: Path) -> dict:
+    """Compute every table and write materie.csv, questions.csv, users.csv and summary.json."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    projections = projected_scores(arrays)
+    materie = materia_distributions(arrays)
+    _write_csv(out_dir / "materie.csv", materie)
+    _write_csv(out_dir / "users.csv", [
+        {"user_id": user_id, "answered": int(answered), "projected_score": round(float(score), 2)}
+        for user_id, answered, score in zip(arrays.user_ids, arrays.total.sum(axis=1), projections)
+    ])
+
+    questions = []
+    if bank is not None:
+        questions = question_pvalues(arrays, bank)
+        # Hardest first; questions without enough exposure last
+        questions.sort(key=lambda q: (q["p_value"] is None, q["p_value"] if q["p_value"] is not None else 0))
+        _write_csv(out_dir / "questions.csv", questions)
+
+    active = arrays.total.sum(axis=1) > 0
+    summary = {
+        "users": len(arrays.user_ids),
+        "active_users": int(active.sum()),
+        "answers": int(arrays.total.sum()),
+        "projected_score": {
+            f"p{p}": round(float(v), 2)
+            for p, v in zip(PERCENTILES, np.percentile(projections[active], PERCENTILES) if active.any() else [0] * 5)
+        },
+        "simulations": int(len(arrays.simulation_scores)),
+        "simulation_score_mean": round(float(arrays.simulation_scores.mean()), 2) if len(arrays.simulation_scores) else None,
+        "questions_with_pvalue": sum(1 for q in questions if q["p_value"] is not None),
+    }
+    (out_dir / "summary.json").write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding="utf-8")
+    return {"summary": summary, "materie": materie, "questions": questions}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Statistiche aggregate sugli export di user_progress")
+    parser.add_argument("export", type=str, help="Export di user_progress (.json, .jsonl o .csv)")
+    parser.add_argument("--bank", type=str, default=None, help="File JSONL della banca (default: config.BANK_FILE)")
+    parser.add_argument("--out", type=str, default="analisi", help="Cartella delle tabelle di output (default: analisi)")
+    args = parser.parse_args()
+
+    if np is None:
+        print("ERRORE: NumPy non installato. Installa con: pip install numpy")
+        sys.exit(1)
+
+    rows = load_progress_rows(Path(args.export))
+    arrays = to_arrays(rows)
+    bank_path = Path(args.bank) if args.bank else default_bank_path()
+    bank = load_bank_questions(bank_path) if bank_path.exists() else None
+    if bank is None:
+        print(f"ATTENZIONE: banca non trovata ({bank_path}), p-value delle domande non calcolati")
+
+    result = summarize(arrays, bank, Path(args.out))
+    summary = result["summary"]
+
+    print(f"Utenti: {summary['users']} ({summary['active_users']} attivi)  Risposte: {summary['answers']}")
+    print(f"Punteggio proiettato (mediana): {summary['projected_score']['p50']}")
+    weakest = sorted((m for m in result["materie"] if m["mean_accuracy"] is not None), key=lambda m: m["mean_accuracy"])
+    print("Materie più deboli:")
+    for m in weakest[:5]:
+        print(f"  {m['materia']}: {m['mean_accuracy']:.0%} di risposte corrette ({m['users']} utenti)")
+    hardest = [q for q in result["questions"] if q["p_value"] is not None][:5]
+    if hardest:
+        print("Domande più difficili:")
+        for q in hardest:
+            print(f"  #{q['index']} [{q['materia']}] p={q['p_value']:.2f}  {q['domanda']}")
+    print(f"Tabelle salvate in: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
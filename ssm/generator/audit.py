@@ -0,0 +1,219 @@
+"""
+Bulk re-verification of the existing question bank.
+
+Streams the bank, verifies it in parallel chunks bounded by question count
+and prompt tokens under the session's rate limit, and appends one verdict per
+question to ``<bank>.audit.jsonl``. The report doubles as the checkpoint:
+questions already audited with the current verifier prompt and model are
+skipped, so an interrupted audit resumes where it stopped.
+
+Usage:
+    python -m ssm.generator.bank audit
+    python -m ssm.generator.bank audit --materia Pediatria --sample 0.1
+"""
+
+import asyncio
+import hashlib
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, Optional
+
+import httpx
+
+from . import codec, config
+from .bank import default_bank_path, repair_tail
+from .pipeline import verify_questions
+from .session import ApiSession
+from .tokens import count_tokens
+from .verification_cache import VERIFIER_PROMPT_VERSION, default_verification_cache, question_content_hash
+
+
+def report_path_for(bank_path: Path) -> Path:
+    return bank_path.with_name(bank_path.name + ".audit.jsonl")
+
+
+@dataclass
+class AuditStats:
+    seen: int = 0
+    skipped: int = 0
+    audited: int = 0
+    valid: int = 0
+    failed_chunks: int = 0
+    invalid_by_materia: Counter = field(default_factory=Counter)
+
+
+def _in_sample(content_hash: str, sample: float, seed: str) -> bool:
+    """Deterministic sampling, so a resumed audit picks the same questions."""
+    if sample >= 1.0:
+        return True
+    digest = hashlib.sha256(f"{seed}:{content_hash}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64 < sample
+
+
+def iter_bank(bank_path: Path) -> Iterator[tuple[int, dict]]:
+    """Yield (line number, question) for every line of the bank holding a valid question."""
+    with open(bank_path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            question = codec.decode_question(line)
+            if question is not None:
+                yield line_number, question
+
+
+def load_audited(report_path: Path, model: str) -> set[str]:
+    """Content hashes already audited with the current prompt version and model."""
+    audited = set()
+    if not report_path.exists():
+        return audited
+    with open(report_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = codec.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(entry, dict) or "hash" not in entry:
+                continue
+            if entry.get("prompt_version") == VERIFIER_PROMPT_VERSION and entry.get("model") == model:
+                audited.add(entry["hash"])
+    return audited
+
+
+def iter_chunks(items: Iterator, max_questions: int, max_tokens: int) -> Iterator[list]:
+    """Group (line, hash, question) items into chunks bounded by count and prompt tokens."""
+    chunk = []
+    tokens = 0
+    for item in items:
+        size = count_tokens(codec.dumps_pretty(item[2]))
+        if chunk and (len(chunk) >= max_questions or tokens + size > max_tokens):
+            yield chunk
+            chunk, tokens = [], 0
+        chunk.append(item)
+        tokens += size
+    if chunk:
+        yield chunk
+
+
+async def run_audit(
+    bank_path: Optional[Path] = None,
+    materie: Optional[list[str]] = None,
+    sample: float = 1.0,
+    seed: str = "audit",
+    limit: Optional[int] = None,
+    concurrency: int = config.MAX_CONCURRENCY,
+    restart: bool = False,
+    session: Optional[ApiSession] = None,
+) -> AuditStats:
+    """Verify the bank (or a filtered sample of it) and append verdicts to the audit report."""
+    bank_path = Path(bank_path) if bank_path else default_bank_path()
+    report_path = report_path_for(bank_path)
+    session = session or ApiSession.from_config()
+    model = session.model_label
+
+    if restart and report_path.exists():
+        report_path.unlink()
+    # A crash mid-write leaves a partial verdict the next one would be glued to
+    repair_tail(report_path, label="AUDIT")
+
+    audited = load_audited(report_path, model)
+    stats = AuditStats()
+    wanted = set(materie) if materie else None
+    cache = default_verification_cache()
+
+    def pending_items():
+        selected = 0
+        for line_number, question in iter_bank(bank_path):
+            if wanted is not None and question.get("materia") not in wanted:
+                continue
+            content_hash = question_content_hash(question)
+            if not _in_sample(content_hash, sample, seed):
+                continue
+            if limit is not None and selected >= limit:
+                return
+            selected += 1
+            stats.seen += 1
+            if content_hash in audited:
+                stats.skipped += 1
+                continue
+            yield line_number, content_hash, question
+
+    slots = asyncio.Semaphore(max(1, concurrency) * session.endpoint_count)
+    write_lock = asyncio.Lock()
+    started = time.monotonic()
+
+    print(f"Audit della banca: {bank_path}")
+    if audited:
+        print(f"  Ripresa: {len(audited)} domande già verificate con questo prompt e modello")
+
+    with open(report_path, "a", encoding="utf-8") as report:
+        async with httpx.AsyncClient() as client:
+
+            async def audit_chunk(chunk: list) -> None:
+                try:
+                    if session.breaker is not None:
+                        await session.breaker.wait_ready()
+                    verdicts = await verify_questions(
+                        client, [q for _, _, q in chunk], session=session, cache=cache
+                    )
+                except Exception as e:
+                    stats.failed_chunks += 1
+                    print(f"  ERRORE su righe {chunk[0][0]}-{chunk[-1][0]}: {e}")
+                    return
+                finally:
+                    slots.release()
+
+                by_index = {v["domanda_index"]: v for v in verdicts}
+                async with write_lock:
+                    for i, (line_number, content_hash, question) in enumerate(chunk):
+                        verdict = by_index.get(i)
+                        if verdict is None:
+                            continue  # Retried on the next run
+                        is_valid = bool(verdict.get("is_valid", True))
+                        report.write(codec.dumps_line({
+                            "line": line_number,
+                            "hash": content_hash,
+                            "materia": question.get("materia"),
+                            "domanda": str(question.get("domanda", ""))[:120],
+                            "is_valid": is_valid,
+                            "issues": verdict.get("issues") or [],
+                            "suggested_fix": verdict.get("suggested_fix") or "",
+                            "prompt_version": VERIFIER_PROMPT_VERSION,
+                            "model": model,
+                        }) + "\n")
+                        stats.audited += 1
+                        if is_valid:
+                            stats.valid += 1
+                        else:
+                            stats.invalid_by_materia[question.get("materia")] += 1
+                    # Every flushed chunk is a checkpoint
+                    report.flush()
+                print(f"  Verificate {stats.audited} domande ({time.monotonic() - started:.0f}s)")
+
+            tasks = []
+            for chunk in iter_chunks(pending_items(), config.AUDIT_CHUNK_QUESTIONS, config.AUDIT_CHUNK_MAX_TOKENS):
+                # Bounded in flight, so the bank is streamed rather than loaded up front
+                await slots.acquire()
+                tasks.append(asyncio.create_task(audit_chunk(chunk)))
+            await asyncio.gather(*tasks)
+
+    print_audit_summary(stats, report_path)
+    for reporter in session.reporters() + ([cache] if cache else []):
+        for line in reporter.summary_lines():
+            print(f"  {line}")
+    return stats
+
+
+def print_audit_summary(stats: AuditStats, report_path: Path) -> None:
+    print(f"\n{'=' * 50}")
+    print("AUDIT COMPLETATO")
+    print(f"  Domande selezionate: {stats.seen}")
+    print(f"  Già verificate (saltate): {stats.skipped}")
+    print(f"  Verificate ora: {stats.audited}")
+    print(f"  Valide: {stats.valid}  Non valide: {stats.audited - stats.valid}")
+    if stats.failed_chunks:
+        print(f"  Blocchi falliti (da riprendere): {stats.failed_chunks}")
+    for materia, count in stats.invalid_by_materia.most_common():
+        print(f"    {materia}: {count} non valide")
+    print(f"  Report: {report_path}")
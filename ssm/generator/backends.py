@@ -0,0 +1,228 @@
+"""
+Pool of OpenAI-compatible chat-completion endpoints.
+
+Lets one run spread its requests over several API keys, organizations or
+local OpenAI-compatible servers. Each endpoint has its own request/token
+rate limits and its own circuit breaker for health tracking. Requests go to
+the least-loaded healthy endpoint, weighted by ``weight``.
+
+Endpoints file example (JSON or YAML):
+
+    - base_url: https://api.openai.com/v1
+      api_key: ${OPENAI_API_KEY}
+      model: gpt-4o-mini
+      rpm: 500
+      tpm: 200000
+    - name: locale
+      base_url: http://localhost:8000/v1
+      api_key: none
+      model: qwen2.5-14b-instruct
+      weight: 0.5
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+try:
+    import yaml  # PyYAML
+except ImportError:
+    yaml = None
+
+from . import config
+from .ratelimit import RateLimiter, TokenBucket
+from .resilience import CircuitBreaker, CircuitOpenError
+
+
+@dataclass(eq=False)
+class Endpoint:
+    """One base URL + key + model with its own limits and health state."""
+
+    base_url: str
+    api_key: str
+    model: str = config.OPENAI_MODEL
+    weight: float = 1.0
+    rpm: Optional[float] = None
+    tpm: Optional[float] = None
+    name: str = ""
+
+    in_flight: int = field(default=0, init=False)
+    requests: int = field(default=0, init=False)
+    failures: int = field(default=0, init=False)
+    total_latency: float = field(default=0.0, init=False)
+
+    def __post_init__(self):
+        self.base_url = self.base_url.rstrip("/")
+        self.name = self.name or f"{self.base_url} ({self.model})"
+        self.limiter = RateLimiter(self.rpm) if self.rpm else None
+        self.tokens = TokenBucket(self.tpm) if self.tpm else None
+        self.breaker = CircuitBreaker()
+
+    @property
+    def load(self) -> tuple[float, float]:
+        """Weighted in-flight requests, ties broken by weighted total requests."""
+        weight = max(self.weight, 1e-6)
+        return self.in_flight / weight, self.requests / weight
+
+    def is_available(self) -> bool:
+        return self.breaker.allows_request()
+
+
+class EndpointPool:
+    """Route each request to the least-loaded healthy endpoint."""
+
+    def __init__(self, endpoints: list[Endpoint]):
+        if not endpoints:
+            raise ValueError("Endpoint pool needs at least one endpoint")
+        self.endpoints = endpoints
+        # The pool is shared by the web jobs' event loops, each in its own thread
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: str) -> "EndpointPool":
+        """Load endpoints from a JSON or YAML list; ${VAR} values are read from the environment."""
+        file_path = Path(path)
+        raw = file_path.read_text(encoding="utf-8")
+        if file_path.suffix.lower() in (".yaml", ".yml"):
+            if yaml is None:
+                raise ImportError("PyYAML is required for YAML endpoint files. Install with: pip install PyYAML")
+            data = yaml.safe_load(raw)
+        else:
+            data = json.loads(raw)
+
+        if isinstance(data, dict):
+            data = data.get("endpoints", [])
+
+        endpoints = []
+        for i, entry in enumerate(data, start=1):
+            entry = {k: os.path.expandvars(v) if isinstance(v, str) else v for k, v in entry.items()}
+            if not entry.get("base_url") or not entry.get("api_key"):
+                raise ValueError(f"Endpoint {i} needs 'base_url' and 'api_key'")
+            endpoints.append(Endpoint(
+                base_url=entry["base_url"],
+                api_key=entry["api_key"],
+                model=entry.get("model", config.OPENAI_MODEL),
+                weight=float(entry.get("weight", 1.0)),
+                rpm=float(entry["rpm"]) if entry.get("rpm") else None,
+                tpm=float(entry["tpm"]) if entry.get("tpm") else None,
+                name=entry.get("name", ""),
+            ))
+        return cls(endpoints)
+
+    async def acquire(self, estimated_tokens: int = 0, avoid: Optional[Endpoint] = None) -> Endpoint:
+        """
+        Pick an endpoint, claim a slot on it and wait for its rate limits.
+
+        ``avoid`` is skipped while another endpoint is available (hedged
+        duplicates go elsewhere). Cancelled while waiting, the slot is given back.
+        Raises CircuitOpenError when every endpoint is cooling down or probing;
+        callers pause on the pool's PoolBreaker instead of waiting here.
+        """
+        while True:
+            candidates = [e for e in self.endpoints if e.is_available()]
+            if avoid is not None and len(candidates) > 1:
+                candidates = [e for e in candidates if e is not avoid]
+            if not candidates:
+                raise CircuitOpenError("Circuit breaker aperto su tutti gli endpoint: API non disponibile")
+
+            with self._lock:
+                endpoint = min(candidates, key=lambda e: e.load)
+                try:
+                    endpoint.breaker.check()
+                except CircuitOpenError:
+                    continue
+                endpoint.in_flight += 1
+            break
+
+        try:
+            if endpoint.limiter is not None:
+                await endpoint.limiter.acquire()
+            if endpoint.tokens is not None and estimated_tokens:
+                await endpoint.tokens.acquire(estimated_tokens)
+        except BaseException:
+            self.abandon(endpoint)
+            raise
+        return endpoint
+
+    def abandon(self, endpoint: Endpoint) -> None:
+        """Return a slot whose request was cancelled, without recording an outcome."""
+        with self._lock:
+            endpoint.in_flight -= 1
+        endpoint.breaker.abandon()
+
+    def release(self, endpoint: Endpoint, success: bool, latency: float = 0.0) -> None:
+        """Return the slot and record the outcome for health tracking."""
+        with self._lock:
+            endpoint.in_flight -= 1
+            endpoint.requests += 1
+            endpoint.total_latency += latency
+            if not success:
+                endpoint.failures += 1
+        endpoint.breaker.record(success)
+
+    def summary_lines(self) -> list[str]:
+        lines = []
+        for e in self.endpoints:
+            avg = e.total_latency / e.requests if e.requests else 0.0
+            lines.append(
+                f"Endpoint {e.name}: {e.requests} richieste, {e.failures} errori, "
+                f"latenza media {avg:.1f}s, stato {e.breaker.state}"
+            )
+        return lines
+
+
+class PoolBreaker:
+    """
+    The circuit breaker of a whole pool: open while no endpoint accepts a request.
+
+    Lets callers fail fast and pause on a total outage exactly as they do with a
+    single endpoint's CircuitBreaker. Outcomes are recorded per endpoint by
+    EndpointPool.release, so ``record`` and ``abandon`` have nothing to do.
+    """
+
+    def __init__(self, pool: EndpointPool):
+        self.pool = pool
+        self.fast_failures = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        return "closed" if self.allows_request() else "open"
+
+    @property
+    def opens(self) -> int:
+        return sum(e.breaker.opens for e in self.pool.endpoints)
+
+    def allows_request(self) -> bool:
+        return any(e.is_available() for e in self.pool.endpoints)
+
+    def check(self) -> None:
+        """Raise CircuitOpenError unless some endpoint would take a request now."""
+        if not self.allows_request():
+            with self._lock:
+                self.fast_failures += 1
+            raise CircuitOpenError("Circuit breaker aperto su tutti gli endpoint: API non disponibile")
+
+    def abandon(self) -> None:
+        pass
+
+    def record(self, success: bool) -> None:
+        pass
+
+    async def wait_ready(self) -> None:
+        """Pause the caller until the first endpoint allows a request."""
+        while not self.allows_request():
+            reopen = min(e.breaker.opened_at + e.breaker.cooldown for e in self.pool.endpoints)
+            await asyncio.sleep(max(0.5, reopen - time.monotonic()))
+
+    def summary_lines(self) -> list[str]:
+        paused = sum(not e.is_available() for e in self.pool.endpoints)
+        return [
+            f"Circuit breaker: {paused}/{len(self.pool.endpoints)} endpoint in pausa, "
+            f"aperture {self.opens}, chiamate rifiutate {self.fast_failures}"
+        ]
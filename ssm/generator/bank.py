@@ -0,0 +1,380 @@
+"""
+Question bank storage: locked group-commit appends and atomic compaction.
+
+The bank is the JSONL file served to the quiz (domande_unite_no_duplicati.jsonl).
+All writers go through an inter-process file lock on a ``.lock`` sidecar, so
+appends from several tabs, threads or processes never interleave. A crash
+mid-write can only leave a partial last line, which the next commit repairs
+before appending.
+
+Compaction rewrites the bank deduplicated into a temporary file, writes
+the sidecar index (``.idx.json``) with per-materia counts, and swaps both
+in with os.replace. Lines keep their order: the quiz and users' saved
+``wrong_ids`` identify a question by its line position, so only the later
+copies of a duplicate are removed and just the questions after them move.
+
+Usage:
+    python -m ssm.generator.bank compact
+    python -m ssm.generator.bank compact --bank percorso/domande.jsonl
+    python -m ssm.generator.bank audit --materia Pediatria --sample 0.2
+"""
+
+import argparse
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from . import codec, config
+from .pipeline import validate_question_structure
+
+
+def default_bank_path() -> Path:
+    """The bank file, falling back to domande_unite.jsonl like the web UI always did."""
+    path = Path(config.BANK_FILE)
+    if not path.exists():
+        fallback = path.with_name("domande_unite.jsonl")
+        if fallback.exists():
+            return fallback
+    return path
+
+
+def index_path_for(bank_path: Path) -> Path:
+    return bank_path.with_name(bank_path.name + ".idx.json")
+
+
+@contextmanager
+def bank_lock(bank_path: Path, timeout: float = config.BANK_LOCK_TIMEOUT_SECONDS):
+    """Exclusive inter-process lock on ``<bank>.lock``."""
+    lock_path = bank_path.with_name(bank_path.name + ".lock")
+    with open(lock_path, "a+b") as lock_file:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"Bank lock not acquired within {timeout}s: {lock_path}")
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def repair_tail(bank_path: Path, label: str = "BANCA") -> int:
+    """
+    Make sure the bank (or another JSONL file) ends with a complete line. Call with the lock held.
+
+    A trailing fragment that parses as JSON only gets its missing newline; an
+    unparsable one (a crash mid-write) is moved to ``<bank>.corrupt``.
+    Returns the number of bytes removed.
+    """
+    if not bank_path.exists():
+        return 0
+
+    with open(bank_path, "r+b") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return 0
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return 0
+
+        # Scan back for the last newline
+        pos = size
+        block = 64 * 1024
+        last_newline = -1
+        while pos > 0 and last_newline == -1:
+            start = max(0, pos - block)
+            f.seek(start)
+            chunk = f.read(pos - start)
+            idx = chunk.rfind(b"\n")
+            if idx != -1:
+                last_newline = start + idx
+            pos = start
+
+        tail_start = last_newline + 1
+        f.seek(tail_start)
+        tail = f.read()
+        try:
+            codec.loads(tail)
+        except ValueError:
+            with open(bank_path.with_name(bank_path.name + ".corrupt"), "ab") as corrupt:
+                corrupt.write(tail + b"\n")
+            f.truncate(tail_start)
+            print(f"  [{label}] Rimossa riga finale incompleta ({len(tail)} byte)")
+            return len(tail)
+
+        f.write(b"\n")
+        return 0
+
+
+def encode_question(question: dict) -> Optional[str]:
+    """Serialize a question as one JSONL line, or None if it is not a valid question."""
+    if not isinstance(question, dict) or not validate_question_structure(question):
+        return None
+    line = codec.dumps_line(question)
+    # JSON escapes newlines, so a line can never split a record
+    return line + "\n"
+
+
+@dataclass
+class AppendResult:
+    written: int
+    rejected: int
+
+
+@dataclass
+class _PendingWrite:
+    lines: list[str]
+    done: threading.Event = field(default_factory=threading.Event)
+    error: Optional[BaseException] = None
+
+
+class BankWriter:
+    """
+    Group-commit appender for the bank.
+
+    Callers pass questions, invalid ones are rejected, and the call blocks
+    until the valid ones are on disk. A background thread gathers everything queued within
+    ``commit_interval`` and writes it under one lock, in one write and one
+    fsync.
+    """
+
+    def __init__(self, bank_path: Optional[Path] = None, commit_interval: float = config.BANK_COMMIT_INTERVAL_SECONDS):
+        self.bank_path = Path(bank_path) if bank_path else default_bank_path()
+        self.commit_interval = commit_interval
+        self.commits = 0
+        self._queue: "queue.Queue[_PendingWrite]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def append(self, questions: list[dict], timeout: float = 30.0) -> AppendResult:
+        lines = []
+        rejected = 0
+        for question in questions:
+            line = encode_question(question)
+            if line is None:
+                rejected += 1
+            else:
+                lines.append(line)
+
+        if not lines:
+            return AppendResult(written=0, rejected=rejected)
+
+        pending = _PendingWrite(lines)
+        self._ensure_thread()
+        self._queue.put(pending)
+        if not pending.done.wait(timeout):
+            raise TimeoutError("Bank write not committed in time")
+        if pending.error is not None:
+            raise pending.error
+        return AppendResult(written=len(lines), rejected=rejected)
+
+    def _ensure_thread(self) -> None:
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="bank-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            time.sleep(self.commit_interval)
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self._commit([line for pending in batch for line in pending.lines])
+            except BaseException as e:
+                for pending in batch:
+                    pending.error = e
+            finally:
+                for pending in batch:
+                    pending.done.set()
+
+    def _commit(self, lines: list[str]) -> None:
+        data = "".join(lines).encode("utf-8")
+        with bank_lock(self.bank_path):
+            repair_tail(self.bank_path)
+            with open(self.bank_path, "ab") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+        self.commits += 1
+
+
+def question_key(question: dict) -> str:
+    """Dedup key: the question text, case- and whitespace-insensitive."""
+    return re.sub(r"\s+", " ", str(question.get("domanda", ""))).strip().lower()
+
+
+def _fsync_dir(path: Path) -> None:
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@dataclass
+class CompactionResult:
+    kept: int
+    duplicates: int
+    invalid: int
+    shifted: int = 0  # Questions whose line position (the quiz's question id) changed
+
+
+def compact_bank(bank_path: Optional[Path] = None) -> CompactionResult:
+    """Rewrite the bank deduplicated in its original order, together with its index, atomically."""
+    bank_path = Path(bank_path) if bank_path else default_bank_path()
+    index_path = index_path_for(bank_path)
+
+    with bank_lock(bank_path):
+        repair_tail(bank_path)
+
+        ordered = []
+        seen = set()
+        duplicates = 0
+        shifted = 0
+        invalid_lines = []
+        with open(bank_path, encoding="utf-8") as f:
+            for line in f:
+                # The quiz skips blank lines when numbering, so dropping them moves nothing
+                if not line.strip():
+                    continue
+                try:
+                    question = codec.loads(line)
+                except ValueError:
+                    question = None
+                if not isinstance(question, dict) or not question.get("domanda"):
+                    invalid_lines.append(line)
+                    continue
+                key = question_key(question)
+                if key in seen:
+                    duplicates += 1
+                    continue
+                seen.add(key)
+                if duplicates or invalid_lines:
+                    shifted += 1
+                ordered.append(question)
+
+        index = {"count": len(ordered), "materie": {}}
+        tmp_bank = bank_path.with_name(bank_path.name + ".tmp")
+        offset = 0
+        with open(tmp_bank, "wb") as f:
+            for question in ordered:
+                data = (codec.dumps_line(question) + "\n").encode("utf-8")
+                entry = index["materie"].setdefault(question.get("materia", ""), {"count": 0, "argomenti": {}})
+                entry["count"] += 1
+                argomento = question.get("argomenti", "")
+                entry["argomenti"][argomento] = entry["argomenti"].get(argomento, 0) + 1
+                f.write(data)
+                offset += len(data)
+            f.flush()
+            os.fsync(f.fileno())
+        index["size"] = offset
+
+        tmp_index = index_path.with_name(index_path.name + ".tmp")
+        with open(tmp_index, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # Keep dropped lines for inspection instead of losing them
+        if invalid_lines:
+            with open(bank_path.with_name(bank_path.name + ".corrupt"), "a", encoding="utf-8") as corrupt:
+                corrupt.writelines(invalid_lines)
+
+        os.replace(tmp_bank, bank_path)
+        os.replace(tmp_index, index_path)
+        _fsync_dir(bank_path.parent)
+
+    return CompactionResult(kept=len(ordered), duplicates=duplicates, invalid=len(invalid_lines), shifted=shifted)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gestione della banca domande SSM")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    compact = subparsers.add_parser("compact", help="Deduplica e riscrive la banca in modo atomico")
+    compact.add_argument("--bank", type=str, default=None, help="File JSONL della banca (default: config.BANK_FILE)")
+
+    audit = subparsers.add_parser("audit", help="Riverifica la banca esistente (riprende da dove si era interrotto)")
+    audit.add_argument("--bank", type=str, default=None, help="File JSONL della banca (default: config.BANK_FILE)")
+    audit.add_argument("--materia", "-m", action="append", default=None,
+                       help="Verifica solo questa materia (ripetibile)")
+    audit.add_argument("--sample", type=float, default=1.0, help="Frazione di domande da verificare (es. 0.1)")
+    audit.add_argument("--seed", type=str, default="audit", help="Seme del campionamento")
+    audit.add_argument("--limit", type=int, default=None, help="Numero massimo di domande selezionate")
+    audit.add_argument("--concurrency", type=int, default=config.MAX_CONCURRENCY,
+                       help=f"Blocchi verificati in parallelo (default: {config.MAX_CONCURRENCY})")
+    audit.add_argument("--restart", action="store_true", help="Ignora il report esistente e ricomincia")
+
+    args = parser.parse_args()
+
+    if args.command == "audit":
+        import asyncio
+        from .audit import run_audit
+        from .session import ApiSession
+
+        session = ApiSession.from_config()
+        if not session.has_credentials:
+            print("ERRORE: OPENAI_API_KEY non configurata.")
+            sys.exit(1)
+        asyncio.run(run_audit(
+            bank_path=Path(args.bank) if args.bank else None,
+            materie=args.materia,
+            sample=args.sample,
+            seed=args.seed,
+            limit=args.limit,
+            concurrency=args.concurrency,
+            restart=args.restart,
+            session=session,
+        ))
+
+    elif args.command == "compact":
+        bank_path = Path(args.bank) if args.bank else default_bank_path()
+        if not bank_path.exists():
+            print(f"ERRORE: banca non trovata: {bank_path}")
+            sys.exit(1)
+        result = compact_bank(bank_path)
+        print(f"Compattazione completata: {bank_path}")
+        print(f"  Domande mantenute: {result.kept}")
+        print(f"  Duplicati rimossi: {result.duplicates}")
+        print(f"  Righe non valide rimosse: {result.invalid}")
+        if result.shifted:
+            print(f"  ATTENZIONE: {result.shifted} domande cambiano posizione; "
+                  f"gli errori salvati dagli utenti (wrong_ids) per queste righe non corrispondono più")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+In-memory inverted index over the question bank.
+
+Backs the /api/questions endpoint: filters on materia, argomenti, has_image
+and free text (tokenized like the retrieval index, so Italian inflections
+match), with cursor pagination. The index follows the bank file: appended
+lines are read incrementally from the last indexed offset, while a rewrite
+(compaction, replaced file, truncation) triggers a full reload and bumps the
+generation, which invalidates outstanding cursors.
+"""
+
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from . import codec
+from .retrieval import tokenize
+
+
+@dataclass
+class QueryResult:
+    items: list[dict]
+    total: int
+    next_cursor: Optional[str]
+
+
+class CursorExpiredError(ValueError):
+    """The cursor was issued before the bank was rewritten."""
+
+
+class BankIndex:
+    """Records of the bank plus posting lists per materia, argomento, has_image and word."""
+
+    def __init__(self, bank_path: Path):
+        self.bank_path = Path(bank_path)
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._reset()
+        self._identity = None
+        self._mtime_ns = 0
+
+    def _reset(self) -> None:
+        self.records: list[dict] = []
+        self.by_materia: dict[str, list[int]] = {}
+        self.by_argomento: dict[str, list[int]] = {}
+        self.with_image: list[int] = []
+        self.by_term: dict[str, list[int]] = {}
+        self.offset = 0
+
+    @property
+    def etag(self) -> str:
+        return f"{self.generation}-{self.offset}-{self._mtime_ns}"
+
+    @property
+    def last_modified(self) -> float:
+        return self._mtime_ns / 1e9
+
+    def refresh(self) -> None:
+        """Bring the index up to date with the bank file."""
+        with self._lock:
+            try:
+                stat = os.stat(self.bank_path)
+            except FileNotFoundError:
+                if self.records:
+                    self._reset()
+                    self.generation += 1
+                self._identity = None
+                return
+
+            identity = (stat.st_dev, stat.st_ino)
+            if identity == self._identity and stat.st_mtime_ns == self._mtime_ns and stat.st_size == self.offset:
+                return
+
+            # Same file grown in place: only read the new tail
+            if identity != self._identity or stat.st_size < self.offset:
+                self._reset()
+                self.generation += 1
+
+            self._read_from(self.offset)
+            self._identity = identity
+            self._mtime_ns = stat.st_mtime_ns
+
+    def _read_from(self, offset: int) -> None:
+        with open(self.bank_path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+
+        # Leave a trailing partial line for the next refresh
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            question = codec.decode_question(line)
+            if question is not None:
+                self._add(question)
+        self.offset = offset + end
+
+    def _add(self, question: dict) -> None:
+        record_id = len(self.records)
+        self.records.append(question)
+
+        self.by_materia.setdefault(str(question.get("materia", "")), []).append(record_id)
+        self.by_argomento.setdefault(str(question.get("argomenti", "")), []).append(record_id)
+        if question.get("has_image"):
+            self.with_image.append(record_id)
+
+        text = " ".join([
+            question["domanda"],
+            question.get("argomenti", ""),
+            " ".join(answer["text"] for answer in question["risposte"]),
+        ])
+        for term in set(tokenize(text)):
+            self.by_term.setdefault(term, []).append(record_id)
+
+    def query(
+        self,
+        materia: Optional[str] = None,
+        argomenti: Optional[str] = None,
+        has_image: Optional[bool] = None,
+        text: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = 50,
+        fields: Optional[list[str]] = None,
+    ) -> QueryResult:
+        """Filter, paginate and project the bank. Filters combine with AND."""
+        start = 0
+        if cursor:
+            try:
+                generation, start = (int(part) for part in cursor.split(":", 1))
+            except ValueError:
+                raise ValueError(f"Invalid cursor: {cursor}")
+            if generation != self.generation:
+                raise CursorExpiredError("Cursor expired: the bank was rewritten")
+
+        with self._lock:
+            postings = []
+            if materia is not None:
+                postings.append(self.by_materia.get(materia, []))
+            if argomenti is not None:
+                postings.append(self.by_argomento.get(argomenti, []))
+            if has_image is True:
+                postings.append(self.with_image)
+            if text:
+                terms = set(tokenize(text))
+                # Only stopwords or punctuation: nothing can match, rather than everything
+                postings.extend([self.by_term.get(term, []) for term in terms] or [[]])
+
+            if postings:
+                # Intersect starting from the shortest list
+                postings.sort(key=len)
+                matched = set(postings[0])
+                for posting in postings[1:]:
+                    matched.intersection_update(posting)
+                if has_image is False:
+                    matched.difference_update(self.with_image)
+                ids = sorted(matched)
+            elif has_image is False:
+                excluded = set(self.with_image)
+                ids = [i for i in range(len(self.records)) if i not in excluded]
+            else:
+                ids = range(len(self.records))
+
+            total = len(ids)
+            remaining = [i for i in ids if i >= start] if start else list(ids)
+            page = remaining[:limit]
+
+            items = []
+            for record_id in page:
+                record = self.records[record_id]
+                if fields:
+                    record = {k: record[k] for k in fields if k in record}
+                items.append({"id": record_id, **record})
+
+        next_cursor = None
+        if len(remaining) > limit:
+            next_cursor = f"{self.generation}:{page[-1] + 1}"
+        return QueryResult(items=items, total=total, next_cursor=next_cursor)
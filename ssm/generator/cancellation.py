@@ -0,0 +1,101 @@
+"""
+Cooperative cancellation and deadlines for generation jobs.
+
+A CancelToken travels with the ApiSession. Schedulers check it before
+issuing work and wrap their waits (rate limiter, circuit breaker, in-flight
+API calls, retry sleeps) in ``token.guard()``, which abandons the wait as
+soon as the token is cancelled or its deadline passes and raises
+JobCancelledError instead. Work already accepted is left to the caller to
+save, so a cancelled job still flushes its results.
+
+``cancel()`` may be called from any thread (a web request, a signal
+handler); it wakes the guarded waits on their own event loops.
+"""
+
+import asyncio
+import threading
+import time
+from typing import Awaitable, Optional, TypeVar
+
+T = TypeVar("T")
+
+DEADLINE_REASON = "tempo massimo scaduto"
+
+
+class JobCancelledError(Exception):
+    """Raised in place of new work once a job has been cancelled or has run out of time."""
+
+
+def _wake(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class CancelToken:
+    """Cancel signal plus an optional deadline, shared by everything one job runs."""
+
+    def __init__(self, deadline_seconds: Optional[float] = None):
+        self.deadline = time.monotonic() + deadline_seconds if deadline_seconds else None
+        self._event = threading.Event()
+        self._reason: Optional[str] = None
+        self._waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def cancel(self, reason: str = "annullato") -> None:
+        if self._event.is_set():
+            return
+        self._reason = reason
+        self._event.set()
+        # No lock: this may run inside a signal handler on the thread that owns the list
+        for loop, waiter in list(self._waiters):
+            try:
+                loop.call_soon_threadsafe(_wake, waiter)
+            except RuntimeError:  # Loop already closed
+                pass
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set() or (self.deadline is not None and time.monotonic() >= self.deadline)
+
+    @property
+    def reason(self) -> Optional[str]:
+        if self._event.is_set():
+            return self._reason
+        return DEADLINE_REASON if self.cancelled else None
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline, or None without one."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self) -> None:
+        """Raise JobCancelledError if the job must stop."""
+        if self.cancelled:
+            raise JobCancelledError(self.reason)
+
+    async def guard(self, awaitable: Awaitable[T]) -> T:
+        """Await ``awaitable``, abandoning it (and raising) on cancel or deadline."""
+        task = asyncio.ensure_future(awaitable)
+        if self.cancelled:
+            task.cancel()
+            self.check()
+
+        entry = (asyncio.get_running_loop(), asyncio.get_running_loop().create_future())
+        self._waiters.append(entry)
+        try:
+            done, _ = await asyncio.wait(
+                {task, entry[1]}, timeout=self.remaining(), return_when=asyncio.FIRST_COMPLETED
+            )
+            # A result that arrived together with the cancel is still kept
+            if task in done:
+                return task.result()
+            task.cancel()
+            await asyncio.wait({task})
+            raise JobCancelledError(self.reason or DEADLINE_REASON)
+        finally:
+            self._waiters.remove(entry)
+            if not task.done():
+                task.cancel()
+
+    async def sleep(self, seconds: float) -> None:
+        await self.guard(asyncio.sleep(seconds))
@@ -0,0 +1,165 @@
+"""
+Clean extracted page text before it is chunked and sent as context.
+
+Textbook PDFs repeat the running header, footer and page number on every
+page, split words across lines with hyphens and carry service pages (table
+of contents, bibliography, copyright). All of it costs prompt tokens in
+every batch without giving the model anything to ask about. clean_pages()
+removes:
+
+- lines repeated at the top or bottom of many pages (digits ignored, so
+  "Capitolo 3 - pag. 41" matches "Capitolo 3 - pag. 42");
+- bare page numbers at the top or bottom of a page;
+- table-of-contents lines with dot leaders, citation lines, bibliography
+  headings and copyright notices, and whole pages made mostly of them;
+- hyphenated line breaks, runs of blank space and empty lines.
+
+Page numbers are kept, so chunks and figures still map to their pages.
+"""
+
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Optional
+
+from . import config
+
+_DIGITS_RE = re.compile(r"\d+")
+_SPACES_RE = re.compile(r"[ \t\u00a0]+")
+_PAGE_NUMBER_RE = re.compile(
+    r"^[-–—\s]*(?:pag(?:ina)?\.?|page|p\.)?\s*\d{1,4}(?:\s*(?:di|of|/)\s*\d{1,4})?[-–—\s]*$", re.IGNORECASE
+)
+_TOC_LINE_RE = re.compile(r"(?:\.\s*){4,}\d{1,4}\s*$|…+\s*\d{1,4}\s*$")
+_INDEX_HEADING_RE = re.compile(r"^(?:indice|sommario)\s*$", re.IGNORECASE)
+# A reference entry starts with its number or with "Surname AB"; citations in running text do not
+_REFERENCE_START_RE = re.compile(r"^(?:\[\d+\]|\d+\.\s|[A-ZÀ-Ý][\w'’-]+,?\s+[A-Z]{1,3}\b)")
+_CITATION_RE = re.compile(r"\bet al\b|\b(?:19|20)\d{2}\s*;\s*\d+|\bdoi:?\s*10\.\d{4,}|\bPMID\b", re.IGNORECASE)
+_REFERENCES_HEADING_RE = re.compile(
+    r"^(?:bibliografia|riferimenti bibliografici|references|letture consigliate)\s*$", re.IGNORECASE
+)
+_COPYRIGHT_RE = re.compile(r"©|\bcopyright\b|tutti i diritti riservati|\bISBN\b", re.IGNORECASE)
+_HYPHENATION_RE = re.compile(r"(\w)-\n[ \t]*([a-zà-ÿ])")
+
+# Removal reasons, as reported in summaries
+HEADER_FOOTER = "intestazioni e piè di pagina"
+PAGE_NUMBER = "numeri di pagina"
+INDEX = "indice"
+REFERENCES = "bibliografia"
+COPYRIGHT = "copyright"
+
+
+@dataclass
+class CleaningStats:
+    """What cleaning removed from one document, and the context tokens it saved."""
+
+    removed_lines: dict[str, int] = field(default_factory=dict)
+    pages_dropped: int = 0
+    tokens_before: int = 0
+    tokens_after: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+    @property
+    def saved_ratio(self) -> float:
+        return self.tokens_saved / self.tokens_before if self.tokens_before else 0.0
+
+    def summary(self) -> str:
+        removed = ", ".join(f"{reason} {n}" for reason, n in sorted(self.removed_lines.items(), key=lambda r: -r[1]))
+        line = f"Pulizia testo: risparmiati {self.tokens_saved} token ({self.saved_ratio:.0%})"
+        if self.pages_dropped:
+            line += f", {self.pages_dropped} pagine di servizio rimosse"
+        return line + (f" [righe: {removed}]" if removed else "")
+
+
+def _line_key(line: str) -> str:
+    return _SPACES_RE.sub(" ", _DIGITS_RE.sub("#", line.strip().lower()))
+
+
+def _edge_indexes(lines: list[str]) -> set[int]:
+    """
+    Indexes of the first and last CLEANING_EDGE_LINES non-empty lines of a page.
+
+    Short pages get fewer (a third of their lines at each end at most), so a
+    page whose only text repeats on every page is not taken for a header.
+    """
+    filled = [i for i, line in enumerate(lines) if line.strip()]
+    n = min(config.CLEANING_EDGE_LINES, len(filled) // 3)
+    return set(filled[:n]) | set(filled[-n:]) if n else set()
+
+
+def _boilerplate_reason(line: str) -> Optional[str]:
+    stripped = line.strip()
+    if _TOC_LINE_RE.search(stripped) or _INDEX_HEADING_RE.match(stripped):
+        return INDEX
+    if _REFERENCES_HEADING_RE.match(stripped):
+        return REFERENCES
+    if _CITATION_RE.search(stripped) and _REFERENCE_START_RE.match(stripped):
+        return REFERENCES
+    if _COPYRIGHT_RE.search(stripped):
+        return COPYRIGHT
+    return None
+
+
+def _repeated_edge_lines(pages_lines: list[list[str]]) -> set[str]:
+    """Line keys found at the top or bottom of at least CLEANING_REPEAT_RATIO of the pages."""
+    if len(pages_lines) < config.CLEANING_MIN_PAGES:
+        return set()
+    counts = Counter()
+    for lines in pages_lines:
+        counts.update({_line_key(lines[i]) for i in _edge_indexes(lines)})
+    threshold = max(2, config.CLEANING_REPEAT_RATIO * len(pages_lines))
+    return {key for key, n in counts.items() if key and n >= threshold}
+
+
+def normalize_text(text: str) -> str:
+    """Join hyphenated line breaks and collapse blank space."""
+    text = _HYPHENATION_RE.sub(r"\1\2", text)
+    lines = [_SPACES_RE.sub(" ", line).strip() for line in text.split("\n")]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+def clean_pages(pages: list[tuple[int, str]]) -> tuple[list[tuple[int, str]], CleaningStats]:
+    """Cleaned (page number, text) pairs, without pages left empty, plus what was removed."""
+    stats = CleaningStats()
+    removed = Counter()
+    pages_lines = [text.split("\n") for _, text in pages]
+    repeated = _repeated_edge_lines(pages_lines)
+
+    cleaned = []
+    for (page_num, _), lines in zip(pages, pages_lines):
+        edges = _edge_indexes(lines)
+        kept = []
+        page_removed = Counter()
+        filled = 0
+        for i, line in enumerate(lines):
+            if not line.strip():
+                kept.append(line)
+                continue
+            filled += 1
+            if i in edges and _line_key(line) in repeated:
+                reason = HEADER_FOOTER
+            elif i in edges and _PAGE_NUMBER_RE.match(line):
+                reason = PAGE_NUMBER
+            else:
+                reason = _boilerplate_reason(line)
+            if reason is None:
+                kept.append(line)
+            else:
+                page_removed[reason] += 1
+
+        removed.update(page_removed)
+        boilerplate = sum(page_removed[r] for r in (INDEX, REFERENCES, COPYRIGHT))
+        body = filled - page_removed[HEADER_FOOTER] - page_removed[PAGE_NUMBER]
+        # Index and bibliography pages are mostly, not only, matching lines
+        if body and boilerplate / body >= config.CLEANING_BOILERPLATE_PAGE_RATIO:
+            stats.pages_dropped += 1
+            continue
+
+        text = normalize_text("\n".join(kept))
+        if text:
+            cleaned.append((page_num, text))
+
+    stats.removed_lines = dict(removed)
+    return cleaned, stats
@@ -0,0 +1,213 @@
+"""
+JSON codec for the hot paths: bank loads, API responses, JSONL writes and prompts.
+
+Each operation uses the fastest installed backend among msgspec, orjson and
+the stdlib (``python -m ssm.generator.codec_bench`` compares them), and every
+encoder produces the stdlib's exact bytes:
+
+- ``dumps_line``: ``json.dumps(obj, ensure_ascii=False)``, one line with
+  ", " and ": " separators, as the bank has always been written;
+- ``dumps_pretty``: ``json.dumps(obj, ensure_ascii=False, indent=2)``, as
+  questions are shown to the verifier.
+
+The only differences are in floats: values the stdlib writes with an
+exponent (below 1e-4 or from 1e16 up) and NaN/Infinity, which the stdlib
+writes as non-standard tokens and the fast backends as null. Question
+records have no floats.
+
+Question and Answer are typed msgspec structs of the question schema;
+``is_question`` and ``decode_question`` validate records against them
+(converting a decoded dict is faster than a typed decode followed by the
+plain one that keeps extra fields). Without msgspec the same rules are
+checked in Python.
+"""
+
+import json
+import re
+from typing import Annotated, Any, Optional, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+ANSWERS_PER_QUESTION = 5
+QUESTION_TEXT_FIELDS = ("materia", "domanda", "risposta_corretta_text", "commento")
+
+
+# --- Decoding -------------------------------------------------------------
+
+def _stdlib_loads(data: Union[str, bytes]) -> Any:
+    return json.loads(data)
+
+
+DECODERS = {"json": _stdlib_loads}
+
+if msgspec is not None:
+    _msgspec_decoder = msgspec.json.Decoder()
+
+    def _msgspec_loads(data: Union[str, bytes]) -> Any:
+        try:
+            return _msgspec_decoder.decode(data)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e)) from None
+
+    DECODERS["msgspec"] = _msgspec_loads
+
+if orjson is not None:
+    DECODERS["orjson"] = orjson.loads
+
+
+# --- Encoding -------------------------------------------------------------
+
+def _stdlib_dumps_line(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False)
+
+
+def _stdlib_dumps_pretty(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, indent=2)
+
+
+LINE_ENCODERS = {"json": _stdlib_dumps_line}
+PRETTY_ENCODERS = {"json": _stdlib_dumps_pretty}
+
+if orjson is not None:
+    # Raw newlines only occur between tokens of indented output, never inside strings
+    _INDENT_RE = re.compile(rb"\n *")
+
+    def _orjson_dumps_pretty(obj: Any) -> str:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode("utf-8")
+        except TypeError:  # Non-string keys, integers above 64 bits, lone surrogates
+            return _stdlib_dumps_pretty(obj)
+
+    def _orjson_dumps_line(obj: Any) -> str:
+        try:
+            data = orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+        except TypeError:
+            return _stdlib_dumps_line(obj)
+        return _INDENT_RE.sub(b"", data.replace(b",\n", b", \n")).decode("utf-8")
+
+    LINE_ENCODERS["orjson"] = _orjson_dumps_line
+    PRETTY_ENCODERS["orjson"] = _orjson_dumps_pretty
+
+if msgspec is not None:
+    _msgspec_encoder = msgspec.json.Encoder()
+
+    def _msgspec_dumps_line(obj: Any) -> str:
+        try:
+            # indent=0 is the stdlib's default single-line spacing
+            return msgspec.json.format(_msgspec_encoder.encode(obj), indent=0).decode("utf-8")
+        except (TypeError, UnicodeEncodeError, msgspec.EncodeError):  # As for orjson
+            return _stdlib_dumps_line(obj)
+
+    def _msgspec_dumps_pretty(obj: Any) -> str:
+        try:
+            return msgspec.json.format(_msgspec_encoder.encode(obj), indent=2).decode("utf-8")
+        except (TypeError, UnicodeEncodeError, msgspec.EncodeError):
+            return _stdlib_dumps_pretty(obj)
+
+    LINE_ENCODERS["msgspec"] = _msgspec_dumps_line
+    PRETTY_ENCODERS["msgspec"] = _msgspec_dumps_pretty
+
+
+def _best(backends: dict, order: tuple[str, ...]) -> str:
+    return next(name for name in order if name in backends)
+
+
+# orjson decodes str input with many accented characters slower than msgspec
+DECODER = _best(DECODERS, ("msgspec", "orjson", "json"))
+ENCODER = _best(LINE_ENCODERS, ("msgspec", "orjson", "json"))
+PRETTY_ENCODER = _best(PRETTY_ENCODERS, ("orjson", "msgspec", "json"))
+
+_loads = DECODERS[DECODER]
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """Decode JSON text; raises ValueError on invalid input, like json.loads."""
+    try:
+        return _loads(data)
+    except ValueError:
+        # NaN, integers above 64 bits and the like: accept exactly what the stdlib accepts
+        if DECODER == "json":
+            raise
+        return json.loads(data)
+
+
+dumps_line = LINE_ENCODERS[ENCODER]
+dumps_pretty = PRETTY_ENCODERS[PRETTY_ENCODER]
+
+
+# --- Question schema ------------------------------------------------------
+
+if msgspec is not None:
+
+    class Answer(msgspec.Struct):
+        text: str
+        isCorrect: bool = False
+        id: Union[int, str, None] = None
+
+    class Question(msgspec.Struct):
+        materia: str
+        domanda: str
+        risposte: Annotated[
+            list[Answer], msgspec.Meta(min_length=ANSWERS_PER_QUESTION, max_length=ANSWERS_PER_QUESTION)
+        ]
+        risposta_corretta_text: str
+        commento: str
+        argomenti: str = ""
+        has_image: bool = False
+        image_src: Optional[str] = None
+else:
+    Answer = Question = None
+
+
+def _is_question_builtin(obj: Any) -> bool:
+    """The Question struct's rules, for when msgspec is not installed."""
+    if not isinstance(obj, dict):
+        return False
+    if any(not isinstance(obj.get(name), str) for name in QUESTION_TEXT_FIELDS):
+        return False
+    if not isinstance(obj.get("argomenti", ""), str) or not isinstance(obj.get("has_image", False), bool):
+        return False
+    if not isinstance(obj.get("image_src"), (str, type(None))):
+        return False
+
+    risposte = obj.get("risposte")
+    if not isinstance(risposte, list) or len(risposte) != ANSWERS_PER_QUESTION:
+        return False
+    for answer in risposte:
+        if not isinstance(answer, dict) or not isinstance(answer.get("text"), str):
+            return False
+        if not isinstance(answer.get("isCorrect", False), bool):
+            return False
+        answer_id = answer.get("id")
+        if isinstance(answer_id, bool) or not isinstance(answer_id, (int, str, type(None))):
+            return False
+    return sum(1 for answer in risposte if answer.get("isCorrect", False)) == 1
+
+
+def is_question(obj: Any) -> bool:
+    """True if ``obj`` matches the question schema with exactly one correct answer."""
+    if Question is None:
+        return _is_question_builtin(obj)
+    try:
+        question = msgspec.convert(obj, Question)
+    except msgspec.ValidationError:
+        return False
+    return sum(1 for answer in question.risposte if answer.isCorrect) == 1
+
+
+def decode_question(data: Union[str, bytes]) -> Optional[dict]:
+    """Decode one JSONL record, or None if it is not valid JSON or not a valid question."""
+    try:
+        question = loads(data)
+    except ValueError:
+        return None
+    # The dict keeps extra fields and key order, so rewrites stay byte-identical
+    return question if is_question(question) else None
@@ -0,0 +1,135 @@
+"""
+Micro-benchmarks for the JSON codec backends.
+
+Times every installed backend (json, orjson, msgspec) on the operations the
+generator repeats per question: decoding bank lines, decoding with schema
+validation, writing JSONL lines and pretty-printing for the verifier. Each
+encoder's output is compared byte for byte with the stdlib's first, so a
+backend that would change the bank is reported instead of timed.
+
+Usage:
+    python -m ssm.generator.codec_bench
+    python -m ssm.generator.codec_bench --bank domande_unite_no_duplicati.jsonl --repeat 5
+"""
+
+import argparse
+import json
+import random
+import time
+from pathlib import Path
+from typing import Callable
+
+from . import codec
+
+
+def synthetic_questions(n: int, seed: int = 0) -> list[dict]:
+    """Bank-like questions: accented Italian text, five answers, a long comment."""
+    rng = random.Random(seed)
+    words = (
+        "il", "paziente", "con", "terapia", "di", "prima", "scelta", "diagnosi", "la", "sindrome", "del",
+        "quadro", "clinico", "in", "caso", "cellule", "una", "per", "dolore", "acuto", "è", "più", "età",
+    )
+
+    def text(n_words: int) -> str:
+        return " ".join(rng.choice(words) for _ in range(n_words))
+
+    questions = []
+    for i in range(n):
+        correct = rng.randrange(codec.ANSWERS_PER_QUESTION)
+        risposte = [
+            {"id": j + 1, "text": text(rng.randint(2, 10)), "isCorrect": j == correct}
+            for j in range(codec.ANSWERS_PER_QUESTION)
+        ]
+        questions.append({
+            "materia": rng.choice(("Cardiologia e Chirurgia Cardiovascolare", "Pediatria", "Ginecologia")),
+            "argomenti": text(3),
+            "domanda": f"{text(rng.randint(15, 60))}?",
+            "has_image": False,
+            "image_src": None,
+            "risposte": risposte,
+            "risposta_corretta_text": risposte[correct]["text"],
+            "commento": text(rng.randint(40, 150)),
+        })
+    return questions
+
+
+def load_bank_lines(path: Path, limit: int) -> list[str]:
+    with open(path, encoding="utf-8") as f:
+        lines = [line.rstrip("\n") for line in f if line.strip()]
+    return lines[:limit] if limit else lines
+
+
+def _time(fn: Callable, items: list, repeat: int) -> float:
+    """Best microseconds per item over ``repeat`` passes."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, time.perf_counter() - started)
+    return best / len(items) * 1e6
+
+
+def _decode_question_builtin(line: str):
+    try:
+        question = codec.DECODERS["json"](line)
+    except ValueError:
+        return None
+    return question if codec._is_question_builtin(question) else None
+
+
+def run(lines: list[str], repeat: int) -> list[tuple[str, str, float]]:
+    """(operation, backend, µs per question) rows; mismatching encoders get NaN."""
+    objects = [json.loads(line) for line in lines]
+    rows = []
+    for name, decoder in codec.DECODERS.items():
+        rows.append(("loads", name, _time(decoder, lines, repeat)))
+
+    rows.append(("decode_question", "json", _time(_decode_question_builtin, lines, repeat)))
+    if codec.Question is not None:
+        rows.append(("decode_question", "msgspec", _time(codec.decode_question, lines, repeat)))
+
+    for operation, encoders, reference in (
+        ("dumps_line", codec.LINE_ENCODERS, codec.LINE_ENCODERS["json"]),
+        ("dumps_pretty", codec.PRETTY_ENCODERS, codec.PRETTY_ENCODERS["json"]),
+    ):
+        for name, encoder in encoders.items():
+            if any(encoder(obj) != reference(obj) for obj in objects):
+                rows.append((operation, name, float("nan")))
+                continue
+            rows.append((operation, name, _time(encoder, objects, repeat)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dei backend JSON (json, orjson, msgspec)")
+    parser.add_argument("--bank", type=str, default=None, help="File JSONL da usare invece di domande sintetiche")
+    parser.add_argument("--questions", type=int, default=2000, help="Domande da usare (default: 2000)")
+    parser.add_argument("--repeat", type=int, default=5, help="Ripetizioni, vale la migliore (default: 5)")
+    args = parser.parse_args()
+
+    if args.bank:
+        lines = load_bank_lines(Path(args.bank), args.questions)
+    else:
+        lines = [json.dumps(q, ensure_ascii=False) for q in synthetic_questions(args.questions)]
+    if not lines:
+        print("ERRORE: nessuna domanda da misurare")
+        return
+
+    print(
+        f"{len(lines)} domande, backend in uso: decodifica {codec.DECODER}, "
+        f"riga JSONL {codec.ENCODER}, indentato {codec.PRETTY_ENCODER}"
+    )
+    baseline = {}
+    for operation, name, micros in run(lines, args.repeat):
+        if micros != micros:
+            print(f"  {operation:<16} {name:<8} ATTENZIONE: output diverso da json, non utilizzabile")
+            continue
+        baseline.setdefault(operation, micros if name == "json" else None)
+        reference = baseline[operation]
+        speedup = f"  x{reference / micros:.1f}" if reference and name != "json" else ""
+        print(f"  {operation:<16} {name:<8} {micros:8.1f} µs/domanda{speedup}")
+
+
+if __name__ == "__main__":
+    main()
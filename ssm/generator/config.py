@@ -1,6 +1,8 @@
 """Configuration for the SSM question generator pipeline."""
 
 import os
+from pathlib import Path
+
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -9,19 +11,152 @@ load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = "gpt-4o-mini"
 OPENAI_BASE_URL = "https://api.openai.com/v1"
+# Optional JSON/YAML list of endpoints (base_url, api_key, model, weight, rpm, tpm)
+# to spread requests over several keys or servers
+OPENAI_ENDPOINTS_FILE = os.getenv("OPENAI_ENDPOINTS_FILE")
+
+# Pricing in USD per million tokens, used for cost estimates in run summaries
+PRICE_INPUT_PER_MTOK = 0.15
+PRICE_CACHED_INPUT_PER_MTOK = 0.075
+PRICE_OUTPUT_PER_MTOK = 0.60
 
 # Generation settings
 DEFAULT_BATCH_SIZE = 5  # Questions per API call
 DEFAULT_COUNT = 10  # Default number of questions to generate
 MAX_CONCURRENCY = 3  # Max concurrent API requests
 
+# Target-count guarantee
+DEFAULT_ACCEPTANCE_RATE = 0.85  # Prior for materie without history
+MIN_ACCEPTANCE_RATE = 0.3
+MAX_OVERGENERATION_FACTOR = 2.0  # Never generate more than this multiple of the shortfall
+MAX_TOPUP_ROUNDS = 2  # Extra rounds when the first one falls short
+
 # Rate limiting
 RATE_LIMIT_REQUESTS_PER_MINUTE = 60
-RATE_LIMIT_DELAY_SECONDS = 1.0  # Delay between batches
+
+# Token budgets
+MODEL_CONTEXT_TOKENS = 128000  # Context window of the model
+MAX_INPUT_TOKENS = 12000  # Prompt budget per request
+MAX_OUTPUT_TOKENS = 8192  # Completion budget per request
+OUTPUT_TOKENS_PER_QUESTION = 450  # Typical generated question with comment
+VERIFICATION_TOKENS_PER_QUESTION = 120  # Typical verdict
+VERIFICATION_CHUNK_QUESTIONS = 20  # Questions per verification call; larger rounds are split
+OUTPUT_TOKENS_MARGIN = 1.25  # Headroom over the typical output size
+HEURISTIC_CHARS_PER_TOKEN = 3.5  # Used when tiktoken is not installed
 
 # Retry settings
 MAX_RETRIES = 3
 RETRY_DELAY_SECONDS = 2.0
 
+# Context settings
+CONTEXT_MAX_TOKENS = 2300  # Max tokens of source text sent per generation prompt
+RETRIEVAL_TOP_K = 12  # Ranked chunks that batches rotate through when an argomento is given
+
+# Local pre-verification rules
+MIN_STEM_CHARS = 20
+MAX_STEM_CHARS = 1500
+MAX_ANSWER_CHARS = 300
+MIN_COMMENT_CHARS = 40
+MAX_COMMENT_CHARS = 3000
+MIN_LEAK_CHECK_CHARS = 12  # Shorter correct answers are not checked for leaking into the stem
+
+# Request hedging (duplicate slow requests, keep the first response)
+HEDGE_ENABLED = False
+HEDGE_MIN_SAMPLES = 20  # Latencies needed before the p95 is trusted
+HEDGE_DEFAULT_DELAY_SECONDS = 20.0  # Hedge delay until then
+HEDGE_MIN_DELAY_SECONDS = 2.0
+
+# Circuit breaker
+CIRCUIT_BREAKER_ENABLED = True
+CIRCUIT_FAILURE_RATE = 0.5  # Open when this share of recent calls failed
+CIRCUIT_WINDOW = 20  # Recent calls considered
+CIRCUIT_MIN_CALLS = 5
+CIRCUIT_COOLDOWN_SECONDS = 30.0  # Pause before probing for recovery
+
+# Job cancellation
+JOB_DEADLINE_SECONDS = 900.0  # Overall time limit of a web generation job (0 = none)
+
 # Output settings
 DEFAULT_OUTPUT_FILE = "domande_generate.jsonl"
+
+# Question bank served to the quiz
+BANK_FILE = Path(os.getenv("SSM_BANK_FILE", Path(__file__).parent.parent / "domande_unite_no_duplicati.jsonl"))
+BANK_LOCK_TIMEOUT_SECONDS = 10.0
+BANK_COMMIT_INTERVAL_SECONDS = 0.02  # How long the writer waits to group concurrent appends
+
+# SSM 2024 questions per materia out of 140 (same table as README.md and index.html);
+# the last three are not in the official exam but complete the simulation
+SSM_DISTRIBUTION = {
+    "Cardiologia e Chirurgia Cardiovascolare": 14,
+    "Chirurgia Generale": 10,
+    "Ginecologia": 9,
+    "Anestesia": 9,
+    "Neurologia e Neurochirurgia": 7,
+    "Pediatria": 7,
+    "Ortopedia": 7,
+    "Pneumologia e Chirurgia Toracica": 6,
+    "Dermatologia": 6,
+    "Gastroenterologia": 5,
+    "Endocrinologia e Nutrizione": 5,
+    "Malattie Infettive e Microbiologia": 5,
+    "Radiologia": 5,
+    "Statistica, Epidemiologia e Sanità Pubblica": 5,
+    "Reumatologia": 5,
+    "Urologia": 5,
+    "Otorinolaringoiatria": 5,
+    "Ematologia": 4,
+    "Oncologia": 3,
+    "Nefrologia": 3,
+    "Psichiatria": 3,
+    "Oftalmologia": 2,
+    "Medicina del Lavoro": 2,
+    "Medicina legale": 2,
+    "Immunologia": 2,
+    "Genetica": 2,
+    "Scienze di base": 2,
+}
+
+# Figures extracted from PDFs
+IMAGE_EXTRACTION_ENABLED = True
+IMAGE_DIR = Path(os.getenv("SSM_IMAGE_DIR", Path(__file__).parent.parent / "img"))  # Next to the quiz page
+IMAGE_FORMAT = "webp"  # webp or avif (AVIF needs a Pillow build with AVIF support)
+IMAGE_QUALITY = 80
+IMAGE_MAX_DIMENSION = 1280  # Longest side after downscaling
+IMAGE_MIN_DIMENSION = 120  # Smaller images (logos, icons) are skipped
+IMAGES_PER_BATCH = 0  # Figures attached to a generation prompt (0 = never); each adds IMAGE_INPUT_TOKENS
+IMAGE_INPUT_TOKENS = 2900  # Prompt tokens reserved per attached low-detail image
+
+# Cross-batch diversity
+DIVERSITY_ENABLED = True
+DIVERSITY_MAX_EXCLUSIONS = 30  # Keyphrases sent per generation prompt
+DIVERSITY_ANSWER_CHARS = 50  # Correct-answer characters kept in a keyphrase
+DIVERSITY_STEM_WORDS = 4  # Salient stem words kept in a keyphrase
+DIVERSITY_DUPLICATE_SIMILARITY = 0.7  # Stem token overlap (Jaccard) treated as a duplicate
+
+# Coverage planner
+COVERAGE_ENTRY_SIZE = 10  # Questions per planned materia/argomento entry
+
+# Bank audit
+AUDIT_CHUNK_QUESTIONS = 10  # Questions per verification call
+AUDIT_CHUNK_MAX_TOKENS = 8000  # Max question tokens per verification call
+
+# Extraction cache
+CACHE_DIR = Path(os.getenv("SSM_CACHE_DIR", Path.home() / ".cache" / "ssm_generator"))
+EXTRACTION_CACHE_ENABLED = True
+EXTRACTION_CACHE_MAX_BYTES = 512 * 1024 * 1024  # LRU eviction above this size
+CHUNK_SIZE_CHARS = 2000  # Max characters per retrieval chunk
+VERIFICATION_CACHE_ENABLED = True  # Reuse verdicts for unchanged questions
+ACCEPTANCE_CACHE_ENABLED = True  # Read and update per-materia acceptance rates
+
+# Context cleaning (repeated headers/footers, page numbers, index and bibliography)
+CONTEXT_CLEANING_ENABLED = True
+CLEANING_EDGE_LINES = 3  # Lines at the top and bottom of a page checked for headers and footers
+CLEANING_REPEAT_RATIO = 0.5  # Share of pages a line must start or end to count as a header/footer
+CLEANING_MIN_PAGES = 3  # Shorter documents get no header/footer detection
+CLEANING_BOILERPLATE_PAGE_RATIO = 0.6  # Pages with this share of index/bibliography lines are dropped
+
+# Web uploads (stored under CACHE_DIR / "uploads")
+UPLOAD_MAX_BYTES = 50 * 1024 * 1024  # Largest accepted PDF/TXT
+UPLOAD_DIR_MAX_BYTES = 1024 * 1024 * 1024  # Oldest uploads are deleted above this size
+UPLOAD_EXTRACTION_WORKERS = 2  # Concurrent extractions; further uploads queue
+UPLOAD_EXTRACTION_TIMEOUT_SECONDS = 300.0
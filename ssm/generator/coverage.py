@@ -0,0 +1,269 @@
+"""
+Coverage-gap planner.
+
+Compares the bank's questions per materia with the SSM 2024 quota
+(config.SSM_DISTRIBUTION) and builds a generation plan that fills the
+largest relative gaps first, within a question, token or cost budget. Inside
+a materia the planned questions go to the thinnest argomenti.
+
+Counts come from the compaction index (``<bank>.idx.json``) when it is up to
+date, otherwise from a scan of the bank.
+
+Usage:
+    python -m ssm.generator.coverage --budget-usd 0.50 --save piano.yaml
+    python -m ssm.generator.coverage --target 5000 --run
+"""
+
+import argparse
+import asyncio
+import heapq
+import json
+import math
+import sys
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from . import codec, config
+from .acceptance import AcceptanceTracker
+from .bank import default_bank_path, index_path_for
+from .plan import Plan, PlanEntry, run_plan, save_plan
+from .prompts import (
+    CONTEXT_WITHOUT_TEXT,
+    GENERATION_PROMPT,
+    GENERATION_SYSTEM_PROMPT,
+    VERIFICATION_PROMPT,
+    VERIFICATION_SYSTEM_PROMPT,
+)
+from .session import ApiSession
+from .tokens import count_tokens
+
+
+@dataclass
+class BankCoverage:
+    """Questions per materia and per (materia, argomento)."""
+
+    materie: Counter = field(default_factory=Counter)
+    argomenti: dict[str, Counter] = field(default_factory=dict)
+
+    @property
+    def total(self) -> int:
+        return sum(self.materie.values())
+
+
+@dataclass
+class MateriaGap:
+    materia: str
+    have: int
+    target: int
+    planned: int = 0
+
+
+def load_coverage(bank_path: Path) -> BankCoverage:
+    """Counts from the compaction index if it matches the bank, else from a scan."""
+    coverage = BankCoverage()
+    if not bank_path.exists():
+        return coverage
+
+    index_path = index_path_for(bank_path)
+    try:
+        index = json.loads(index_path.read_text(encoding="utf-8"))
+        if index.get("size") == bank_path.stat().st_size:
+            for materia, entry in index["materie"].items():
+                coverage.materie[materia] = entry["count"]
+                coverage.argomenti[materia] = Counter(entry.get("argomenti", {}))
+            return coverage
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+
+    with open(bank_path, encoding="utf-8") as f:
+        for line in f:
+            question = codec.decode_question(line)
+            if question is None:
+                continue
+            materia = question.get("materia", "")
+            coverage.materie[materia] += 1
+            coverage.argomenti.setdefault(materia, Counter())[question.get("argomenti", "")] += 1
+    return coverage
+
+
+def question_cost(acceptance_rate: float, batch_size: int = config.DEFAULT_BATCH_SIZE) -> tuple[float, float]:
+    """
+    Estimated (tokens, USD) per accepted question without source text.
+
+    Covers the generation call and the verification call, with the
+    instructions shared across a batch, divided by the acceptance rate.
+    """
+    generation_input = count_tokens(
+        GENERATION_SYSTEM_PROMPT + GENERATION_PROMPT.format(
+            materia="", argomento="", count=batch_size, context_section=CONTEXT_WITHOUT_TEXT,
+            images_section="", exclusion_section="",
+        )
+    ) / batch_size
+    verification_input = count_tokens(VERIFICATION_SYSTEM_PROMPT + VERIFICATION_PROMPT) / batch_size
+
+    input_tokens = generation_input + verification_input + config.OUTPUT_TOKENS_PER_QUESTION
+    output_tokens = config.OUTPUT_TOKENS_PER_QUESTION + config.VERIFICATION_TOKENS_PER_QUESTION
+    usd = (input_tokens * config.PRICE_INPUT_PER_MTOK + output_tokens * config.PRICE_OUTPUT_PER_MTOK) / 1_000_000
+    return (input_tokens + output_tokens) / acceptance_rate, usd / acceptance_rate
+
+
+def allocate(
+    coverage: BankCoverage,
+    target_total: Optional[int] = None,
+    max_questions: Optional[int] = None,
+    budget_tokens: Optional[float] = None,
+    budget_usd: Optional[float] = None,
+    acceptance: Optional[AcceptanceTracker] = None,
+) -> list[MateriaGap]:
+    """
+    Hand out questions one at a time to the materia furthest below its quota share.
+
+    Without ``target_total`` the budget is spread so the bank moves towards the
+    quota ratios; with it, a materia stops once it reaches its share of the
+    target. At least one limit must be given.
+    """
+    if target_total is None and max_questions is None and budget_tokens is None and budget_usd is None:
+        raise ValueError("Give a target or a budget (questions, tokens or USD)")
+
+    quota_total = sum(config.SSM_DISTRIBUTION.values())
+    acceptance = acceptance or AcceptanceTracker()
+    gaps = {
+        materia: MateriaGap(
+            materia=materia,
+            have=coverage.materie.get(materia, 0),
+            target=math.ceil(target_total * quota / quota_total) if target_total else 0,
+        )
+        for materia, quota in config.SSM_DISTRIBUTION.items()
+    }
+    costs = {materia: question_cost(acceptance.rate(materia)) for materia in gaps}
+
+    # Priority: questions held per quota point, lowest first
+    heap = [(gap.have / config.SSM_DISTRIBUTION[m], m) for m, gap in gaps.items()]
+    heapq.heapify(heap)
+
+    planned = 0
+    spent_tokens = 0.0
+    spent_usd = 0.0
+    while heap:
+        _, materia = heapq.heappop(heap)
+        gap = gaps[materia]
+        if target_total and gap.have + gap.planned >= gap.target:
+            continue
+        tokens, usd = costs[materia]
+        if max_questions is not None and planned >= max_questions:
+            break
+        if budget_tokens is not None and spent_tokens + tokens > budget_tokens:
+            continue
+        if budget_usd is not None and spent_usd + usd > budget_usd:
+            continue
+
+        gap.planned += 1
+        planned += 1
+        spent_tokens += tokens
+        spent_usd += usd
+        heapq.heappush(heap, ((gap.have + gap.planned) / config.SSM_DISTRIBUTION[materia], materia))
+
+    return sorted(gaps.values(), key=lambda g: -g.planned)
+
+
+def split_by_argomento(materia: str, count: int, argomenti: Counter) -> list[tuple[str, int]]:
+    """Spread ``count`` over the thinnest argomenti, COVERAGE_ENTRY_SIZE at a time."""
+    known = [a for a in argomenti if a and a != materia]
+    if not known:
+        return [(materia, count)]
+
+    slots = min(len(known), math.ceil(count / config.COVERAGE_ENTRY_SIZE))
+    thinnest = sorted(known, key=lambda a: (argomenti[a], a))[:slots]
+    base, extra = divmod(count, slots)
+    return [(a, base + (1 if i < extra else 0)) for i, a in enumerate(thinnest)]
+
+
+def build_plan(gaps: list[MateriaGap], coverage: BankCoverage, output_file: str) -> Plan:
+    entries = []
+    for gap in gaps:
+        if gap.planned <= 0:
+            continue
+        for argomento, count in split_by_argomento(gap.materia, gap.planned, coverage.argomenti.get(gap.materia, Counter())):
+            entries.append(PlanEntry(materia=gap.materia, argomento=argomento, count=count))
+    if not entries:
+        raise ValueError("Nothing to generate: the bank already meets the target")
+    return Plan(entries=entries, output_file=output_file)
+
+
+def print_coverage_report(gaps: list[MateriaGap], coverage: BankCoverage) -> None:
+    quota_total = sum(config.SSM_DISTRIBUTION.values())
+    total = coverage.total
+    print(f"Banca: {total} domande")
+    print(f"  {'Materia':<45} {'Banca':>6} {'Quota':>6} {'Attuale':>8} {'Piano':>6}")
+    for gap in sorted(gaps, key=lambda g: g.have / config.SSM_DISTRIBUTION[g.materia]):
+        quota = config.SSM_DISTRIBUTION[gap.materia] / quota_total
+        share = gap.have / total if total else 0.0
+        print(f"  {gap.materia[:45]:<45} {gap.have:>6} {quota:>6.1%} {share:>8.1%} {gap.planned:>6}")
+
+    unknown = [m for m in coverage.materie if m not in config.SSM_DISTRIBUTION]
+    if unknown:
+        print(f"  Materie fuori quota (ignorate): {', '.join(sorted(unknown))}")
+
+    planned = sum(g.planned for g in gaps)
+    acceptance = AcceptanceTracker()
+    tokens = sum(question_cost(acceptance.rate(g.materia))[0] * g.planned for g in gaps)
+    usd = sum(question_cost(acceptance.rate(g.materia))[1] * g.planned for g in gaps)
+    print(f"  Domande pianificate: {planned}  Token stimati: {tokens:,.0f}  Costo stimato: ${usd:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Pianifica la generazione dove la banca è più scoperta rispetto alla distribuzione SSM"
+    )
+    parser.add_argument("--bank", type=str, default=None, help="File JSONL della banca (default: config.BANK_FILE)")
+    parser.add_argument("--target", type=int, default=None, help="Dimensione desiderata della banca")
+    parser.add_argument("--max-questions", type=int, default=None, help="Numero massimo di domande da generare")
+    parser.add_argument("--budget-tokens", type=float, default=None, help="Budget massimo in token")
+    parser.add_argument("--budget-usd", type=float, default=None, help="Budget massimo in dollari")
+    parser.add_argument("--save", type=str, default=None, help="Salva il piano (.json o .yaml)")
+    parser.add_argument("--run", action="store_true", help="Esegui subito il piano")
+    parser.add_argument("--output", "-o", type=str, default=config.DEFAULT_OUTPUT_FILE,
+                        help=f"File di output del piano (default: {config.DEFAULT_OUTPUT_FILE})")
+
+    args = parser.parse_args()
+
+    if args.target is None and args.max_questions is None and args.budget_tokens is None and args.budget_usd is None:
+        parser.error("indica --target oppure un budget (--max-questions, --budget-tokens, --budget-usd)")
+
+    bank_path = Path(args.bank) if args.bank else default_bank_path()
+    coverage = load_coverage(bank_path)
+    gaps = allocate(
+        coverage,
+        target_total=args.target,
+        max_questions=args.max_questions,
+        budget_tokens=args.budget_tokens,
+        budget_usd=args.budget_usd,
+    )
+    print_coverage_report(gaps, coverage)
+
+    try:
+        plan = build_plan(gaps, coverage, args.output)
+    except ValueError:
+        print("Nessuna lacuna da colmare con i limiti indicati.")
+        return
+
+    if args.save:
+        save_plan(plan, args.save)
+        print(f"Piano salvato in: {args.save}")
+
+    if args.run:
+        session = ApiSession.from_config()
+        if not session.has_credentials:
+            print("ERRORE: OPENAI_API_KEY non configurata.")
+            sys.exit(1)
+        asyncio.run(run_plan(plan, session=session))
+    elif not args.save:
+        print("Piano (usa --save per salvarlo o --run per eseguirlo):")
+        for entry in plan.entries:
+            print(f"  {entry.label}: {entry.count}")
+
+
+if __name__ == "__main__":
+    main()
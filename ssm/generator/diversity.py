@@ -0,0 +1,130 @@
+"""
+Cross-batch diversity for generation jobs.
+
+A digest per materia/argomento remembers what has already been asked, both
+in the bank and earlier in the job, as short keyphrases (the correct answer
+plus a few salient words of the stem) instead of full text. Each new batch
+prompt gets the most recent keyphrases as an exclusion list, and returned
+questions whose stem is a near-copy of one already seen are discarded (the
+plan summary counts them per entry). Only questions that passed verification are added to a digest, so
+a rejected question never blocks its topic.
+"""
+
+import re
+from pathlib import Path
+from typing import Iterable, Optional
+
+from . import codec, config
+from .retrieval import ITALIAN_STOPWORDS, tokenize
+
+# Words every clinical stem uses; they say nothing about the topic
+_FILLER_WORDS = frozenset("""
+paziente pazienti anni anno giunge presenta presentano seguente seguenti affermazioni
+affermazione corretta corrette errata vera falsa quale quali riferisce mostra
+osservazione pronto soccorso ambulatorio medico esame obiettivo domanda risposta
+""".split())
+
+_WORD_RE = re.compile(r"[A-Za-zÀ-ÿ0-9-]+")
+
+
+def keyphrase(question: dict) -> str:
+    """Compact label for a question: its correct answer and a few salient stem words."""
+    answer = re.sub(r"\s+", " ", str(question.get("risposta_corretta_text", ""))).strip()
+    answer = answer[:config.DIVERSITY_ANSWER_CHARS].rstrip()
+
+    words = []
+    for word in _WORD_RE.findall(str(question.get("domanda", ""))):
+        lower = word.lower()
+        if len(lower) < 5 or lower in ITALIAN_STOPWORDS or lower in _FILLER_WORDS or lower.isdigit():
+            continue
+        if lower in answer.lower():
+            continue
+        if lower not in (w.lower() for w in words):
+            words.append(word)
+    # Longest words are usually the most specific terms; keep them in stem order
+    salient = sorted(sorted(words, key=len, reverse=True)[:config.DIVERSITY_STEM_WORDS], key=words.index)
+
+    if answer and salient:
+        return f"{answer} ({', '.join(salient)})"
+    return answer or ", ".join(salient)
+
+
+def _signature(question: dict) -> frozenset:
+    return frozenset(tokenize(str(question.get("domanda", ""))))
+
+
+def _similarity(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class DiversityDigest:
+    """Keyphrases and stem signatures of the questions seen for one materia/argomento."""
+
+    def __init__(self):
+        self.keyphrases: list[str] = []
+        self.signatures: list[frozenset] = []
+
+    def add(self, questions: Iterable[dict]) -> None:
+        for question in questions:
+            phrase = keyphrase(question)
+            if phrase:
+                self.keyphrases.append(phrase)
+            self.signatures.append(_signature(question))
+
+    def exclusions(self, limit: int = config.DIVERSITY_MAX_EXCLUSIONS, pending: Iterable[dict] = ()) -> list[str]:
+        """Most recent keyphrases first (``pending`` questions after the digest's), without repeats."""
+        phrases = self.keyphrases + [phrase for phrase in map(keyphrase, pending) if phrase]
+        seen = set()
+        items = []
+        for phrase in reversed(phrases):
+            if phrase.lower() in seen:
+                continue
+            seen.add(phrase.lower())
+            items.append(phrase)
+            if len(items) >= limit:
+                break
+        return items
+
+    def filter_new(self, questions: list[dict], pending: Iterable[dict] = ()) -> list[dict]:
+        """
+        Drop near-duplicates of anything seen so far, of ``pending`` questions and of each other.
+
+        Nothing is remembered: callers ``add`` the questions once they are verified.
+        """
+        signatures = self.signatures + [_signature(question) for question in pending]
+        kept = []
+        for question in questions:
+            signature = _signature(question)
+            if any(_similarity(signature, s) >= config.DIVERSITY_DUPLICATE_SIMILARITY for s in signatures):
+                continue
+            signatures.append(signature)
+            kept.append(question)
+        return kept
+
+
+def digest_key(materia: str, argomento: Optional[str]) -> tuple[str, str]:
+    return (materia, argomento or materia)
+
+
+def load_bank_digests(bank_path: Path, keys: Iterable[tuple[str, str]]) -> dict[tuple[str, str], DiversityDigest]:
+    """
+    One digest per (materia, argomento) key, seeded from the bank.
+
+    A key whose argomento equals the materia collects the whole materia.
+    """
+    digests = {key: DiversityDigest() for key in keys}
+    if not bank_path.exists():
+        return digests
+
+    with open(bank_path, encoding="utf-8") as f:
+        for line in f:
+            question = codec.decode_question(line)
+            if question is None:
+                continue
+            materia = question.get("materia")
+            for key in {(materia, question.get("argomenti")), (materia, materia)}:
+                if key in digests:
+                    digests[key].add([question])
+    return digests
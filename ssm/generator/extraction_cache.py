@@ -0,0 +1,151 @@
+"""
+Persistent cache of extracted documents.
+
+Entries are keyed by the SHA-256 of the source file, EXTRACTOR_VERSION and a
+hash of the config settings that change the extracted document, stored as gzip-compressed JSON under ``config.CACHE_DIR / "extraction"`` and
+evicted least-recently-used once the directory exceeds
+``config.EXTRACTION_CACHE_MAX_BYTES``.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+from dataclasses import asdict
+from pathlib import Path
+from typing import Optional
+
+from . import config
+from .cleaning import CleaningStats
+from .pipeline import EXTRACTOR_VERSION, Document, extract_document
+
+# Config settings that change what extract_document produces
+EXTRACTION_SETTINGS = (
+    "CHUNK_SIZE_CHARS",
+    "CONTEXT_CLEANING_ENABLED",
+    "CLEANING_EDGE_LINES",
+    "CLEANING_REPEAT_RATIO",
+    "CLEANING_MIN_PAGES",
+    "CLEANING_BOILERPLATE_PAGE_RATIO",
+    "IMAGE_EXTRACTION_ENABLED",
+    "IMAGE_DIR",
+    "IMAGE_FORMAT",
+    "IMAGE_QUALITY",
+    "IMAGE_MAX_DIMENSION",
+    "IMAGE_MIN_DIMENSION",
+)
+
+
+def file_sha256(file_path: str) -> str:
+    """Hash a file's content in 1 MiB blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def settings_hash() -> str:
+    """Short hash of the current EXTRACTION_SETTINGS values."""
+    values = {name: str(getattr(config, name)) for name in EXTRACTION_SETTINGS}
+    return hashlib.sha256(json.dumps(values, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+
+class ExtractionCache:
+    """Content-addressed, size-bounded store of extracted Documents."""
+
+    def __init__(
+        self,
+        cache_dir: Optional[Path] = None,
+        max_bytes: int = config.EXTRACTION_CACHE_MAX_BYTES,
+    ):
+        self.cache_dir = Path(cache_dir or config.CACHE_DIR) / "extraction"
+        self.max_bytes = max_bytes
+
+    def key_for(self, file_path: str) -> str:
+        return f"{file_sha256(file_path)}-v{EXTRACTOR_VERSION}-{settings_hash()}"
+
+    def path_for(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json.gz"
+
+    def get(self, key: str) -> Optional[Document]:
+        """The cached Document, or None on a miss. A corrupt entry is deleted and counts as a miss."""
+        path = self.path_for(key)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+            document = Document(
+                text=data["text"],
+                pages=[tuple(p) for p in data["pages"]],
+                chunks=[tuple(c) for c in data["chunks"]],
+                key=key,
+                images=[tuple(i) for i in data.get("images", [])],
+                cleaning=CleaningStats(**data["cleaning"]) if data.get("cleaning") else None,
+            )
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, ValueError, KeyError, TypeError, AttributeError):
+            # Truncated gzip, invalid JSON or an entry missing fields
+            path.unlink(missing_ok=True)
+            return None
+
+        # Touch the entry so eviction keeps recently used documents
+        os.utime(path)
+        return document
+
+    def put(self, key: str, document: Document) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self.path_for(key)
+        tmp_path = path.with_suffix(".tmp")
+
+        data = {
+            "text": document.text,
+            "pages": document.pages,
+            "chunks": document.chunks,
+            "images": document.images,
+            "cleaning": asdict(document.cleaning) if document.cleaning else None,
+        }
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+        self.evict()
+
+    def evict(self) -> None:
+        """Delete least-recently-used entries until the cache fits in max_bytes."""
+        entries = []
+        for path in self.cache_dir.glob("*.json.gz"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+def load_document(file_path: str, cache: Optional[ExtractionCache] = None) -> Document:
+    """Return the Document for a file, extracting it only on a cache miss."""
+    if not Path(file_path).exists():
+        raise FileNotFoundError(f"File not found: {file_path}")
+
+    if cache is None and config.EXTRACTION_CACHE_ENABLED:
+        cache = ExtractionCache()
+    if cache is None:
+        return extract_document(file_path)
+
+    key = cache.key_for(file_path)
+    document = cache.get(key)
+    if document is not None:
+        print(f"  Testo estratto da cache: {Path(file_path).name}")
+        return document
+
+    document = extract_document(file_path)
+    document.key = key
+    cache.put(key, document)
+    return document
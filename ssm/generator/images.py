@@ -0,0 +1,171 @@
+"""
+Figures extracted from source PDFs, kept in a content-addressed store.
+
+Embedded images are pulled per page with PyMuPDF, skipped when smaller than
+IMAGE_MIN_DIMENSION (logos, icons, rules), downscaled to IMAGE_MAX_DIMENSION
+and recompressed to WebP (or AVIF) when Pillow is installed. Each stored
+file is named after the hash of its bytes, so identical figures are stored
+once and the files never change. ``manifest.json`` maps original-image
+hashes to stored files and records size and provenance.
+
+``image_src`` values are relative to the quiz page (``img/<hash>.webp``), so
+the same path works on the static site and under web.py's /quiz/.
+"""
+
+import base64
+import hashlib
+import io
+import json
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from . import config
+
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+try:
+    from PIL import Image, features
+except ImportError:
+    Image = None
+
+MEDIA_TYPES = {"webp": "image/webp", "avif": "image/avif", "png": "image/png", "jpeg": "image/jpeg", "jpg": "image/jpeg"}
+
+
+@dataclass
+class ImageAsset:
+    filename: str
+    width: int
+    height: int
+
+    @property
+    def src(self) -> str:
+        return f"{Path(config.IMAGE_DIR).name}/{self.filename}"
+
+
+def _encode(data: bytes, ext: str, width: int, height: int) -> Optional[tuple[bytes, str, int, int]]:
+    """Recompressed (bytes, extension, width, height), or None for images too small to be figures."""
+    if min(width, height) < config.IMAGE_MIN_DIMENSION:
+        return None
+    if Image is None:
+        # Without Pillow keep browser-safe originals as they are
+        return (data, ext, width, height) if ext in MEDIA_TYPES else None
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except Exception:
+        return None
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() or image.mode == "P" else "RGB")
+    image.thumbnail((config.IMAGE_MAX_DIMENSION, config.IMAGE_MAX_DIMENSION))
+
+    fmt = config.IMAGE_FORMAT
+    if fmt == "avif" and not features.check("avif"):
+        fmt = "webp"
+    out = io.BytesIO()
+    image.save(out, format=fmt.upper(), quality=config.IMAGE_QUALITY)
+    return out.getvalue(), fmt, image.width, image.height
+
+
+class ImageStore:
+    """Content-addressed image directory with a JSON manifest, safe to share between threads."""
+
+    def __init__(self, root: Optional[Path] = None):
+        self.root = Path(root or config.IMAGE_DIR)
+        self.manifest_path = self.root / "manifest.json"
+        self._lock = threading.Lock()
+        try:
+            self.manifest = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            self.manifest = {"images": {}, "originals": {}}
+
+    def put(self, data: bytes, ext: str, width: int, height: int, source: str = "", page: int = 0) -> Optional[ImageAsset]:
+        """Store an image (once per distinct content) and return its asset."""
+        original = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            filename = self.manifest["originals"].get(original)
+            if filename is None or not (self.root / filename).exists():
+                encoded = _encode(data, ext.lower(), width, height)
+                if encoded is None:
+                    return None
+                body, fmt, width, height = encoded
+                filename = f"{hashlib.sha256(body).hexdigest()[:32]}.{fmt}"
+                path = self.root / filename
+                if not path.exists():
+                    self.root.mkdir(parents=True, exist_ok=True)
+                    tmp_path = path.with_suffix(".tmp")
+                    tmp_path.write_bytes(body)
+                    os.replace(tmp_path, path)
+                self.manifest["originals"][original] = filename
+                self.manifest["images"].setdefault(filename, {
+                    "width": width, "height": height, "bytes": len(body), "sources": [],
+                })
+
+            entry = self.manifest["images"][filename]
+            if source and [source, page] not in entry["sources"]:
+                entry["sources"].append([source, page])
+            return ImageAsset(filename=filename, width=entry["width"], height=entry["height"])
+
+    def save(self) -> None:
+        with self._lock:
+            self.root.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.manifest_path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(self.manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp_path, self.manifest_path)
+
+    def path_for(self, src: str) -> Path:
+        return self.root / Path(src).name
+
+    def data_url(self, src: str) -> str:
+        """The stored image inlined as a data: URL, for vision prompts."""
+        path = self.path_for(src)
+        media_type = MEDIA_TYPES.get(path.suffix.lstrip("."), "application/octet-stream")
+        return f"data:{media_type};base64,{base64.b64encode(path.read_bytes()).decode('ascii')}"
+
+
+_default_store: Optional[ImageStore] = None
+_default_lock = threading.Lock()
+
+
+def default_image_store() -> ImageStore:
+    """Process-wide store, so concurrent extractions share one manifest."""
+    global _default_store
+    with _default_lock:
+        if _default_store is None or _default_store.root != Path(config.IMAGE_DIR):
+            _default_store = ImageStore()
+        return _default_store
+
+
+def extract_images_from_pdf(pdf_path: str, store: Optional[ImageStore] = None) -> list[tuple[int, str]]:
+    """Store the figures of a PDF and return (page number, image_src) pairs."""
+    if fitz is None:
+        raise ImportError("PyMuPDF is required for PDF extraction. Install with: pip install PyMuPDF")
+
+    store = store or default_image_store()
+    images = []
+    seen_xrefs = set()
+    with fitz.open(pdf_path) as doc:
+        for page_num, page in enumerate(doc, start=1):
+            for info in page.get_images(full=True):
+                xref, width, height = info[0], info[2], info[3]
+                # Shared resources (headers, logos) appear on many pages: keep the first
+                if xref in seen_xrefs or min(width, height) < config.IMAGE_MIN_DIMENSION:
+                    continue
+                seen_xrefs.add(xref)
+                extracted = doc.extract_image(xref)
+                if not extracted:
+                    continue
+                asset = store.put(
+                    extracted["image"], extracted["ext"], extracted["width"], extracted["height"],
+                    source=Path(pdf_path).name, page=page_num,
+                )
+                if asset is not None:
+                    images.append((page_num, asset.src))
+    store.save()
+    return images
@@ -0,0 +1,555 @@
+"""
+Load testing for the web UI's API against a mock OpenAI backend.
+
+Starts web.py in a child process with a throwaway bank and cache, pointed
+(through an endpoints file) at a local mock chat-completion server that
+answers with valid questions and verdicts after a configurable delay, then
+runs a mix of virtual users for a fixed time:
+
+- pollers: GET /api/progress every 0.5 s, like the generation page;
+- generators: POST /api/generate back to back, each a whole job;
+- appenders: POST /api/append in bursts.
+
+It reports per-endpoint throughput, latency percentiles and error rates,
+plus the server's RSS and CPU (psutil, or /proc on Linux), and saves the
+results as JSON under --out, so server changes can be compared run over
+run with --compare.
+
+Usage:
+    python -m ssm.generator.loadtest --scenario misto --duration 60
+    python -m ssm.generator.loadtest --pollers 200 --generators 0 --appenders 0
+    python -m ssm.generator.loadtest --scenario misto --compare loadtest/20261019-101500-misto.json
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+
+import httpx
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from . import codec, config
+from .prompts import VERIFICATION_SYSTEM_PROMPT
+
+# Virtual users per scenario; --pollers/--generators/--appenders override them
+SCENARIOS = {
+    "misto": {"pollers": 20, "generators": 4, "appenders": 2},
+    "polling": {"pollers": 100, "generators": 1, "appenders": 0},
+    "generazione": {"pollers": 0, "generators": 16, "appenders": 0},
+    "append": {"pollers": 0, "generators": 0, "appenders": 20},
+}
+
+POLL_INTERVAL_SECONDS = 0.5  # Same as the generation page
+PERCENTILES = (50, 90, 95, 99)
+
+_WORDS = (
+    "paziente", "anni", "dolore", "toracico", "febbre", "dispnea", "addominale", "cefalea", "esordio", "acuto",
+    "cronico", "terapia", "diagnosi", "esame", "obiettivo", "reperto", "sintomi", "storia", "familiare", "pressione",
+    "arteriosa", "frequenza", "cardiaca", "laboratorio", "emocromo", "ecografia", "radiografia", "lesione", "sindrome",
+    "trattamento", "prima", "scelta", "complicanza", "frequente", "rischio", "fattore", "eziologia", "quadro",
+)
+
+
+# --- Mock chat-completion backend ------------------------------------------
+
+def make_question(materia: str, argomento: str, rng: random.Random) -> dict:
+    """A question that passes the local rules, with a stem unlike any other."""
+    stem = " ".join(rng.sample(_WORDS, 12))
+    tag = uuid.UUID(int=rng.getrandbits(128)).hex[:12]
+    correct = rng.randint(1, 5)
+    texts = [f"{' '.join(rng.sample(_WORDS, 3))} {tag}{k}" for k in range(1, 6)]
+    return {
+        "materia": materia,
+        "argomenti": argomento,
+        "domanda": f"Caso {tag}: {stem}. Quale delle seguenti è la risposta corretta?",
+        "has_image": False,
+        "image_src": None,
+        "risposte": [{"id": k, "text": texts[k - 1], "isCorrect": k == correct} for k in range(1, 6)],
+        "risposta_corretta_text": texts[correct - 1],
+        "commento": f"La risposta {correct} è corretta: {' '.join(rng.sample(_WORDS, 20))}.",
+    }
+
+
+def mock_completion(prompt: str, rng: random.Random) -> str:
+    """The content a model would return for a generation or verification prompt."""
+    if VERIFICATION_SYSTEM_PROMPT in prompt:
+        count = prompt.count('"domanda":')
+        return codec.dumps_line([
+            {"domanda_index": i, "is_valid": True, "issues": [], "suggested_fix": ""} for i in range(count)
+        ])
+
+    count = re.search(r"Genera esattamente (\d+) domande", prompt)
+    materia = re.search(r"MATERIA: (.*)", prompt)
+    argomento = re.search(r"ARGOMENTO: (.*)", prompt)
+    return codec.dumps_line([
+        make_question(materia.group(1) if materia else "", argomento.group(1) if argomento else "", rng)
+        for _ in range(int(count.group(1)) if count else config.DEFAULT_BATCH_SIZE)
+    ])
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = codec.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        prompt = "\n".join(
+            m["content"] if isinstance(m["content"], str)
+            else "\n".join(part.get("text", "") for part in m["content"])
+            for m in body.get("messages", [])
+        )
+        rng = random.Random()
+        time.sleep(self.server.latency * rng.uniform(0.5, 1.5))
+        data = codec.dumps_line({
+            "choices": [{"message": {"role": "assistant", "content": mock_completion(prompt, rng)}}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": 450 * prompt.count("Genera esattamente")},
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_mock_backend(latency: float) -> ThreadingHTTPServer:
+    """Serve mock chat completions on a free localhost port from a daemon thread."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _MockHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    threading.Thread(target=server.serve_forever, name="ssm-mock-openai", daemon=True).start()
+    return server
+
+
+# --- Server under test ------------------------------------------------------
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve(port: int) -> None:
+    """Run the web UI as web.main() does, on localhost and the given port."""
+    from . import web
+
+    with web.app.app_context():
+        web.assets.preload()
+    web.app.run(host="127.0.0.1", port=port, debug=False, threaded=True)
+
+
+def start_server(work_dir: Path, mock_url: str, seed_questions: int) -> tuple[subprocess.Popen, str]:
+    """Start web.py in a child process on a seeded throwaway bank; returns it and its URL."""
+    rng = random.Random(0)
+    bank_path = work_dir / "bank.jsonl"
+    with open(bank_path, "w", encoding="utf-8") as f:
+        for i in range(seed_questions):
+            materia = list(config.SSM_DISTRIBUTION)[i % len(config.SSM_DISTRIBUTION)]
+            f.write(codec.dumps_line(make_question(materia, materia, rng)) + "\n")
+
+    endpoints_path = work_dir / "endpoints.json"
+    endpoints_path.write_text(codec.dumps_pretty([
+        {"name": "mock", "base_url": f"{mock_url}/v1", "api_key": "mock", "model": config.OPENAI_MODEL}
+    ]), encoding="utf-8")
+
+    port = _free_port()
+    env = {
+        **os.environ,
+        "OPENAI_ENDPOINTS_FILE": str(endpoints_path),
+        "SSM_BANK_FILE": str(bank_path),
+        "SSM_CACHE_DIR": str(work_dir / "cache"),
+        "SSM_IMAGE_DIR": str(work_dir / "img"),
+        "PYTHONPATH": os.pathsep.join(filter(None, [str(Path(__file__).resolve().parents[2]), os.environ.get("PYTHONPATH")])),
+    }
+    log = open(work_dir / "server.log", "wb")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "ssm.generator.loadtest", "--serve", str(port)],
+        env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    log.close()
+    return process, f"http://127.0.0.1:{port}"
+
+
+def wait_until_ready(url: str, process: Optional[subprocess.Popen], timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Il server è terminato all'avvio (codice {process.returncode})")
+        try:
+            if httpx.get(f"{url}/api/status", timeout=2.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Il server non risponde su {url} dopo {timeout:.0f}s")
+
+
+# --- Measurements -----------------------------------------------------------
+
+def percentile(ordered: list[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))]
+
+
+@dataclass
+class EndpointStats:
+    latencies: list[float] = field(default_factory=list)
+    errors: Counter = field(default_factory=Counter)
+
+    def summary(self, elapsed: float) -> dict:
+        requests = len(self.latencies)
+        errors = sum(self.errors.values())
+        ordered = sorted(self.latencies)
+        latency_ms = {}
+        if ordered:
+            latency_ms = {f"p{p}": round(percentile(ordered, p) * 1000, 1) for p in PERCENTILES}
+            latency_ms["max"] = round(ordered[-1] * 1000, 1)
+            latency_ms["mean"] = round(sum(ordered) / requests * 1000, 1)
+        return {
+            "requests": requests,
+            "errors": errors,
+            "error_rate": round(errors / requests, 4) if requests else 0.0,
+            "throughput_rps": round(requests / elapsed, 2) if elapsed else 0.0,
+            "latency_ms": latency_ms,
+            "top_errors": dict(self.errors.most_common(5)),
+        }
+
+
+class ServerMonitor:
+    """Samples a process's RSS and CPU time through psutil or, without it, /proc."""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.rss: list[int] = []
+        self.cpu_percent: list[float] = []
+        self._process = psutil.Process(pid) if psutil is not None else None
+
+    def read(self) -> Optional[tuple[float, int]]:
+        """(CPU seconds, RSS bytes), or None when neither psutil nor /proc is available."""
+        if self._process is not None:
+            try:
+                times = self._process.cpu_times()
+                return times.user + times.system, self._process.memory_info().rss
+            except psutil.Error:
+                return None
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            with open(f"/proc/{self.pid}/statm") as f:
+                pages = int(f.read().split()[1])
+        except (OSError, ValueError, IndexError):
+            return None
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        return cpu, pages * os.sysconf("SC_PAGE_SIZE")
+
+    async def run(self, stop: asyncio.Event) -> None:
+        previous = self.read()
+        if previous is None:
+            return
+        self.rss.append(previous[1])
+        last = time.monotonic()
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            sample = self.read()
+            if sample is None:
+                return
+            now = time.monotonic()
+            self.cpu_percent.append(100 * (sample[0] - previous[0]) / max(now - last, 1e-6))
+            self.rss.append(sample[1])
+            previous, last = sample, now
+
+    def summary(self) -> Optional[dict]:
+        if not self.rss:
+            return None
+        mb = 1024 * 1024
+        return {
+            "rss_start_mb": round(self.rss[0] / mb, 1),
+            "rss_end_mb": round(self.rss[-1] / mb, 1),
+            "rss_max_mb": round(max(self.rss) / mb, 1),
+            "cpu_mean_percent": round(sum(self.cpu_percent) / len(self.cpu_percent), 1) if self.cpu_percent else 0.0,
+            "cpu_max_percent": round(max(self.cpu_percent), 1) if self.cpu_percent else 0.0,
+            "source": "psutil" if self._process is not None else "/proc",
+        }
+
+
+# --- Virtual users ----------------------------------------------------------
+
+class LoadRun:
+    """Shared state of one run: the client, the deadline, per-endpoint stats."""
+
+    def __init__(self, client: httpx.AsyncClient, duration: float, count: int, append_batch: int):
+        self.client = client
+        self.stop_at = time.monotonic() + duration
+        self.count = count
+        self.append_batch = append_batch
+        self.stats: dict[str, EndpointStats] = {}
+        self.job_ids: deque[str] = deque(maxlen=50)
+        self.questions_generated = 0
+        self.rng = random.Random()
+
+    @property
+    def running(self) -> bool:
+        return time.monotonic() < self.stop_at
+
+    async def request(self, name: str, method: str, path: str, **kwargs) -> Optional[dict]:
+        """Send one request and record its latency, counting HTTP errors and success=false as errors."""
+        stats = self.stats.setdefault(name, EndpointStats())
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, **kwargs)
+            data = codec.loads(response.content)
+        except (httpx.HTTPError, ValueError) as e:
+            stats.latencies.append(time.perf_counter() - started)
+            stats.errors[type(e).__name__] += 1
+            return None
+        stats.latencies.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            stats.errors[f"HTTP {response.status_code}"] += 1
+        elif isinstance(data, dict) and data.get("success") is False:
+            stats.errors[str(data.get("error"))[:80]] += 1
+        return data
+
+    async def poller(self) -> None:
+        await asyncio.sleep(self.rng.uniform(0, POLL_INTERVAL_SECONDS))
+        while self.running:
+            job_id = self.rng.choice(self.job_ids) if self.job_ids else ""
+            await self.request("/api/progress", "GET", "/api/progress", params={"job_id": job_id})
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+    async def generator(self) -> None:
+        while self.running:
+            materia = self.rng.choice(list(config.SSM_DISTRIBUTION))
+            job_id = uuid.uuid4().hex
+            self.job_ids.append(job_id)
+            data = await self.request("/api/generate", "POST", "/api/generate", json={
+                "materia": materia, "argomento": materia, "count": self.count, "job_id": job_id,
+            })
+            if data and data.get("success"):
+                self.questions_generated += len(data.get("questions", []))
+
+    async def appender(self, interval: float) -> None:
+        await asyncio.sleep(self.rng.uniform(0, interval))
+        while self.running:
+            materia = self.rng.choice(list(config.SSM_DISTRIBUTION))
+            questions = [make_question(materia, materia, self.rng) for _ in range(self.append_batch)]
+            await self.request("/api/append", "POST", "/api/append", json={"questions": questions})
+            await asyncio.sleep(interval)
+
+
+async def run_load(url: str, users: dict, args, pid: Optional[int]) -> dict:
+    """Run the virtual users until the deadline and in-flight requests finish; returns the results."""
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=sum(users.values()) + 10)
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        run = LoadRun(client, args.duration, args.count, args.append_batch)
+        monitor = ServerMonitor(pid) if pid else None
+        stop = asyncio.Event()
+        monitor_task = asyncio.create_task(monitor.run(stop)) if monitor else None
+
+        started = time.monotonic()
+        tasks = [run.poller() for _ in range(users["pollers"])]
+        tasks += [run.generator() for _ in range(users["generators"])]
+        tasks += [run.appender(args.append_interval) for _ in range(users["appenders"])]
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - started
+
+        stop.set()
+        if monitor_task is not None:
+            await monitor_task
+
+    return {
+        "elapsed_seconds": round(elapsed, 2),
+        "questions_generated": run.questions_generated,
+        "endpoints": {name: stats.summary(elapsed) for name, stats in sorted(run.stats.items())},
+        "server": monitor.summary() if monitor else None,
+    }
+
+
+# --- Reporting --------------------------------------------------------------
+
+def _git_commit() -> Optional[str]:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+            cwd=Path(__file__).resolve().parent,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def print_results(results: dict) -> None:
+    print(f"\n  {'endpoint':<16} {'richieste':>9} {'errori':>7} {'req/s':>7} "
+          f"{'p50':>7} {'p90':>7} {'p99':>7} {'max':>7}  (ms)")
+    for name, s in results["endpoints"].items():
+        lat = s["latency_ms"]
+        print(f"  {name:<16} {s['requests']:>9} {s['error_rate']:>7.1%} {s['throughput_rps']:>7.1f} "
+              + " ".join(f"{lat.get(k, 0):>7.0f}" for k in ("p50", "p90", "p99", "max")))
+        for error, n in s["top_errors"].items():
+            print(f"    {n} x {error}")
+    print(f"\nDomande generate: {results['questions_generated']} in {results['elapsed_seconds']:.0f}s")
+
+    server = results["server"]
+    if server:
+        print(f"Server: RSS {server['rss_start_mb']:.0f} -> {server['rss_end_mb']:.0f} MB "
+              f"(max {server['rss_max_mb']:.0f}), CPU media {server['cpu_mean_percent']:.0f}% "
+              f"(max {server['cpu_max_percent']:.0f}%) [{server['source']}]")
+    else:
+        print("Server: RSS/CPU non disponibili (installa psutil o indica --server-pid)")
+
+
+def _change(before: float, after: float) -> str:
+    if not before:
+        return ""
+    return f" ({(after - before) / before:+.0%})"
+
+
+def print_comparison(previous: dict, results: dict) -> None:
+    """Throughput, p95 and error rate per endpoint against an earlier run."""
+    print(f"\nConfronto con {previous.get('started_at')} (commit {previous.get('git_commit') or 'n/d'}):")
+    for name, s in results["endpoints"].items():
+        old = previous.get("endpoints", {}).get(name)
+        if old is None:
+            continue
+        old_p95, new_p95 = old["latency_ms"].get("p95", 0), s["latency_ms"].get("p95", 0)
+        print(f"  {name:<16} req/s {old['throughput_rps']:.1f} -> {s['throughput_rps']:.1f}"
+              f"{_change(old['throughput_rps'], s['throughput_rps'])}, "
+              f"p95 {old_p95:.0f} -> {new_p95:.0f} ms{_change(old_p95, new_p95)}, "
+              f"errori {old['error_rate']:.1%} -> {s['error_rate']:.1%}")
+
+    old_server, server = previous.get("server"), results["server"]
+    if old_server and server:
+        print(f"  server           RSS max {old_server['rss_max_mb']:.0f} -> {server['rss_max_mb']:.0f} MB, "
+              f"CPU media {old_server['cpu_mean_percent']:.0f}% -> {server['cpu_mean_percent']:.0f}%")
+    if previous.get("params") != results["params"]:
+        print("  ATTENZIONE: parametri diversi dalla run precedente, il confronto è indicativo")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test di carico delle API della web UI con un backend OpenAI simulato")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="misto", help="Mix di utenti virtuali (default: misto)")
+    parser.add_argument("--pollers", type=int, default=None, help="Utenti che interrogano /api/progress")
+    parser.add_argument("--generators", type=int, default=None, help="Utenti che avviano generazioni in sequenza")
+    parser.add_argument("--appenders", type=int, default=None, help="Utenti che salvano domande con /api/append")
+    parser.add_argument("--duration", type=float, default=30.0, help="Durata in secondi (default: 30)")
+    parser.add_argument("--count", type=int, default=10, help="Domande per generazione (default: 10)")
+    parser.add_argument("--append-batch", type=int, default=5, help="Domande per /api/append (default: 5)")
+    parser.add_argument("--append-interval", type=float, default=0.2, help="Pausa tra due append dello stesso utente (default: 0.2s)")
+    parser.add_argument("--mock-latency", type=float, default=1.0, help="Latenza media del backend simulato (default: 1.0s)")
+    parser.add_argument("--seed-questions", type=int, default=2000, help="Domande iniziali nella banca di prova (default: 2000)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Timeout per richiesta (default: 120s)")
+    parser.add_argument("--url", type=str, default=None, help="Server già avviato da testare invece di avviarne uno")
+    parser.add_argument("--server-pid", type=int, default=None, help="PID del server indicato con --url, per RSS/CPU")
+    parser.add_argument("--out", type=str, default="loadtest", help="Cartella dei risultati (default: loadtest)")
+    parser.add_argument("--compare", type=str, default=None, help="Risultati JSON di una run precedente da confrontare")
+    parser.add_argument("--serve", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve is not None:
+        serve(args.serve)
+        return
+
+    users = {kind: getattr(args, kind) if getattr(args, kind) is not None else n
+             for kind, n in SCENARIOS[args.scenario].items()}
+    if not any(users.values()):
+        print("ERRORE: nessun utente virtuale")
+        sys.exit(1)
+
+    # Read the baseline before the run, so a wrong path does not waste it
+    baseline = None
+    if args.compare:
+        try:
+            baseline = codec.loads(Path(args.compare).read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            print(f"ERRORE: impossibile leggere i risultati da confrontare ({args.compare}): {e}")
+            sys.exit(1)
+        if not isinstance(baseline, dict):
+            print(f"ERRORE: {args.compare} non contiene risultati di una run")
+            sys.exit(1)
+
+    mock = None
+    process = None
+    with tempfile.TemporaryDirectory(prefix="ssm-loadtest-") as tmp:
+        try:
+            if args.url:
+                url, pid = args.url.rstrip("/"), args.server_pid
+                print(f"ATTENZIONE: le generazioni su {url} usano il backend configurato su quel server")
+            else:
+                mock = start_mock_backend(args.mock_latency)
+                mock_url = f"http://127.0.0.1:{mock.server_address[1]}"
+                process, url = start_server(Path(tmp), mock_url, args.seed_questions)
+                pid = process.pid
+            wait_until_ready(url, process)
+
+            started_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+            print(f"Scenario {args.scenario}: {users['pollers']} poller, {users['generators']} generazioni, "
+                  f"{users['appenders']} append per {args.duration:.0f}s (latenza simulata {args.mock_latency}s)")
+            results = asyncio.run(run_load(url, users, args, pid))
+        except RuntimeError as e:
+            print(f"ERRORE: {e}")
+            if process is not None:
+                log = Path(tmp) / "server.log"
+                print(log.read_text(encoding="utf-8", errors="replace")[-2000:])
+            sys.exit(1)
+        finally:
+            if process is not None:
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+            if mock is not None:
+                mock.shutdown()
+
+    results = {
+        "started_at": started_at,
+        "git_commit": _git_commit(),
+        "scenario": args.scenario,
+        "params": {
+            **users,
+            "duration": args.duration,
+            "count": args.count,
+            "append_batch": args.append_batch,
+            "append_interval": args.append_interval,
+            "mock_latency": None if args.url else args.mock_latency,
+            "seed_questions": None if args.url else args.seed_questions,
+        },
+        **results,
+    }
+    print_results(results)
+
+    out_dir = Path(args.out)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    out_path = out_dir / f"{time.strftime('%Y%m%d-%H%M%S')}-{args.scenario}.json"
+    out_path.write_text(codec.dumps_pretty(results) + "\n", encoding="utf-8")
+    print(f"Risultati salvati in: {out_path}")
+
+    if baseline is not None:
+        print_comparison(baseline, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,12 +6,14 @@ Generates medical exam questions using OpenAI GPT-4o-mini with automatic verific
 Usage:
     python -m ssm.generator.pipeline --input medicina.pdf --materia "Cardiologia" --count 20
     python -m ssm.generator.pipeline --materia "Pediatria" --argomento "Malattie esantematiche" --count 15
+    python -m ssm.generator.pipeline --plan piano.yaml
 """
 
 import argparse
 import asyncio
-import json
-import sys
+import signal
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Optional
 
@@ -22,17 +24,66 @@ try:
 except ImportError:
     fitz = None
 
-from . import config
+from . import codec, config
 from .prompts import (
+    GENERATION_SYSTEM_PROMPT,
     GENERATION_PROMPT,
     CONTEXT_WITH_TEXT,
     CONTEXT_WITHOUT_TEXT,
+    EXCLUSION_SECTION,
+    IMAGES_SECTION,
+    VERIFICATION_SYSTEM_PROMPT,
     VERIFICATION_PROMPT,
 )
+from .backends import Endpoint
+from .cancellation import CancelToken, JobCancelledError
+from .cleaning import CleaningStats, clean_pages
+from .images import default_image_store, extract_images_from_pdf
+from .resilience import CircuitOpenError
+from .session import ApiSession
+from .tokens import (
+    PromptBudgetError,
+    check_budget,
+    count_message_tokens,
+    count_tokens,
+    generation_output_tokens,
+    max_verification_batch,
+    truncate_to_tokens,
+    verification_output_tokens,
+)
+from .verification_cache import VerificationCache, default_verification_cache
 
 
-def extract_text_from_pdf(pdf_path: str) -> str:
-    """Extract text content from a PDF file using PyMuPDF."""
+# Bump whenever extraction or chunking output changes, to invalidate cached documents
+EXTRACTOR_VERSION = 3
+
+
+@dataclass
+class Document:
+    """Extracted text plus page boundaries and retrieval chunks as (page, start, end) offsets."""
+
+    text: str
+    pages: list[tuple[int, int, int]]
+    chunks: list[tuple[int, int, int]]
+    key: Optional[str] = None  # Extraction cache key, set when loaded through the cache
+    images: list[tuple[int, str]] = field(default_factory=list)  # (page, image_src) of extracted figures
+    cleaning: Optional[CleaningStats] = None  # What context cleaning removed, when enabled
+
+    def chunk_texts(self) -> list[str]:
+        return [self.text[start:end] for _, start, end in self.chunks]
+
+    def images_for(self, pages: Optional[set[int]] = None, batch_index: int = 0) -> list[str]:
+        """Up to IMAGES_PER_BATCH figures from ``pages`` (all pages if None), rotating by batch."""
+        candidates = list(dict.fromkeys(src for page, src in self.images if pages is None or page in pages))
+        if not candidates or config.IMAGES_PER_BATCH <= 0:
+            return []
+        start = (batch_index * config.IMAGES_PER_BATCH) % len(candidates)
+        rotated = candidates[start:] + candidates[:start]
+        return rotated[:config.IMAGES_PER_BATCH]
+
+
+def extract_pages_from_pdf(pdf_path: str) -> list[tuple[int, str]]:
+    """Extract (page number, text) pairs from a PDF file using PyMuPDF."""
     if fitz is None:
         raise ImportError("PyMuPDF is required for PDF extraction. Install with: pip install PyMuPDF")
 
@@ -40,14 +91,24 @@ def extract_text_from_pdf(pdf_path: str) -> str:
     if not path.exists():
         raise FileNotFoundError(f"PDF file not found: {pdf_path}")
 
-    text_parts = []
+    pages = []
     with fitz.open(pdf_path) as doc:
         for page_num, page in enumerate(doc):
             text = page.get_text()
             if text.strip():
-                text_parts.append(f"--- Pagina {page_num + 1} ---\n{text}")
+                pages.append((page_num + 1, text))
 
-    return "\n\n".join(text_parts)
+    return pages
+
+
+def extract_text_from_pdf(pdf_path: str) -> str:
+    """
+    Extract text content from a PDF file using PyMuPDF.
+
+    Raw text with a "--- Pagina N ---" marker per page: no cleaning and no
+    figure extraction, which only extract_document() does.
+    """
+    return build_document(extract_pages_from_pdf(pdf_path)).text
 
 
 def extract_text_from_txt(txt_path: str) -> str:
@@ -59,6 +120,87 @@ def extract_text_from_txt(txt_path: str) -> str:
     return path.read_text(encoding="utf-8")
 
 
+def _chunk_ranges(text: str, start: int, end: int, size: int) -> list[tuple[int, int]]:
+    """Split text[start:end] into ranges of at most ``size`` chars, preferring paragraph breaks."""
+    ranges = []
+    while end - start > size:
+        cut = text.rfind("\n\n", start + size // 2, start + size)
+        if cut == -1:
+            cut = text.rfind("\n", start + size // 2, start + size)
+        if cut == -1:
+            cut = start + size
+        ranges.append((start, cut))
+        start = cut
+    if text[start:end].strip():
+        ranges.append((start, end))
+    return ranges
+
+
+def build_document(pages: list[tuple[int, str]], page_markers: bool = True) -> Document:
+    """Join page texts into a Document, recording page and chunk offsets."""
+    parts = []
+    page_ranges = []
+    offset = 0
+    for page_num, page_text in pages:
+        if parts:
+            parts.append("\n\n")
+            offset += 2
+        part = f"--- Pagina {page_num} ---\n{page_text}" if page_markers else page_text
+        parts.append(part)
+        page_ranges.append((page_num, offset, offset + len(part)))
+        offset += len(part)
+
+    text = "".join(parts)
+    chunks = [
+        (page_num, chunk_start, chunk_end)
+        for page_num, start, end in page_ranges
+        for chunk_start, chunk_end in _chunk_ranges(text, start, end, config.CHUNK_SIZE_CHARS)
+    ]
+    return Document(text=text, pages=page_ranges, chunks=chunks)
+
+
+def build_clean_document(pages: list[tuple[int, str]], page_markers: bool = True) -> Document:
+    """
+    build_document() over cleaned page text, recording the tokens saved.
+
+    Page markers are dropped along with the rest of the boilerplate: page
+    offsets are kept in ``Document.pages`` either way.
+    """
+    if not config.CONTEXT_CLEANING_ENABLED:
+        return build_document(pages, page_markers)
+
+    cleaned, stats = clean_pages(pages)
+    if not cleaned:
+        # Nothing but boilerplate is still better than no context at all
+        return build_document(pages, page_markers)
+    document = build_document(cleaned, page_markers=False)
+    stats.tokens_before = count_tokens(build_document(pages, page_markers).text)
+    stats.tokens_after = count_tokens(document.text)
+    document.cleaning = stats
+    return document
+
+
+def extract_document(file_path: str) -> Document:
+    """Extract a Document (text, pages and chunks) from a PDF or TXT file."""
+    path = Path(file_path)
+    ext = path.suffix.lower()
+
+    if ext == ".pdf":
+        document = build_clean_document(extract_pages_from_pdf(file_path))
+        if config.IMAGE_EXTRACTION_ENABLED:
+            document.images = extract_images_from_pdf(file_path)
+        return document
+    elif ext == ".txt":
+        # Form feeds mark page breaks in text exported from PDFs
+        raw = extract_text_from_txt(file_path)
+        pages = [(i, page) for i, page in enumerate(raw.split("\f"), start=1)]
+        if len(pages) == 1:
+            return build_clean_document(pages, page_markers=False)
+        return build_clean_document([p for p in pages if p[1].strip()])
+    else:
+        raise ValueError(f"Unsupported file format: {ext}. Use .pdf or .txt")
+
+
 def extract_text(file_path: str) -> str:
     """Extract text from PDF or TXT file based on extension."""
     path = Path(file_path)
@@ -76,44 +218,134 @@ async def call_openai_api(
     client: httpx.AsyncClient,
     messages: list[dict],
     max_retries: int = config.MAX_RETRIES,
+    session: Optional[ApiSession] = None,
+    max_tokens: int = config.MAX_OUTPUT_TOKENS,
 ) -> str:
-    """Make an async call to OpenAI API with retry logic."""
-    headers = {
-        "Authorization": f"Bearer {config.OPENAI_API_KEY}",
-        "Content-Type": "application/json",
-    }
-
-    payload = {
-        "model": config.OPENAI_MODEL,
-        "messages": messages,
-        "temperature": 0.7,
-        "max_tokens": 4096,
-    }
+    """
+    Make an async call to OpenAI API with retry logic, optional hedging and circuit breaking.
+
+    Credentials, model and limits come from ``session`` (built from config when
+    omitted). With an endpoint pool each attempt is routed to the least-loaded
+    healthy endpoint, so retries fail over. Raises PromptBudgetError without
+    calling the API when the prompt plus ``max_tokens`` cannot fit the model,
+    and JobCancelledError (abandoning the request in flight) once the
+    session's cancel token fires.
+    """
+    if session is None:
+        session = ApiSession.from_config()
+    usage, hedger, breaker, pool, cancel = session.usage, session.hedger, session.breaker, session.pool, session.cancel
+
+    input_tokens = count_message_tokens(messages, session.model)
+    check_budget(input_tokens, max_tokens)
+    # Reservation against per-endpoint token limits
+    estimated_tokens = input_tokens + max_tokens
+
+    def is_healthy(error: Exception) -> bool:
+        """False for errors that say the endpoint is struggling (rate limits, 5xx, network)."""
+        if isinstance(error, httpx.HTTPStatusError):
+            status = error.response.status_code
+            return not (status == 429 or status >= 500)
+        return not isinstance(error, httpx.TransportError)
+
+    async def post(base_url: str, api_key: str, model: str) -> dict:
+        started = time.monotonic()
+        response = await client.post(
+            f"{base_url}/chat/completions",
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json",
+            },
+            content=codec.dumps_line({
+                "model": model,
+                "messages": messages,
+                "temperature": 0.7,
+                "max_tokens": max_tokens,
+            }).encode("utf-8"),
+            timeout=60.0,
+        )
+        response.raise_for_status()
+        data = codec.loads(response.content)
+        usage.record(data.get("usage") or {}, time.monotonic() - started)
+        return data
+
+    async def hedge(primary: Optional[Endpoint]) -> dict:
+        """The hedged duplicate: paced and counted like any request, on another endpoint if possible."""
+        if pool is None:
+            await session.limiter.acquire()
+            return await post(session.base_url, session.api_key, session.model)
+
+        endpoint = await pool.acquire(estimated_tokens, avoid=primary)
+        started = time.monotonic()
+        try:
+            data = await post(endpoint.base_url, endpoint.api_key, endpoint.model)
+        except asyncio.CancelledError:
+            pool.abandon(endpoint)  # The primary won
+            raise
+        except Exception as e:
+            pool.release(endpoint, is_healthy(e), time.monotonic() - started)
+            raise
+        pool.release(endpoint, True, time.monotonic() - started)
+        return data
 
     for attempt in range(max_retries):
+        cancel.check()
+        endpoint = None
+        started = time.monotonic()
+        healthy = True
+        outcome_known = False
         try:
-            response = await client.post(
-                f"{config.OPENAI_BASE_URL}/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=60.0,
-            )
-            response.raise_for_status()
-            data = response.json()
+            # Fails fast (no retries) while the provider is known to be down
+            if breaker is not None:
+                breaker.check()
+            if pool is not None:
+                endpoint = await cancel.guard(pool.acquire(estimated_tokens))
+                target = (endpoint.base_url, endpoint.api_key, endpoint.model)
+            else:
+                target = (session.base_url, session.api_key, session.model)
+
+            started = time.monotonic()
+            outcome_known = True
+            if hedger is not None:
+                requests = iter([lambda: post(*target), lambda: hedge(endpoint)])
+                data = await cancel.guard(hedger.run(lambda: next(requests)()))
+            else:
+                data = await cancel.guard(post(*target))
             return data["choices"][0]["message"]["content"]
+        except (JobCancelledError, asyncio.CancelledError):
+            # Abandoned: the slot and any half-open probe go back without an outcome
+            outcome_known = False
+            if breaker is not None:
+                breaker.abandon()
+            if endpoint is not None:
+                pool.abandon(endpoint)
+            raise
+        except CircuitOpenError:
+            outcome_known = False
+            raise
         except httpx.HTTPStatusError as e:
-            if e.response.status_code == 429:  # Rate limit
-                wait_time = config.RETRY_DELAY_SECONDS * (attempt + 1)
-                print(f"Rate limited, waiting {wait_time}s...")
-                await asyncio.sleep(wait_time)
+            status = e.response.status_code
+            healthy = is_healthy(e)
+            if status == 429:  # Rate limit
+                # With several endpoints the retry goes straight to another one
+                if pool is None or len(pool.endpoints) == 1:
+                    wait_time = config.RETRY_DELAY_SECONDS * (attempt + 1)
+                    print(f"Rate limited, waiting {wait_time}s...")
+                    await cancel.sleep(wait_time)
             elif attempt == max_retries - 1:
                 raise
             else:
-                await asyncio.sleep(config.RETRY_DELAY_SECONDS)
+                await cancel.sleep(config.RETRY_DELAY_SECONDS)
         except Exception as e:
+            healthy = is_healthy(e)
             if attempt == max_retries - 1:
                 raise
-            await asyncio.sleep(config.RETRY_DELAY_SECONDS)
+            await cancel.sleep(config.RETRY_DELAY_SECONDS)
+        finally:
+            if outcome_known:
+                if breaker is not None:
+                    breaker.record(healthy)
+                if endpoint is not None:
+                    pool.release(endpoint, healthy, time.monotonic() - started)
 
     raise RuntimeError("Max retries exceeded")
 
@@ -132,7 +364,7 @@ def parse_json_response(response: str) -> list[dict]:
             lines = lines[:-1]
         content = "\n".join(lines)
 
-    return json.loads(content)
+    return codec.loads(content)
 
 
 async def generate_questions_batch(
@@ -141,51 +373,162 @@ async def generate_questions_batch(
     argomento: str,
     count: int,
     context_text: Optional[str] = None,
+    session: Optional[ApiSession] = None,
+    exclude: Optional[list[str]] = None,
+    images: Optional[list[str]] = None,
 ) -> list[dict]:
-    """Generate a batch of questions using OpenAI API."""
+    """
+    Generate a batch of questions using OpenAI API.
+
+    ``exclude`` lists keyphrases of questions already covered, which the
+    model is asked not to repeat. ``images`` are image_src values of stored
+    figures, attached to the prompt so questions can be built on them; an
+    image_src the model invents is dropped. The context is cut to whatever fits both
+    CONTEXT_MAX_TOKENS and the input budget left by the instructions; a batch
+    whose answer cannot fit in MAX_OUTPUT_TOKENS is refused with
+    PromptBudgetError.
+    """
+    model = session.model if session is not None else config.OPENAI_MODEL
+    output_tokens = generation_output_tokens(count)
+    exclusion_section = EXCLUSION_SECTION.format(items="\n".join(f"- {e}" for e in exclude)) if exclude else ""
+    store = default_image_store()
+    # A cached document may name figures deleted from (or never copied to) this store
+    images = [src for src in images or [] if store.path_for(src).exists()]
+    images_section = IMAGES_SECTION.format(
+        items="\n".join(f"- Figura {i}: {src}" for i, src in enumerate(images, start=1))
+    ) if images else ""
+    image_parts = [
+        {"type": "image_url", "image_url": {"url": store.data_url(src), "detail": "low"}}
+        for src in images
+    ]
+
+    def build_messages(context_section: str) -> list[dict]:
+        prompt = GENERATION_PROMPT.format(
+            materia=materia,
+            argomento=argomento,
+            count=count,
+            context_section=context_section,
+            images_section=images_section,
+            exclusion_section=exclusion_section,
+        )
+        content = [{"type": "text", "text": prompt}, *image_parts] if image_parts else prompt
+        return [
+            {"role": "system", "content": GENERATION_SYSTEM_PROMPT},
+            {"role": "user", "content": content},
+        ]
 
     if context_text:
-        context_section = CONTEXT_WITH_TEXT.format(text=context_text[:8000])  # Limit context size
+        base_tokens = count_message_tokens(build_messages(CONTEXT_WITH_TEXT.format(text="")), model)
+        context_budget = min(
+            config.CONTEXT_MAX_TOKENS,
+            config.MAX_INPUT_TOKENS - base_tokens,
+            config.MODEL_CONTEXT_TOKENS - base_tokens - output_tokens,
+        )
+        if context_budget <= 0:
+            raise PromptBudgetError(f"No room for source text: instructions alone take {base_tokens} tokens")
+        messages = build_messages(CONTEXT_WITH_TEXT.format(text=truncate_to_tokens(context_text, context_budget, model)))
     else:
-        context_section = CONTEXT_WITHOUT_TEXT
+        messages = build_messages(CONTEXT_WITHOUT_TEXT)
 
-    prompt = GENERATION_PROMPT.format(
-        materia=materia,
-        argomento=argomento,
-        count=count,
-        context_section=context_section,
-    )
-
-    messages = [
-        {"role": "system", "content": "Sei un generatore di domande mediche per il concorso SSM. Rispondi sempre con JSON valido."},
-        {"role": "user", "content": prompt},
-    ]
-
-    response = await call_openai_api(client, messages)
+    response = await call_openai_api(client, messages, session=session, max_tokens=output_tokens)
     questions = parse_json_response(response)
 
+    for question in questions:
+        if not isinstance(question, dict):
+            continue
+        if question.get("has_image") and question.get("image_src") in images:
+            continue
+        question["has_image"] = False
+        question["image_src"] = None
+
     return questions
 
 
+def _verdicts_by_position(verifications: list[dict], count: int) -> tuple[dict[int, dict], bool]:
+    """
+    Map verifier output to 0-based positions, whether it numbered from 0 or 1.
+
+    The numbering is only known when index 0 or index ``count`` is present;
+    otherwise (e.g. 1..count-1) no verdict is used. The flag is True when
+    every position got exactly one verdict, the only case safe to cache.
+    """
+    verdicts = [v for v in verifications if isinstance(v, dict) and isinstance(v.get("domanda_index"), int)]
+    indexes = {v["domanda_index"] for v in verdicts}
+    if 0 in indexes and count not in indexes:
+        offset = 0
+    elif count in indexes and 0 not in indexes:
+        offset = 1
+    else:
+        return {}, False
+
+    by_position = {}
+    for v in verdicts:
+        position = v["domanda_index"] - offset
+        if 0 <= position < count:
+            by_position[position] = v
+    return by_position, len(by_position) == count == len(verdicts)
+
+
 async def verify_questions(
     client: httpx.AsyncClient,
     questions: list[dict],
+    session: Optional[ApiSession] = None,
+    cache: Optional[VerificationCache] = None,
 ) -> list[dict]:
-    """Verify questions using OpenAI self-check."""
+    """
+    Verify questions using OpenAI self-check.
+
+    Questions the verifier gave no usable verdict for are left out of the
+    result; filter_valid_questions() drops them.
+
+    Verdicts already in the verification cache are reused; only the misses
+    are sent to the verifier, in calls of at most max_verification_batch()
+    questions, each paced by the session's rate limiter. Returned verdicts
+    use 0-based domanda_index. A failed call raises, after the verdicts of
+    earlier calls have been cached.
+    """
     if not questions:
         return []
 
-    prompt = VERIFICATION_PROMPT.format(
-        questions_json=json.dumps(questions, ensure_ascii=False, indent=2)
-    )
-
-    messages = [
-        {"role": "system", "content": "Sei un revisore esperto di domande mediche. Rispondi sempre con JSON valido."},
-        {"role": "user", "content": prompt},
-    ]
-
-    response = await call_openai_api(client, messages)
-    verifications = parse_json_response(response)
+    if session is None:
+        session = ApiSession.from_config()
+    if cache is None:
+        cache = default_verification_cache()
+
+    keys = [VerificationCache.key_for(q, session.model_label) for q in questions] if cache else []
+    cached = cache.get_many(keys) if cache else {}
+    misses = [i for i in range(len(questions)) if not cache or keys[i] not in cached]
+
+    fresh = {}
+    chunk_size = max_verification_batch()
+    for start in range(0, len(misses), chunk_size):
+        chunk = misses[start:start + chunk_size]
+        prompt = VERIFICATION_PROMPT.format(
+            questions_json=codec.dumps_pretty([questions[i] for i in chunk])
+        )
+
+        messages = [
+            {"role": "system", "content": VERIFICATION_SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ]
+
+        await session.cancel.guard(session.limiter.acquire())
+        response = await call_openai_api(
+            client, messages, session=session, max_tokens=verification_output_tokens(len(chunk))
+        )
+        by_position, complete = _verdicts_by_position(parse_json_response(response), len(chunk))
+        chunk_verdicts = {chunk[pos]: v for pos, v in by_position.items()}
+        fresh.update(chunk_verdicts)
+
+        # A partial answer may be misaligned; never persist it against the questions' hashes
+        if cache and complete:
+            cache.put_many({keys[i]: v for i, v in chunk_verdicts.items()})
+
+    verifications = []
+    for i in range(len(questions)):
+        verdict = cached.get(keys[i]) if cache and keys[i] in cached else fresh.get(i)
+        if verdict is not None:
+            verifications.append({**verdict, "domanda_index": i})
 
     return verifications
 
@@ -194,7 +537,7 @@ def filter_valid_questions(
     questions: list[dict],
     verifications: list[dict],
 ) -> list[dict]:
-    """Filter out questions that failed verification."""
+    """Filter out questions that failed verification or got no verdict (0-based domanda_index)."""
     valid_questions = []
 
     # Create a map of verification results by index
@@ -204,9 +547,11 @@ def filter_valid_questions(
         verification_map[idx] = v
 
     for i, question in enumerate(questions):
-        verification = verification_map.get(i, verification_map.get(i + 1))  # Handle 0 or 1-based indexing
+        verification = verification_map.get(i)
 
-        if verification is None or verification.get("is_valid", True):
+        if verification is None:
+            print(f"  [NON VERIFICATA] Domanda {i + 1}: nessun verdetto")
+        elif verification.get("is_valid", True):
             valid_questions.append(question)
         else:
             issues = verification.get("issues", [])
@@ -216,30 +561,16 @@ def filter_valid_questions(
 
 
 def validate_question_structure(question: dict) -> bool:
-    """Validate that a question has the correct structure."""
-    required_fields = ["materia", "domanda", "risposte", "risposta_corretta_text", "commento"]
-
-    for field in required_fields:
-        if field not in question:
-            return False
-
-    risposte = question.get("risposte", [])
-    if len(risposte) != 5:
-        return False
-
-    correct_count = sum(1 for r in risposte if r.get("isCorrect", False))
-    if correct_count != 1:
-        return False
+    """Validate that a question has the correct structure and field types."""
+    return codec.is_question(question)
 
-    return True
 
-
-def save_jsonl(questions: list[dict], output_path: str) -> int:
+def save_jsonl(questions: list[dict], output_path: str, append: bool = False) -> int:
     """Save questions to JSONL format."""
     path = Path(output_path)
 
     valid_count = 0
-    with path.open("w", encoding="utf-8") as f:
+    with path.open("a" if append else "w", encoding="utf-8") as f:
         for question in questions:
             # Ensure required fields with defaults
             question.setdefault("has_image", False)
@@ -247,7 +578,7 @@ def save_jsonl(questions: list[dict], output_path: str) -> int:
             question.setdefault("argomenti", question.get("materia", ""))
 
             if validate_question_structure(question):
-                f.write(json.dumps(question, ensure_ascii=False) + "\n")
+                f.write(codec.dumps_line(question) + "\n")
                 valid_count += 1
             else:
                 print(f"  [SKIP] Struttura invalida: {question.get('domanda', 'N/A')[:50]}...")
@@ -262,83 +593,17 @@ async def run_pipeline(
     count: int,
     output_file: str,
     skip_verification: bool = False,
+    session: Optional[ApiSession] = None,
 ) -> None:
-    """Run the complete question generation pipeline."""
-
-    if not config.OPENAI_API_KEY:
-        print("ERRORE: OPENAI_API_KEY non configurata.")
-        print("Imposta la variabile d'ambiente o crea un file .env")
-        sys.exit(1)
-
-    # Extract context text if input file provided
-    context_text = None
-    if input_file:
-        print(f"Estrazione testo da: {input_file}")
-        context_text = extract_text(input_file)
-        print(f"  Estratti {len(context_text)} caratteri")
-
-    # Use materia as argomento if not specified
-    if not argomento:
-        argomento = materia
-
-    print(f"\nGenerazione di {count} domande...")
-    print(f"  Materia: {materia}")
-    print(f"  Argomento: {argomento}")
-
-    all_questions = []
-
-    async with httpx.AsyncClient() as client:
-        # Generate questions in batches
-        remaining = count
-        batch_num = 0
-
-        while remaining > 0:
-            batch_size = min(remaining, config.DEFAULT_BATCH_SIZE)
-            batch_num += 1
-
-            print(f"\n  Batch {batch_num}: generazione {batch_size} domande...")
-
-            try:
-                questions = await generate_questions_batch(
-                    client,
-                    materia=materia,
-                    argomento=argomento,
-                    count=batch_size,
-                    context_text=context_text,
-                )
-                print(f"    Generate {len(questions)} domande")
-                all_questions.extend(questions)
-            except Exception as e:
-                print(f"    ERRORE: {e}")
-
-            remaining -= batch_size
-
-            if remaining > 0:
-                await asyncio.sleep(config.RATE_LIMIT_DELAY_SECONDS)
-
-        # Verify questions
-        if not skip_verification and all_questions:
-            print(f"\nVerifica delle {len(all_questions)} domande generate...")
-
-            try:
-                verifications = await verify_questions(client, all_questions)
-                all_questions = filter_valid_questions(all_questions, verifications)
-                print(f"  Domande valide dopo verifica: {len(all_questions)}")
-            except Exception as e:
-                print(f"  ATTENZIONE: Verifica fallita ({e}), mantengo tutte le domande")
-
-    # Save to JSONL
-    print(f"\nSalvataggio in: {output_file}")
-    saved_count = save_jsonl(all_questions, output_file)
-    print(f"  Salvate {saved_count} domande valide")
-
-    # Summary
-    print(f"\n{'=' * 50}")
-    print(f"COMPLETATO")
-    print(f"  Domande richieste: {count}")
-    print(f"  Domande generate: {len(all_questions)}")
-    print(f"  Domande salvate: {saved_count}")
-    print(f"  Output: {output_file}")
+    """Run the complete question generation pipeline for a single materia."""
+    from .plan import Plan, PlanEntry, run_plan
+
+    plan = Plan(
+        entries=[PlanEntry(materia=materia, argomento=argomento, count=count, input_file=input_file)],
+        output_file=output_file,
+        skip_verification=skip_verification,
+    )
+    await run_plan(plan, session=session)
 
 
 def main():
@@ -350,6 +615,7 @@ Esempi:
   python -m ssm.generator.pipeline --input medicina.pdf --materia "Cardiologia" --count 20
   python -m ssm.generator.pipeline --materia "Pediatria" --argomento "Malattie esantematiche" --count 15
   python -m ssm.generator.pipeline --input capitolo.txt --materia "Gastroenterologia" --count 10
+  python -m ssm.generator.pipeline --plan piano.yaml --output domande.jsonl
         """
     )
 
@@ -359,10 +625,16 @@ Esempi:
         default=None,
         help="File PDF o TXT da cui estrarre il contesto (opzionale)"
     )
+    parser.add_argument(
+        "--plan", "-p",
+        type=str,
+        default=None,
+        help="File di piano JSON/YAML/TOML con più materie da generare in un'unica esecuzione"
+    )
     parser.add_argument(
         "--materia", "-m",
         type=str,
-        required=True,
+        default=None,
         help="Materia delle domande (es. Cardiologia, Pediatria)"
     )
     parser.add_argument(
@@ -380,7 +652,7 @@ Esempi:
     parser.add_argument(
         "--output", "-o",
         type=str,
-        default=config.DEFAULT_OUTPUT_FILE,
+        default=None,
         help=f"File output JSONL (default: {config.DEFAULT_OUTPUT_FILE})"
     )
     parser.add_argument(
@@ -388,18 +660,76 @@ Esempi:
         action="store_true",
         help="Salta la fase di verifica delle domande"
     )
+    parser.add_argument(
+        "--endpoints",
+        type=str,
+        default=config.OPENAI_ENDPOINTS_FILE,
+        help="File JSON/YAML con più endpoint/chiavi API tra cui distribuire le richieste"
+    )
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="Invia una richiesta duplicata quando la prima supera il p95 di latenza"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Non usare le cache locali (testo estratto, verdetti di verifica e tassi di accettazione)"
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        default=None,
+        help="Tempo massimo in secondi: allo scadere non parte nessuna nuova richiesta e si salva quanto già accettato"
+    )
 
     args = parser.parse_args()
 
+    if args.no_cache:
+        config.EXTRACTION_CACHE_ENABLED = False
+        config.VERIFICATION_CACHE_ENABLED = False
+        config.ACCEPTANCE_CACHE_ENABLED = False
+    if args.hedge:
+        config.HEDGE_ENABLED = True
+    config.OPENAI_ENDPOINTS_FILE = args.endpoints
+
+    if not args.plan and not args.materia:
+        parser.error("--materia è obbligatorio se non si usa --plan")
+
+    session = ApiSession.from_config(cancel=CancelToken(args.deadline))
+    install_interrupt_handler(session.cancel)
+
+    if args.plan:
+        from .plan import load_plan, run_plan
+
+        plan = load_plan(args.plan, output_file=args.output)
+        if args.skip_verification:
+            plan.skip_verification = True
+        asyncio.run(run_plan(plan, session=session))
+        return
+
     asyncio.run(run_pipeline(
         input_file=args.input,
         materia=args.materia,
         argomento=args.argomento,
         count=args.count,
-        output_file=args.output,
+        output_file=args.output or config.DEFAULT_OUTPUT_FILE,
         skip_verification=args.skip_verification,
+        session=session,
     ))
 
 
+def install_interrupt_handler(cancel: CancelToken) -> None:
+    """First Ctrl+C cancels the run (accepted questions are still saved), a second one aborts."""
+
+    def handle(signum, frame):
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        print("\nInterruzione: nessuna nuova richiesta, salvo le domande già accettate "
+              "(Ctrl+C di nuovo per uscire subito)")
+        cancel.cancel("interrotto dall'utente")
+
+    signal.signal(signal.SIGINT, handle)
+
+
 if __name__ == "__main__":
     main()
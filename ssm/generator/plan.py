@@ -0,0 +1,507 @@
+"""
+Multi-materia generation plans.
+
+A plan lists several materia/argomento/count entries that are executed by a
+single process, sharing the HTTP client, the concurrency limit, the rate
+limiter, the extracted-text cache and the output file.
+
+Plan file example (JSON, YAML or TOML):
+
+    output: domande_generate.jsonl
+    concurrency: 3
+    entries:
+      - materia: Cardiologia e Chirurgia Cardiovascolare
+        argomento: Scompenso cardiaco
+        count: 20
+        input: cardiologia.pdf
+      - materia: Pediatria
+        count: 10
+
+Usage:
+    python -m ssm.generator.pipeline --plan piano.yaml
+"""
+
+import asyncio
+import json
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+import httpx
+
+try:
+    import yaml  # PyYAML
+except ImportError:
+    yaml = None
+
+from . import config
+from .acceptance import AcceptanceTracker, speculative_count
+from .bank import default_bank_path
+from .cancellation import JobCancelledError
+from .diversity import digest_key, load_bank_digests
+from .extraction_cache import load_document
+from .pipeline import (
+    Document,
+    filter_valid_questions,
+    generate_questions_batch,
+    save_jsonl,
+    verify_questions,
+)
+from .retrieval import BM25Index, load_index, select_context
+from .rules import filter_by_rules
+from .session import ApiSession
+from .tokens import max_batch_size
+from .verification_cache import default_verification_cache
+
+
+@dataclass
+class PlanEntry:
+    """A single materia/argomento job inside a plan."""
+
+    materia: str
+    count: int = config.DEFAULT_COUNT
+    argomento: Optional[str] = None
+    input_file: Optional[str] = None
+    output_file: Optional[str] = None
+
+    def __post_init__(self):
+        if not self.argomento:
+            self.argomento = self.materia
+
+    @property
+    def label(self) -> str:
+        if self.argomento == self.materia:
+            return self.materia
+        return f"{self.materia} / {self.argomento}"
+
+
+@dataclass
+class Plan:
+    """A list of entries plus the settings they share."""
+
+    entries: list[PlanEntry]
+    output_file: str = config.DEFAULT_OUTPUT_FILE
+    concurrency: int = config.MAX_CONCURRENCY
+    skip_verification: bool = False
+
+
+@dataclass
+class EntryMetrics:
+    """Progress counters reported for each plan entry."""
+
+    requested: int
+    batches: int = 0
+    failed_batches: int = 0
+    generated: int = 0
+    passed_rules: int = 0
+    verified: int = 0
+    saved: int = 0
+    elapsed: float = 0.0
+    topup_rounds: int = 0
+    surplus: int = 0
+    duplicates: int = 0
+    unverified: int = 0  # Dropped because verification failed or the job was cancelled first
+    rule_rejections: Counter = field(default_factory=Counter)
+    questions: list[dict] = field(default_factory=list, repr=False)
+
+
+def _read_plan_data(path: Path):
+    ext = path.suffix.lower()
+    raw = path.read_text(encoding="utf-8")
+
+    if ext == ".json":
+        return json.loads(raw)
+    if ext in (".yaml", ".yml"):
+        if yaml is None:
+            raise ImportError("PyYAML is required for YAML plans. Install with: pip install PyYAML")
+        return yaml.safe_load(raw)
+    if ext == ".toml":
+        import tomllib
+        return tomllib.loads(raw)
+
+    raise ValueError(f"Unsupported plan format: {ext}. Use .json, .yaml or .toml")
+
+
+def parse_plan(data, output_file: Optional[str] = None) -> Plan:
+    """Build a Plan from already-decoded plan data (a dict or a list of entries)."""
+    if isinstance(data, list):
+        data = {"entries": data}
+    if not isinstance(data, dict):
+        raise ValueError("Plan must be a mapping or a list of entries")
+
+    raw_entries = data.get("entries") or []
+    if not raw_entries:
+        raise ValueError("Plan has no entries")
+
+    entries = []
+    for i, raw in enumerate(raw_entries, start=1):
+        if not raw.get("materia"):
+            raise ValueError(f"Plan entry {i} is missing 'materia'")
+        entries.append(PlanEntry(
+            materia=raw["materia"],
+            argomento=raw.get("argomento"),
+            count=int(raw.get("count", config.DEFAULT_COUNT)),
+            input_file=raw.get("input") or raw.get("source"),
+            output_file=raw.get("output"),
+        ))
+
+    return Plan(
+        entries=entries,
+        output_file=output_file or data.get("output") or config.DEFAULT_OUTPUT_FILE,
+        concurrency=int(data.get("concurrency", config.MAX_CONCURRENCY)),
+        skip_verification=bool(data.get("skip_verification", False)),
+    )
+
+
+def load_plan(plan_path: str, output_file: Optional[str] = None) -> Plan:
+    """Load a plan file (.json, .yaml/.yml or .toml)."""
+    path = Path(plan_path)
+    if not path.exists():
+        raise FileNotFoundError(f"Plan file not found: {plan_path}")
+
+    return parse_plan(_read_plan_data(path), output_file=output_file)
+
+
+def plan_to_data(plan: Plan) -> dict:
+    """Inverse of parse_plan: the plain data written to a plan file."""
+    entries = []
+    for entry in plan.entries:
+        raw = {"materia": entry.materia}
+        if entry.argomento != entry.materia:
+            raw["argomento"] = entry.argomento
+        raw["count"] = entry.count
+        if entry.input_file:
+            raw["input"] = entry.input_file
+        if entry.output_file:
+            raw["output"] = entry.output_file
+        entries.append(raw)
+
+    data = {"output": plan.output_file, "concurrency": plan.concurrency}
+    if plan.skip_verification:
+        data["skip_verification"] = True
+    data["entries"] = entries
+    return data
+
+
+def save_plan(plan: Plan, plan_path: str) -> None:
+    """Write a plan as .json or .yaml/.yml, loadable with load_plan."""
+    path = Path(plan_path)
+    data = plan_to_data(plan)
+    if path.suffix.lower() in (".yaml", ".yml"):
+        if yaml is None:
+            raise ImportError("PyYAML is required for YAML plans. Install with: pip install PyYAML")
+        text = yaml.safe_dump(data, allow_unicode=True, sort_keys=False)
+    elif path.suffix.lower() == ".json":
+        text = json.dumps(data, ensure_ascii=False, indent=2) + "\n"
+    else:
+        raise ValueError(f"Unsupported plan format: {path.suffix}. Use .json or .yaml")
+    path.write_text(text, encoding="utf-8")
+
+
+def interleave(queues: list[list]) -> list:
+    """Round-robin merge of several lists: a1, b1, c1, a2, b2, ..."""
+    merged = []
+    longest = max((len(q) for q in queues), default=0)
+    for i in range(longest):
+        for q in queues:
+            if i < len(q):
+                merged.append(q[i])
+    return merged
+
+
+def split_batches(count: int, batch_size: int = config.DEFAULT_BATCH_SIZE) -> list[int]:
+    """Split a question count into batch sizes of at most ``batch_size`` (capped by the output budget)."""
+    batch_size = min(batch_size, max_batch_size())
+    sizes = []
+    remaining = count
+    while remaining > 0:
+        sizes.append(min(remaining, batch_size))
+        remaining -= batch_size
+    return sizes
+
+
+class _ContextCache:
+    """Load each input file and its retrieval index once per run, off the event loop."""
+
+    def __init__(self):
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._indexes: dict[int, asyncio.Task] = {}
+
+    async def get(self, input_file: Optional[str]) -> Optional[Document]:
+        if not input_file:
+            return None
+
+        key = str(Path(input_file).resolve())
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._load(input_file))
+        return await self._tasks[key]
+
+    @staticmethod
+    async def _load(input_file: str) -> Document:
+        print(f"Estrazione testo da: {input_file}")
+        document = await asyncio.to_thread(load_document, input_file)
+        print(f"  Estratti {len(document.text)} caratteri")
+        if document.cleaning is not None:
+            print(f"  {document.cleaning.summary()}")
+        return document
+
+    async def context_for(self, document: Document, entry: PlanEntry, batch_index: int) -> tuple[str, Optional[set[int]]]:
+        """
+        Source text for one batch and the pages it comes from (None for the whole document).
+
+        BM25-selected chunks when a specific argomento is set.
+        """
+        if entry.argomento == entry.materia:
+            return document.text, None
+
+        if id(document) not in self._indexes:
+            self._indexes[id(document)] = asyncio.create_task(asyncio.to_thread(load_index, document))
+        index: BM25Index = await self._indexes[id(document)]
+        return select_context(document, index, entry.argomento, batch_index=batch_index)
+
+
+async def run_plan(plan: Plan, session: Optional[ApiSession] = None) -> list[EntryMetrics]:
+    """Execute every entry of a plan with shared concurrency, caching and output."""
+
+    if session is None:
+        session = ApiSession.from_config()
+
+    if not session.has_credentials:
+        print("ERRORE: OPENAI_API_KEY non configurata.")
+        print("Imposta la variabile d'ambiente o crea un file .env")
+        sys.exit(1)
+
+    # With a pool, concurrency scales with the endpoints and each one paces itself
+    concurrency = max(1, plan.concurrency) * session.endpoint_count
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = session.limiter
+    breaker = session.breaker
+    cancel = session.cancel
+    contexts = _ContextCache()
+    metrics = [EntryMetrics(requested=entry.count) for entry in plan.entries]
+    acceptance = AcceptanceTracker(persist=config.ACCEPTANCE_CACHE_ENABLED)
+    verification_cache = default_verification_cache()
+    digests = {}
+    if config.DIVERSITY_ENABLED:
+        # Entries sharing a materia/argomento share a digest, seeded from the bank
+        keys = {digest_key(entry.materia, entry.argomento) for entry in plan.entries}
+        digests = await asyncio.to_thread(load_bank_digests, default_bank_path(), keys)
+    started = time.monotonic()
+
+    print(f"\nPiano: {len(plan.entries)} voci, {sum(e.count for e in plan.entries)} domande, "
+          f"concorrenza {concurrency}" + (f", {session.endpoint_count} endpoint" if session.pool else ""))
+
+    async with httpx.AsyncClient() as client:
+
+        async def run_batch(idx: int, batch_num: int, batch_size: int) -> list[dict]:
+            entry = plan.entries[idx]
+            digest = digests.get(digest_key(entry.materia, entry.argomento))
+            try:
+                document = await contexts.get(entry.input_file)
+                context_text = None
+                images = []
+                if document is not None:
+                    context_text, pages = await contexts.context_for(document, entry, batch_num - 1)
+                    images = document.images_for(pages, batch_num - 1)
+
+                if breaker is not None:
+                    await cancel.guard(breaker.wait_ready())
+                async with semaphore:
+                    # Batches queued behind the semaphore leave without calling the API
+                    cancel.check()
+                    await cancel.guard(limiter.acquire())
+                    # Built only now, so it includes batches that finished while this one waited
+                    questions = await generate_questions_batch(
+                        client,
+                        materia=entry.materia,
+                        argomento=entry.argomento,
+                        count=batch_size,
+                        context_text=context_text,
+                        session=session,
+                        exclude=digest.exclusions() if digest else None,
+                        images=images,
+                    )
+            except JobCancelledError:
+                return []
+            except Exception as e:
+                metrics[idx].failed_batches += 1
+                print(f"  [{entry.label}] Batch {batch_num}: ERRORE: {e}")
+                return []
+
+            print(f"  [{entry.label}] Batch {batch_num}: generate {len(questions)} domande")
+            metrics[idx].generated += len(questions)
+
+            questions, rejections = filter_by_rules(questions)
+            metrics[idx].rule_rejections.update(rejections)
+            return questions
+
+        # Over-generate the first round from each materia's historical acceptance
+        # rate, so the requested count usually arrives without a second round.
+        first_round = [
+            speculative_count(entry.count, acceptance.rate(entry.materia)) for entry in plan.entries
+        ]
+        next_batch = [1] * len(plan.entries)
+
+        def schedule(idx: int, count: int) -> list[asyncio.Task]:
+            tasks = []
+            for size in split_batches(count):
+                tasks.append(asyncio.create_task(run_batch(idx, next_batch[idx], size)))
+                next_batch[idx] += 1
+            metrics[idx].batches += len(tasks)
+            return tasks
+
+        # Create every first-round task up front, round-robin across entries, so the
+        # semaphore hands out slots fairly and no entry waits for another to finish.
+        per_entry_jobs = [
+            [(idx, size) for size in split_batches(count)]
+            for idx, count in enumerate(first_round)
+        ]
+        batch_tasks: list[list[asyncio.Task]] = [[] for _ in plan.entries]
+        for idx, size in interleave(per_entry_jobs):
+            batch_tasks[idx].extend(schedule(idx, size))
+
+        async def collect_round(idx: int, tasks: list[asyncio.Task]) -> list[dict]:
+            """Wait for a round's batches, then verify what passed the local rules and the digest."""
+            entry = plan.entries[idx]
+            entry_metrics = metrics[idx]
+            digest = digests.get(digest_key(entry.materia, entry.argomento))
+
+            questions = []
+            for result in await asyncio.gather(*tasks):
+                questions.extend(result)
+            if digest is not None:
+                unique = digest.filter_new(questions)
+                if len(unique) < len(questions):
+                    print(f"  [{entry.label}] {len(questions) - len(unique)} duplicati scartati")
+                entry_metrics.duplicates += len(questions) - len(unique)
+                questions = unique
+            entry_metrics.passed_rules += len(questions)
+
+            if not plan.skip_verification and questions:
+                try:
+                    if breaker is not None:
+                        await cancel.guard(breaker.wait_ready())
+                    async with semaphore:
+                        cancel.check()
+                        verifications = await verify_questions(
+                            client, questions, session=session, cache=verification_cache
+                        )
+                    entry_metrics.unverified += len(questions) - len(verifications)
+                    questions = filter_valid_questions(questions, verifications)
+                except JobCancelledError:
+                    # Only verified questions count as accepted
+                    entry_metrics.unverified += len(questions)
+                    questions = []
+                except Exception as e:
+                    # Unverified questions are never saved
+                    print(f"  [{entry.label}] ATTENZIONE: Verifica fallita ({e}), "
+                          f"scarto {len(questions)} domande non verificate")
+                    entry_metrics.unverified += len(questions)
+                    questions = []
+
+            # Later rounds avoid only what was accepted
+            if digest is not None:
+                digest.add(questions)
+            entry_metrics.verified += len(questions)
+            return questions
+
+        async def run_entry(idx: int) -> None:
+            entry = plan.entries[idx]
+            entry_metrics = metrics[idx]
+
+            questions = await collect_round(idx, batch_tasks[idx])
+
+            # Top up any shortfall with another concurrent round
+            while (len(questions) < entry.count and entry_metrics.topup_rounds < config.MAX_TOPUP_ROUNDS
+                   and not cancel.cancelled):
+                entry_metrics.topup_rounds += 1
+                shortfall = entry.count - len(questions)
+                # This run's own acceptance rate is the best estimate once it exists
+                rate = acceptance.rate(entry.materia)
+                if entry_metrics.generated:
+                    rate = max(config.MIN_ACCEPTANCE_RATE, len(questions) / entry_metrics.generated)
+                extra = speculative_count(shortfall, rate)
+                print(f"  [{entry.label}] Mancano {shortfall} domande: "
+                      f"integrazione {entry_metrics.topup_rounds} con {extra} domande")
+                questions.extend(await collect_round(idx, schedule(idx, extra)))
+
+            # A cancelled entry's yield says nothing about the materia
+            if not cancel.cancelled:
+                acceptance.record(entry.materia, entry_metrics.generated, len(questions))
+
+            # Drop the surplus of speculative over-generation
+            entry_metrics.surplus = max(0, len(questions) - entry.count)
+            questions = questions[:entry.count]
+
+            entry_metrics.questions = questions
+            entry_metrics.elapsed = time.monotonic() - started
+            print(f"  [{entry.label}] Completato: {len(questions)}/{entry.count} domande "
+                  f"in {entry_metrics.elapsed:.1f}s")
+
+        await asyncio.gather(*(run_entry(idx) for idx in range(len(plan.entries))))
+
+    if cancel.cancelled:
+        print(f"\nANNULLATO ({cancel.reason}): salvo le {sum(len(m.questions) for m in metrics)} "
+              f"domande già accettate")
+    else:
+        # A cancelled run's rates are skewed by the entries it cut short, so only complete runs update them
+        acceptance.save()
+
+    # Group results by output file so each file is written once
+    outputs: dict[str, list[int]] = {}
+    for idx, entry in enumerate(plan.entries):
+        outputs.setdefault(entry.output_file or plan.output_file, []).append(idx)
+
+    for output_file, indexes in outputs.items():
+        print(f"\nSalvataggio in: {output_file}")
+        for idx in indexes:
+            metrics[idx].saved = save_jsonl(
+                metrics[idx].questions, output_file, append=idx != indexes[0]
+            )
+        print(f"  Salvate {sum(metrics[idx].saved for idx in indexes)} domande valide")
+
+    reporters = session.reporters() + ([verification_cache] if verification_cache else [])
+    print_plan_summary(plan, metrics, reporters, cancel_reason=cancel.reason)
+    return metrics
+
+
+def print_plan_summary(
+    plan: Plan, metrics: list[EntryMetrics], reporters: list = (), cancel_reason: Optional[str] = None
+) -> None:
+    """Print per-entry and total counters for a completed (or cancelled) plan."""
+    print(f"\n{'=' * 50}")
+    print(f"ANNULLATO ({cancel_reason})" if cancel_reason else "COMPLETATO")
+    for entry, m in zip(plan.entries, metrics):
+        print(f"  {entry.label}")
+        print(f"    Richieste: {m.requested}  Generate: {m.generated}  Regole locali ok: {m.passed_rules}  "
+              f"Dopo verifica: {m.verified}  Salvate: {m.saved}")
+        if m.rule_rejections:
+            rejected = ", ".join(f"{rule} {n}" for rule, n in m.rule_rejections.most_common())
+            print(f"    Scarti per regola: {rejected}")
+        print(f"    Batch: {m.batches} ({m.failed_batches} falliti)  Integrazioni: {m.topup_rounds}  "
+              f"Eccedenza scartata: {m.surplus}  Tempo: {m.elapsed:.1f}s")
+        if m.unverified:
+            print(f"    Scartate perché non verificate: {m.unverified}")
+        if m.duplicates:
+            print(f"    Duplicati scartati: {m.duplicates} ({m.duplicates / max(1, m.generated):.0%} delle generate)")
+
+    if len(metrics) > 1:
+        print("  Totale")
+        print(f"    Richieste: {sum(m.requested for m in metrics)}  "
+              f"Generate: {sum(m.generated for m in metrics)}  "
+              f"Salvate: {sum(m.saved for m in metrics)}")
+
+    generated = sum(m.generated for m in metrics)
+    if generated:
+        duplicates = sum(m.duplicates for m in metrics)
+        print(f"  Tasso di scarto per duplicati: {duplicates / generated:.1%} ({duplicates}/{generated})")
+
+    for reporter in reporters:
+        for line in reporter.summary_lines():
+            print(f"  {line}")
+
+    for output_file in sorted({e.output_file or plan.output_file for e in plan.entries}):
+        print(f"  Output: {output_file}")
@@ -1,14 +1,11 @@
 """Prompt templates for SSM question generation and verification."""
 
-GENERATION_PROMPT = '''Sei un esperto di medicina e devi generare domande a risposta multipla per il concorso SSM (Scuole di Specializzazione in Medicina).
+# Static instructions go in the system message and never change between calls,
+# so providers with automatic prefix caching can reuse them. Everything that
+# varies per request (context, materia, argomento, count) goes after them.
+GENERATION_SYSTEM_PROMPT = '''Sei un generatore di domande mediche per il concorso SSM (Scuole di Specializzazione in Medicina). Rispondi sempre con JSON valido.
 
-MATERIA: {materia}
-ARGOMENTO: {argomento}
-NUMERO DOMANDE DA GENERARE: {count}
-
-{context_section}
-
-Genera esattamente {count} domande di alta qualità seguendo queste regole:
+Genera domande a risposta multipla di alta qualità seguendo queste regole:
 1. Ogni domanda deve avere ESATTAMENTE 5 risposte
 2. Una sola risposta deve essere corretta (isCorrect: true)
 3. Le risposte devono essere plausibili e ben formulate
@@ -17,22 +14,22 @@ Genera esattamente {count} domande di alta qualità seguendo queste regole:
 
 FORMATO OUTPUT - Genera un array JSON valido con questa struttura esatta:
 [
-  {{
-    "materia": "{materia}",
-    "argomenti": "{argomento}",
+  {
+    "materia": "<MATERIA indicata nella richiesta>",
+    "argomenti": "<ARGOMENTO indicato nella richiesta>",
     "domanda": "Testo della domanda?",
     "has_image": false,
     "image_src": null,
     "risposte": [
-      {{"id": 1, "text": "Prima risposta", "isCorrect": false}},
-      {{"id": 2, "text": "Seconda risposta (corretta)", "isCorrect": true}},
-      {{"id": 3, "text": "Terza risposta", "isCorrect": false}},
-      {{"id": 4, "text": "Quarta risposta", "isCorrect": false}},
-      {{"id": 5, "text": "Quinta risposta", "isCorrect": false}}
+      {"id": 1, "text": "Prima risposta", "isCorrect": false},
+      {"id": 2, "text": "Seconda risposta (corretta)", "isCorrect": true},
+      {"id": 3, "text": "Terza risposta", "isCorrect": false},
+      {"id": 4, "text": "Quarta risposta", "isCorrect": false},
+      {"id": 5, "text": "Quinta risposta", "isCorrect": false}
     ],
     "risposta_corretta_text": "Seconda risposta (corretta)",
     "commento": "Spiegazione dettagliata del perché questa è la risposta corretta..."
-  }}
+  }
 ]
 
 IMPORTANTE:
@@ -41,6 +38,15 @@ IMPORTANTE:
 - La risposta_corretta_text deve corrispondere esattamente al text della risposta con isCorrect: true
 '''
 
+GENERATION_PROMPT = '''{context_section}
+
+MATERIA: {materia}
+ARGOMENTO: {argomento}
+NUMERO DOMANDE DA GENERARE: {count}
+
+Genera esattamente {count} domande. Usa "{materia}" come valore di "materia" e "{argomento}" come valore di "argomenti".
+{images_section}{exclusion_section}'''
+
 CONTEXT_WITH_TEXT = '''CONTESTO/TESTO DI RIFERIMENTO:
 ---
 {text}
@@ -50,26 +56,38 @@ Usa il testo sopra come base per generare domande pertinenti e accurate.'''
 
 CONTEXT_WITHOUT_TEXT = '''Genera le domande basandoti sulle tue conoscenze mediche aggiornate.'''
 
+IMAGES_SECTION = '''
+FIGURE ALLEGATE (estratte dal testo di riferimento): puoi basare alcune domande su queste figure.
+Per una domanda basata su una figura imposta "has_image": true e "image_src" esattamente al valore indicato; per le altre lascia false e null.
+{items}
+'''
+
+EXCLUSION_SECTION = '''
+ARGOMENTI GIÀ COPERTI (risposta corretta e parole chiave): NON generare domande equivalenti, scegli aspetti diversi.
+{items}
+'''
+
 
-VERIFICATION_PROMPT = '''Sei un revisore esperto di domande mediche per il concorso SSM.
+VERIFICATION_SYSTEM_PROMPT = '''Sei un revisore esperto di domande mediche per il concorso SSM. Rispondi sempre con JSON valido.
 
-Analizza le seguenti domande e verifica:
+Analizza le domande che ti vengono fornite e verifica:
 1. Correttezza medica/scientifica della risposta indicata come corretta
 2. Che le risposte errate siano effettivamente errate
 3. Che il commento sia accurato e utile
 4. Che la domanda sia formulata in modo chiaro
 
 Per ogni domanda, rispondi con un oggetto JSON:
-{{
+{
   "domanda_index": <numero>,
   "is_valid": true/false,
   "issues": ["lista di problemi se non valida"],
   "suggested_fix": "suggerimento opzionale per correzione"
-}}
-
-DOMANDE DA VERIFICARE:
-{questions_json}
+}
 
 Rispondi con un array JSON contenente la verifica di ogni domanda.
 IMPORTANTE: Rispondi SOLO con l'array JSON, senza testo aggiuntivo.
 '''
+
+VERIFICATION_PROMPT = '''DOMANDE DA VERIFICARE:
+{questions_json}
+'''
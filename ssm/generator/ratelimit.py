@@ -0,0 +1,58 @@
+"""
+Request pacing shared by every batch of a generation run.
+
+The limiters are shared by all web jobs of a process, and each job runs its
+own event loop in its own request thread, so slots are reserved under a
+threading lock and the waiting happens outside it, on the caller's loop.
+"""
+
+import asyncio
+import threading
+import time
+
+
+class RateLimiter:
+    """Space out request starts so at most ``requests_per_minute`` begin per minute (0 = unlimited)."""
+
+    def __init__(self, requests_per_minute: float = 60):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    async def acquire(self) -> None:
+        """Wait until the next request slot is available."""
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class TokenBucket:
+    """Token-per-minute budget: ``tokens_per_minute`` capacity, refilled continuously."""
+
+    def __init__(self, tokens_per_minute: float):
+        self.capacity = float(tokens_per_minute)
+        self.refill_per_second = tokens_per_minute / 60.0
+        self.available = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+
+    async def acquire(self, tokens: float) -> None:
+        """Wait until ``tokens`` can be spent (requests larger than the capacity wait for a full bucket)."""
+        tokens = min(tokens, self.capacity)
+        with self._lock:
+            self._refill()
+            # Spend now, going into debt; later callers queue behind the debt
+            self.available -= tokens
+            wait = -self.available / self.refill_per_second if self.available < 0 else 0.0
+
+        if wait > 0:
+            await asyncio.sleep(wait)
@@ -0,0 +1,185 @@
+"""
+Tail-latency and outage protection for chat-completion calls.
+
+Hedger fires a duplicate request when the first one is slower than the
+recent p95 latency and keeps whichever finishes first. CircuitBreaker fails
+fast once the recent error rate crosses a threshold, lets the scheduler wait
+out a cooldown, then lets a single probe request test for recovery.
+"""
+
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from . import config
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the API while the circuit breaker is open."""
+
+
+class Hedger:
+    """Issue a backup request after a p95-based delay and take the first result."""
+
+    def __init__(
+        self,
+        min_samples: int = config.HEDGE_MIN_SAMPLES,
+        default_delay: float = config.HEDGE_DEFAULT_DELAY_SECONDS,
+        min_delay: float = config.HEDGE_MIN_DELAY_SECONDS,
+    ):
+        self.latencies: deque[float] = deque(maxlen=200)
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.requests = 0
+        self.hedges_fired = 0
+        self.hedge_wins = 0
+
+    def p95(self) -> Optional[float]:
+        if len(self.latencies) < self.min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)]
+
+    def delay(self) -> float:
+        p95 = self.p95()
+        return self.default_delay if p95 is None else max(self.min_delay, p95)
+
+    async def run(self, request: Callable[[], Awaitable[T]]) -> T:
+        """Await ``request()``, racing a second copy if the first is slow."""
+        self.requests += 1
+        started = time.monotonic()
+        primary = asyncio.ensure_future(request())
+
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.delay())
+        except asyncio.CancelledError:
+            primary.cancel()
+            raise
+        if done:
+            result = primary.result()
+            self.latencies.append(time.monotonic() - started)
+            return result
+
+        self.hedges_fired += 1
+        hedge_started = time.monotonic()
+        backup = asyncio.ensure_future(request())
+        pending = {primary, backup}
+        error: Optional[BaseException] = None
+
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    if task is backup:
+                        self.hedge_wins += 1
+                        self.latencies.append(time.monotonic() - hedge_started)
+                    else:
+                        self.latencies.append(time.monotonic() - started)
+                    return task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise error
+
+    def summary_lines(self) -> list[str]:
+        p95 = self.p95()
+        p95_text = f"{p95:.1f}s" if p95 is not None else "n/d"
+        return [
+            f"Hedging: {self.hedges_fired}/{self.requests} richieste duplicate, "
+            f"{self.hedge_wins} vinte dal duplicato (p95 {p95_text})"
+        ]
+
+
+class CircuitBreaker:
+    """Closed -> open on a high error rate, open -> half-open after a cooldown."""
+
+    def __init__(
+        self,
+        failure_rate: float = config.CIRCUIT_FAILURE_RATE,
+        window: int = config.CIRCUIT_WINDOW,
+        min_calls: int = config.CIRCUIT_MIN_CALLS,
+        cooldown: float = config.CIRCUIT_COOLDOWN_SECONDS,
+    ):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.outcomes: deque[bool] = deque(maxlen=window)
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.opens = 0
+        self.fast_failures = 0
+        self._probe_in_flight = False
+        # Shared by the web jobs' event loops, each in its own thread
+        self._lock = threading.RLock()
+
+    def _refresh(self) -> None:
+        if self.state == "open" and time.monotonic() >= self.opened_at + self.cooldown:
+            self.state = "half_open"
+            self._probe_in_flight = False
+
+    def _open(self) -> None:
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.opens += 1
+        self.outcomes.clear()
+        print(f"  [CIRCUIT] Troppi errori API, pausa di {self.cooldown:.0f}s")
+
+    def allows_request(self) -> bool:
+        """True when a call would be let through (closed, or half-open with no probe in flight)."""
+        with self._lock:
+            self._refresh()
+            return self.state == "closed" or (self.state == "half_open" and not self._probe_in_flight)
+
+    def check(self) -> None:
+        """Raise CircuitOpenError unless a request may be sent now."""
+        with self._lock:
+            self._refresh()
+            if self.state == "open" or (self.state == "half_open" and self._probe_in_flight):
+                self.fast_failures += 1
+                raise CircuitOpenError("Circuit breaker aperto: API non disponibile")
+            if self.state == "half_open":
+                self._probe_in_flight = True
+
+    def abandon(self) -> None:
+        """Forget a call that was let through but abandoned before it had an outcome."""
+        with self._lock:
+            if self.state == "half_open":
+                self._probe_in_flight = False
+
+    def record(self, success: bool) -> None:
+        with self._lock:
+            if self.state == "half_open":
+                self._probe_in_flight = False
+                if success:
+                    self.state = "closed"
+                    print("  [CIRCUIT] API di nuovo disponibile")
+                else:
+                    self._open()
+                return
+
+            self.outcomes.append(success)
+            failures = self.outcomes.count(False)
+            if len(self.outcomes) >= self.min_calls and failures / len(self.outcomes) >= self.failure_rate:
+                self._open()
+
+    async def wait_ready(self) -> None:
+        """Pause the caller while the circuit is open."""
+        while not self.allows_request():
+            remaining = self.opened_at + self.cooldown - time.monotonic()
+            await asyncio.sleep(max(0.5, remaining))
+
+    def summary_lines(self) -> list[str]:
+        return [
+            f"Circuit breaker: stato {self.state}, aperture {self.opens}, "
+            f"chiamate rifiutate {self.fast_failures}"
+        ]
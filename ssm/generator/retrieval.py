@@ -0,0 +1,200 @@
+"""
+Local BM25 retrieval over document chunks.
+
+Used to pick the parts of a textbook that match the requested argomento
+instead of always sending the start of the document. Indexes are
+persisted next to the extraction cache, keyed by the document's cache key.
+"""
+
+import gzip
+import json
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+from . import config
+from .pipeline import Document
+from .tokens import chars_for_tokens
+
+# Bump whenever tokenization or index layout changes
+RETRIEVAL_VERSION = 1
+
+ITALIAN_STOPWORDS = frozenset("""
+a ad al alla alle allo agli ai all anche avere c che chi ci come con contro cui
+da dal dalla dalle dallo dagli dai de degli dei del della delle dello di dove e
+ed era essere fra gli ha hanno ho i il in io la le lo loro ma mi ne negli nei nel
+nella nelle nello no non o per piu pero puo quale quali quando quanto quella
+quelle quelli quello questa queste questi questo se sei si sia sono su sua sue
+sugli sui sul sulla sulle sullo suo suoi tra tutto tutti un una uno vi
+pagina
+""".split())
+
+# Longest first, so "azione" is tried before "zione" and "mente"
+_SUFFIXES = sorted(
+    """
+    amento amenti imento imenti azione azioni uzione uzioni zione zioni
+    mente ita ista isti iste ismo ismi iche ichi ica ico ici
+    osa ose osi oso ive ivi iva ivo ali ale are ere ire ato ata ati ate
+    """.split(),
+    key=len,
+    reverse=True,
+)
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _strip_accents(text: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+
+def stem(word: str) -> str:
+    """Light Italian stemmer: drop one derivational suffix, then a final vowel."""
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            word = word[: -len(suffix)]
+            break
+    if len(word) > 4 and word[-1] in "aeiou":
+        word = word[:-1]
+    return word
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase, strip accents, drop stopwords and stem."""
+    words = _TOKEN_RE.findall(_strip_accents(text.lower()))
+    return [stem(w) for w in words if len(w) > 1 and w not in ITALIAN_STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over a list of chunk texts."""
+
+    def __init__(self, term_freqs: list[dict[str, int]], k1: float = 1.5, b: float = 0.75):
+        self.term_freqs = term_freqs
+        self.k1 = k1
+        self.b = b
+        self.lengths = [sum(tf.values()) for tf in term_freqs]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+        doc_freqs = Counter()
+        for tf in term_freqs:
+            doc_freqs.update(tf.keys())
+        n = len(term_freqs)
+        self.idf = {
+            term: math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for term, df in doc_freqs.items()
+        }
+
+    @classmethod
+    def build(cls, texts: list[str]) -> "BM25Index":
+        return cls([dict(Counter(tokenize(text))) for text in texts])
+
+    def scores(self, query: str) -> list[float]:
+        terms = [t for t in set(tokenize(query)) if t in self.idf]
+        results = []
+        for tf, length in zip(self.term_freqs, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / self.avg_length) if self.avg_length else self.k1
+            score = 0.0
+            for term in terms:
+                freq = tf.get(term)
+                if freq:
+                    score += self.idf[term] * freq * (self.k1 + 1) / (freq + norm)
+            results.append(score)
+        return results
+
+    def rank(self, query: str, top_k: Optional[int] = None) -> list[int]:
+        """Indexes of chunks with a positive score, best first."""
+        scores = self.scores(query)
+        ranked = sorted((i for i, s in enumerate(scores) if s > 0), key=lambda i: -scores[i])
+        return ranked[:top_k] if top_k else ranked
+
+
+def _index_path(document: Document, cache_dir: Optional[Path]) -> Path:
+    return Path(cache_dir or config.CACHE_DIR) / "retrieval" / f"{document.key}-r{RETRIEVAL_VERSION}.json.gz"
+
+
+def load_index(document: Document, cache_dir: Optional[Path] = None) -> BM25Index:
+    """Load the persisted index for a cached document, building it on a miss."""
+    path = _index_path(document, cache_dir) if document.key else None
+
+    if path is not None:
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                return BM25Index(json.load(f))
+        except (FileNotFoundError, OSError, ValueError):
+            pass
+
+    index = BM25Index.build(document.chunk_texts())
+
+    if path is not None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(index.term_freqs, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    return index
+
+
+def select_chunks(
+    document: Document,
+    index: BM25Index,
+    query: str,
+    budget_chars: Optional[int] = None,
+    batch_index: int = 0,
+) -> list[int]:
+    """
+    Indexes of the chunks most relevant to ``query`` that fit in ``budget_chars``
+    (by default the character equivalent of CONTEXT_MAX_TOKENS), in document order.
+
+    Successive batches start further down the top-k ranking, so a job spread
+    over several batches sees different relevant passages. Empty when nothing
+    matches.
+    """
+    if budget_chars is None:
+        budget_chars = chars_for_tokens(config.CONTEXT_MAX_TOKENS)
+    ranked = index.rank(query, top_k=config.RETRIEVAL_TOP_K)
+    if not ranked:
+        return []
+
+    chunks = document.chunks
+    per_batch = max(1, budget_chars // config.CHUNK_SIZE_CHARS)
+    offset = (batch_index * per_batch) % len(ranked)
+
+    selected = []
+    used = 0
+    for i in ranked[offset:] + ranked[:offset]:
+        _, start, end = chunks[i]
+        if used + (end - start) > budget_chars:
+            continue
+        selected.append(i)
+        used += end - start + 2
+
+    # Keep document order so passages read naturally
+    return sorted(selected)
+
+
+def join_chunks(document: Document, selected: list[int]) -> str:
+    return "\n\n".join(document.text[document.chunks[i][1]:document.chunks[i][2]] for i in selected)
+
+
+def select_context(
+    document: Document,
+    index: BM25Index,
+    query: str,
+    budget_chars: Optional[int] = None,
+    batch_index: int = 0,
+) -> tuple[str, set[int]]:
+    """
+    Text of select_chunks() and the pages it comes from.
+
+    Falls back to the start of the document when nothing matches.
+    """
+    if budget_chars is None:
+        budget_chars = chars_for_tokens(config.CONTEXT_MAX_TOKENS)
+    selected = select_chunks(document, index, query, budget_chars, batch_index)
+    if not selected:
+        return document.text[:budget_chars], {page for page, start, _ in document.pages if start < budget_chars}
+    return join_chunks(document, selected), {document.chunks[i][0] for i in selected}
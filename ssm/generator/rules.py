@@ -0,0 +1,122 @@
+"""
+Local rule engine run on every generated question before verification.
+
+Structurally broken questions are dropped here so the verifier is only paid
+to review questions that could actually be saved. Each rule returns True when
+the question passes; rejections are counted by rule name.
+"""
+
+import re
+from collections import Counter
+from typing import Callable
+
+from . import config
+
+REQUIRED_FIELDS = ("materia", "domanda", "risposte", "risposta_corretta_text", "commento")
+
+
+def _normalize(text) -> str:
+    return re.sub(r"\s+", " ", str(text or "")).strip().lower()
+
+
+def _answers(question: dict) -> list:
+    risposte = question.get("risposte")
+    return risposte if isinstance(risposte, list) else []
+
+
+def _correct_answers(question: dict) -> list[dict]:
+    return [r for r in _answers(question) if isinstance(r, dict) and r.get("isCorrect") is True]
+
+
+def has_required_fields(question: dict) -> bool:
+    return all(question.get(field) not in (None, "", []) for field in REQUIRED_FIELDS)
+
+
+def has_five_distinct_options(question: dict) -> bool:
+    answers = _answers(question)
+    if len(answers) != 5 or not all(isinstance(r, dict) for r in answers):
+        return False
+    texts = [_normalize(r.get("text")) for r in answers]
+    return all(texts) and len(set(texts)) == 5
+
+
+def has_sequential_ids(question: dict) -> bool:
+    ids = [r.get("id") for r in _answers(question) if isinstance(r, dict)]
+    return sorted(ids, key=str) == [1, 2, 3, 4, 5]
+
+
+def has_single_correct(question: dict) -> bool:
+    return len(_correct_answers(question)) == 1
+
+
+def correct_text_matches(question: dict) -> bool:
+    correct = _correct_answers(question)
+    if len(correct) != 1:
+        return False
+    return _normalize(correct[0].get("text")) == _normalize(question.get("risposta_corretta_text"))
+
+
+def has_meaningful_comment(question: dict) -> bool:
+    commento = _normalize(question.get("commento"))
+    return len(commento) >= config.MIN_COMMENT_CHARS and commento != _normalize(question.get("risposta_corretta_text"))
+
+
+def within_length_limits(question: dict) -> bool:
+    stem = str(question.get("domanda") or "").strip()
+    if not config.MIN_STEM_CHARS <= len(stem) <= config.MAX_STEM_CHARS:
+        return False
+    if len(str(question.get("commento") or "")) > config.MAX_COMMENT_CHARS:
+        return False
+    return all(
+        len(str(r.get("text") or "")) <= config.MAX_ANSWER_CHARS
+        for r in _answers(question)
+        if isinstance(r, dict)
+    )
+
+
+def no_answer_in_stem(question: dict) -> bool:
+    """The correct option must not appear verbatim in the question text."""
+    correct = _correct_answers(question)
+    if len(correct) != 1:
+        return True
+    answer = _normalize(correct[0].get("text"))
+    # Short answers ("Sì", "IgA", "5%") legitimately recur in stems
+    if len(answer) < config.MIN_LEAK_CHECK_CHARS:
+        return True
+    return answer not in _normalize(question.get("domanda"))
+
+
+RULES: dict[str, Callable[[dict], bool]] = {
+    "campi_obbligatori": has_required_fields,
+    "cinque_opzioni_distinte": has_five_distinct_options,
+    "id_risposte_1_5": has_sequential_ids,
+    "una_risposta_corretta": has_single_correct,
+    "risposta_corretta_text": correct_text_matches,
+    "commento_significativo": has_meaningful_comment,
+    "limiti_lunghezza": within_length_limits,
+    "risposta_nella_domanda": no_answer_in_stem,
+}
+
+
+def check_question(question) -> list[str]:
+    """Return the names of the rules a question fails (empty if it passes)."""
+    if not isinstance(question, dict):
+        return ["oggetto_json"]
+    return [name for name, rule in RULES.items() if not rule(question)]
+
+
+def filter_by_rules(questions: list) -> tuple[list[dict], Counter]:
+    """Split out questions that fail any rule, counting rejections by rule."""
+    passed = []
+    rejections = Counter()
+
+    for question in questions:
+        failed = check_question(question)
+        if failed:
+            rejections.update(failed)
+            stem = question.get("domanda", "N/A") if isinstance(question, dict) else "N/A"
+            print(f"  [SCARTATA] {str(stem)[:50]}...: {', '.join(failed)}")
+        else:
+            passed.append(question)
+
+    return passed, rejections
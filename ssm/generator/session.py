@@ -0,0 +1,126 @@
+"""
+Per-run API session.
+
+An ApiSession carries everything a run needs to talk to the chat-completions
+backend: credentials, base URL, model, rate limits, endpoint pool, hedging,
+circuit breaker, usage counters and the job's cancel token. It is passed explicitly through
+generate_questions_batch, verify_questions and call_openai_api, so
+concurrent runs (e.g. several web requests with different user keys) never
+share or mutate global configuration.
+
+Sessions on the configured credentials share one endpoint pool, rate
+limiter and circuit breaker per process, so concurrent web jobs respect the
+same rpm/tpm limits and see the same endpoint health. A caller-supplied key
+gets its own.
+"""
+
+import threading
+from dataclasses import dataclass, field
+from typing import Optional, Union
+
+from . import config
+from .backends import EndpointPool, PoolBreaker
+from .cancellation import CancelToken
+from .ratelimit import RateLimiter
+from .resilience import CircuitBreaker, Hedger
+from .usage import UsageStats
+
+
+@dataclass
+class ApiSession:
+    """Credentials, limits and per-run state for chat-completion calls."""
+
+    api_key: Optional[str] = None
+    base_url: str = config.OPENAI_BASE_URL
+    model: str = config.OPENAI_MODEL
+    requests_per_minute: float = config.RATE_LIMIT_REQUESTS_PER_MINUTE
+    pool: Optional[EndpointPool] = None
+    hedger: Optional[Hedger] = None
+    breaker: Optional[Union[CircuitBreaker, PoolBreaker]] = None
+    usage: UsageStats = field(default_factory=UsageStats)
+    cancel: CancelToken = field(default_factory=CancelToken)
+    limiter: Optional[RateLimiter] = None
+
+    def __post_init__(self):
+        self.base_url = self.base_url.rstrip("/")
+        if self.limiter is None:
+            # A pool paces each endpoint itself
+            self.limiter = RateLimiter(0 if self.pool else self.requests_per_minute)
+
+    @classmethod
+    def from_config(cls, api_key: Optional[str] = None, **overrides) -> "ApiSession":
+        """
+        Build a session from config, optionally with a caller-supplied key.
+
+        An explicit ``api_key`` always wins over the configured endpoints file,
+        so a user's own key is never routed through the shared pool, and gets
+        its own limiter and breaker.
+        """
+        if api_key is None:
+            shared = _shared_backend()
+            pool, limiter, breaker = shared.pool, shared.limiter, shared.breaker
+        else:
+            pool, limiter = None, None
+            breaker = CircuitBreaker() if config.CIRCUIT_BREAKER_ENABLED else None
+
+        return cls(
+            api_key=api_key or config.OPENAI_API_KEY,
+            pool=pool,
+            limiter=limiter,
+            hedger=Hedger() if config.HEDGE_ENABLED else None,
+            breaker=breaker,
+            **overrides,
+        )
+
+    @property
+    def has_credentials(self) -> bool:
+        return self.pool is not None or bool(self.api_key)
+
+    @property
+    def model_label(self) -> str:
+        """The model, or the sorted set of models behind a pool."""
+        if self.pool:
+            return ",".join(sorted({e.model for e in self.pool.endpoints}))
+        return self.model
+
+    @property
+    def endpoint_count(self) -> int:
+        return len(self.pool.endpoints) if self.pool else 1
+
+    def reporters(self) -> list:
+        """Components with summary_lines() to print at the end of a run."""
+        return [r for r in (self.usage, self.hedger, self.breaker, self.pool) if r is not None]
+
+
+@dataclass
+class _SharedBackend:
+    """Pool, limiter and breaker of the configured credentials."""
+
+    key: tuple
+    pool: Optional[EndpointPool]
+    limiter: RateLimiter
+    breaker: Optional[Union[CircuitBreaker, PoolBreaker]]
+
+
+_shared: Optional[_SharedBackend] = None
+_shared_lock = threading.Lock()
+
+
+def _shared_backend() -> _SharedBackend:
+    """Built on first use and whenever the relevant configuration changes."""
+    global _shared
+    key = (config.OPENAI_ENDPOINTS_FILE, config.OPENAI_API_KEY, config.RATE_LIMIT_REQUESTS_PER_MINUTE)
+    with _shared_lock:
+        if _shared is None or _shared.key != key:
+            pool = EndpointPool.from_file(config.OPENAI_ENDPOINTS_FILE) if config.OPENAI_ENDPOINTS_FILE else None
+            breaker = None
+            if config.CIRCUIT_BREAKER_ENABLED:
+                # With a pool the endpoints track their own health; the run pauses only when all are down
+                breaker = PoolBreaker(pool) if pool else CircuitBreaker()
+            _shared = _SharedBackend(
+                key=key,
+                pool=pool,
+                limiter=RateLimiter(0 if pool else config.RATE_LIMIT_REQUESTS_PER_MINUTE),
+                breaker=breaker,
+            )
+        return _shared
@@ -0,0 +1,174 @@
+"""
+Precompressed, cache-validated static responses for web.py.
+
+Each asset is read once (and again only when its source file changes), then
+kept in memory as identity, gzip and, when the ``brotli`` package is
+installed, brotli bytes. Responses honor Accept-Encoding, carry a strong
+ETag derived from the content hash and answer If-None-Match with 304, and
+clients must revalidate them. A changed source is recompressed into a new
+StaticAsset that replaces the old one, so a response never mixes versions.
+"""
+
+import gzip
+import hashlib
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Optional, Union
+
+from flask import Request, Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# Below this size compression costs more than it saves
+MIN_COMPRESS_BYTES = 1024
+
+
+@dataclass
+class StaticAsset:
+    """One asset with its encoded variants."""
+
+    name: str
+    content_type: str
+    source: Union[Path, Callable[[], bytes]]
+    body: bytes = b""
+    digest: str = ""
+    mtime: float = 0.0
+    variants: dict[str, bytes] = field(default_factory=dict)
+
+    def etag(self, encoding: str) -> str:
+        return self.digest[:32] if encoding == "identity" else f"{self.digest[:32]}-{encoding}"
+
+
+def _compress(body: bytes) -> dict[str, bytes]:
+    variants = {"identity": body}
+    if len(body) < MIN_COMPRESS_BYTES:
+        return variants
+
+    # Large files (the bank) get a faster level so a refresh stays cheap
+    level = 9 if len(body) < 1024 * 1024 else 6
+    variants["gzip"] = gzip.compress(body, compresslevel=level, mtime=0)
+    if brotli is not None:
+        variants["br"] = brotli.compress(body, quality=11 if level == 9 else 5)
+    return variants
+
+
+def _accepted_encodings(accept_encoding: str) -> dict[str, float]:
+    accepted = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token.strip().lower()] = q
+    return accepted
+
+
+def choose_encoding(accept_encoding: str, available) -> str:
+    """Best of br > gzip > identity that the client accepts."""
+    accepted = _accepted_encodings(accept_encoding or "")
+    for encoding in ("br", "gzip"):
+        if encoding in available and accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return "identity"
+
+
+class AssetStore:
+    """Named assets, refreshed when their source file changes."""
+
+    def __init__(self):
+        self.assets: dict[str, StaticAsset] = {}
+        self._lock = threading.Lock()
+        self._refresh_locks: dict[str, threading.Lock] = {}
+
+    def register(self, name: str, source: Union[Path, Callable[[], bytes]], content_type: str) -> None:
+        """Add an asset backed by a file, or by a callable that renders its bytes once."""
+        with self._lock:
+            self.assets[name] = StaticAsset(name=name, content_type=content_type, source=source)
+            self._refresh_locks[name] = threading.Lock()
+
+    def get(self, name: str) -> Optional[StaticAsset]:
+        asset = self.assets.get(name)
+        if asset is None:
+            return None
+
+        if callable(asset.source):
+            if asset.digest:
+                return asset
+            mtime = 0.0
+        else:
+            try:
+                mtime = asset.source.stat().st_mtime
+            except FileNotFoundError:
+                return None
+            if mtime == asset.mtime and asset.digest:
+                return asset
+        return self._refresh(asset, mtime)
+
+    def _refresh(self, stale: StaticAsset, mtime: float) -> StaticAsset:
+        """
+        Read and compress the source again, then swap the new version in.
+
+        Only one request rebuilds a given asset, outside the store lock; the
+        others keep getting the previous version meanwhile, if there is one.
+        """
+        refresh_lock = self._refresh_locks[stale.name]
+        if not refresh_lock.acquire(blocking=not stale.digest):
+            return stale
+        try:
+            current = self.assets[stale.name]
+            if current is not stale:
+                return current  # Rebuilt while this request waited
+
+            body = stale.source() if callable(stale.source) else stale.source.read_bytes()
+            fresh = StaticAsset(name=stale.name, content_type=stale.content_type, source=stale.source)
+            self._load(fresh, body, mtime)
+            with self._lock:
+                self.assets[stale.name] = fresh
+            return fresh
+        finally:
+            refresh_lock.release()
+
+    def preload(self) -> None:
+        """Read and compress every asset now instead of on first request."""
+        for name in self.assets:
+            self.get(name)
+
+    @staticmethod
+    def _load(asset: StaticAsset, body: bytes, mtime: float) -> None:
+        asset.variants = _compress(body)
+        asset.body = body
+        asset.digest = hashlib.sha256(body).hexdigest()
+        asset.mtime = mtime
+
+    @staticmethod
+    def respond(asset: StaticAsset, request: Request) -> Response:
+        """Build the response for an asset, a 304 when the client's copy is current."""
+        encoding = choose_encoding(request.headers.get("Accept-Encoding", ""), asset.variants)
+        etag = asset.etag(encoding)
+
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(asset.variants[encoding], content_type=asset.content_type)
+            if encoding != "identity":
+                response.headers["Content-Encoding"] = encoding
+
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = REVALIDATE_CACHE_CONTROL
+        response.headers["Vary"] = "Accept-Encoding"
+        if asset.mtime:
+            response.last_modified = asset.mtime
+        return response
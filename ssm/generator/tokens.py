@@ -0,0 +1,108 @@
+"""
+Local token estimation and prompt budgeting.
+
+Counts use tiktoken when it is installed and a characters-per-token
+heuristic otherwise (calibrated on Italian prose and question JSON, and
+rounded up so it errs on the large side). Prompt builders use these counts to
+fit context and batch size into the configured input and output budgets, and
+to refuse requests that could only come back truncated.
+"""
+
+import math
+from typing import Optional
+
+from . import config
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Chat format overhead: role and separators per message, plus the reply primer
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMER_TOKENS = 3
+
+_encodings: dict[str, object] = {}
+
+
+class PromptBudgetError(ValueError):
+    """The request cannot fit the model's context window or output budget."""
+
+
+def _encoding(model: Optional[str]):
+    model = model or config.OPENAI_MODEL
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding("o200k_base")
+    return _encodings[model]
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    if not text:
+        return 0
+    if tiktoken is not None:
+        return len(_encoding(model).encode(text, disallowed_special=()))
+    return math.ceil(len(text) / config.HEURISTIC_CHARS_PER_TOKEN)
+
+
+def _content_tokens(content, model: Optional[str]) -> int:
+    if isinstance(content, str):
+        return count_tokens(content, model)
+    # Multi-part content: text parts plus a flat reservation per image
+    return sum(
+        count_tokens(part.get("text", ""), model) if part.get("type") == "text" else config.IMAGE_INPUT_TOKENS
+        for part in content
+    )
+
+
+def count_message_tokens(messages: list[dict], model: Optional[str] = None) -> int:
+    return sum(_content_tokens(m["content"], model) + MESSAGE_OVERHEAD_TOKENS for m in messages) + REPLY_PRIMER_TOKENS
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: Optional[str] = None) -> str:
+    """Longest prefix of ``text`` that fits in ``max_tokens``."""
+    if max_tokens <= 0:
+        return ""
+    if tiktoken is not None:
+        tokens = _encoding(model).encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else _encoding(model).decode(tokens[:max_tokens])
+    return text[:chars_for_tokens(max_tokens)]
+
+
+def chars_for_tokens(tokens: int) -> int:
+    """Conservative character budget for a token budget, for character-based selection."""
+    return int(tokens * config.HEURISTIC_CHARS_PER_TOKEN)
+
+
+def generation_output_tokens(count: int) -> int:
+    return math.ceil(count * config.OUTPUT_TOKENS_PER_QUESTION * config.OUTPUT_TOKENS_MARGIN)
+
+
+def verification_output_tokens(count: int) -> int:
+    return math.ceil(count * config.VERIFICATION_TOKENS_PER_QUESTION * config.OUTPUT_TOKENS_MARGIN)
+
+
+def max_batch_size() -> int:
+    """Largest generation batch whose answer fits in MAX_OUTPUT_TOKENS."""
+    return max(1, config.MAX_OUTPUT_TOKENS // generation_output_tokens(1))
+
+
+def max_verification_batch() -> int:
+    """Largest verification call: VERIFICATION_CHUNK_QUESTIONS, if its verdicts fit in MAX_OUTPUT_TOKENS."""
+    fits = max(1, config.MAX_OUTPUT_TOKENS // verification_output_tokens(1))
+    return max(1, min(config.VERIFICATION_CHUNK_QUESTIONS, fits))
+
+
+def check_budget(input_tokens: int, output_tokens: int) -> None:
+    """Raise PromptBudgetError if the reply cannot fit without truncation."""
+    if output_tokens > config.MAX_OUTPUT_TOKENS:
+        raise PromptBudgetError(
+            f"Expected output of {output_tokens} tokens exceeds MAX_OUTPUT_TOKENS ({config.MAX_OUTPUT_TOKENS})"
+        )
+    if input_tokens + output_tokens > config.MODEL_CONTEXT_TOKENS:
+        raise PromptBudgetError(
+            f"Prompt of {input_tokens} tokens plus {output_tokens} output tokens exceeds "
+            f"the model context ({config.MODEL_CONTEXT_TOKENS})"
+        )
@@ -0,0 +1,111 @@
+"""
+PDF/TXT uploads from the web UI.
+
+Uploaded files are streamed to ``config.CACHE_DIR / "uploads"`` in 1 MiB
+blocks, rejected as soon as they exceed UPLOAD_MAX_BYTES, and stored under
+the SHA-256 of their content, so the same chapter uploaded twice is kept
+once and hits the extraction cache. Extraction runs on a small shared pool
+of worker threads, off the request threads and their event loops, through
+the same load_document() (chunking, extraction cache, figures) as the CLI.
+"""
+
+import hashlib
+import os
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+from . import config
+from .extraction_cache import load_document
+from .pipeline import Document
+
+ALLOWED_EXTENSIONS = (".pdf", ".txt")
+_UPLOAD_ID_RE = re.compile(r"^[0-9a-f]{64}\.(pdf|txt)$")
+
+
+class UploadError(ValueError):
+    """The uploaded file is missing, too large or not a PDF/TXT."""
+
+
+def upload_dir() -> Path:
+    return Path(config.CACHE_DIR) / "uploads"
+
+
+def save_upload(stream: BinaryIO, filename: str, max_bytes: int = config.UPLOAD_MAX_BYTES) -> Path:
+    """Spool an upload to disk and return its content-addressed path."""
+    ext = Path(filename or "").suffix.lower()
+    if ext not in ALLOWED_EXTENSIONS:
+        raise UploadError("Formato non supportato: carica un file .pdf o .txt")
+
+    root = upload_dir()
+    root.mkdir(parents=True, exist_ok=True)
+    tmp_path = root / f"upload-{os.getpid()}-{threading.get_ident()}.tmp"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            for block in iter(lambda: stream.read(1024 * 1024), b""):
+                if size == 0 and ext == ".pdf" and not block.startswith(b"%PDF-"):
+                    raise UploadError("Il file non è un PDF valido")
+                size += len(block)
+                if size > max_bytes:
+                    raise UploadError(f"File troppo grande (max {max_bytes // (1024 * 1024)} MB)")
+                digest.update(block)
+                f.write(block)
+        if size == 0:
+            raise UploadError("File vuoto")
+
+        path = root / f"{digest.hexdigest()}{ext}"
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+    evict_uploads()
+    return path
+
+
+def upload_path(upload_id: str) -> Optional[Path]:
+    """Path of a stored upload, or None for unknown or malformed ids."""
+    if not _UPLOAD_ID_RE.match(upload_id or ""):
+        return None
+    path = upload_dir() / upload_id
+    return path if path.exists() else None
+
+
+def evict_uploads(max_bytes: int = config.UPLOAD_DIR_MAX_BYTES) -> None:
+    """Delete the oldest uploads until the directory fits in max_bytes."""
+    entries = []
+    for path in upload_dir().glob("*.*"):
+        if path.suffix not in ALLOWED_EXTENSIONS:
+            continue
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def submit_extraction(path: Path) -> "Future[Document]":
+    """Extract an upload on the shared worker pool."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=config.UPLOAD_EXTRACTION_WORKERS, thread_name_prefix="ssm-extract"
+            )
+    # Touch the file so eviction keeps uploads that are still in use
+    os.utime(path)
+    return _executor.submit(load_document, str(path))
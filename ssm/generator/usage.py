@@ -0,0 +1,73 @@
+"""Token usage, prompt-cache hit and latency accounting for API calls."""
+
+from dataclasses import dataclass
+
+from . import config
+
+
+@dataclass
+class UsageStats:
+    """Running totals of the ``usage`` blocks returned by chat completions."""
+
+    calls: int = 0
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+    cached_calls: int = 0
+    cached_latency: float = 0.0
+    uncached_latency: float = 0.0
+
+    def record(self, usage: dict, latency: float) -> None:
+        """Add one response's usage block and its wall-clock latency."""
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+
+        self.calls += 1
+        self.prompt_tokens += usage.get("prompt_tokens", 0)
+        self.completion_tokens += usage.get("completion_tokens", 0)
+        self.cached_tokens += cached
+
+        if cached:
+            self.cached_calls += 1
+            self.cached_latency += latency
+        else:
+            self.uncached_latency += latency
+
+    @property
+    def cache_hit_rate(self) -> float:
+        """Share of prompt tokens served from the provider's prompt cache."""
+        return self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+    def cost(self) -> float:
+        """Estimated USD cost with cached input tokens billed at the discounted rate."""
+        uncached = self.prompt_tokens - self.cached_tokens
+        return (
+            uncached * config.PRICE_INPUT_PER_MTOK
+            + self.cached_tokens * config.PRICE_CACHED_INPUT_PER_MTOK
+            + self.completion_tokens * config.PRICE_OUTPUT_PER_MTOK
+        ) / 1_000_000
+
+    def cost_without_cache(self) -> float:
+        return (
+            self.prompt_tokens * config.PRICE_INPUT_PER_MTOK
+            + self.completion_tokens * config.PRICE_OUTPUT_PER_MTOK
+        ) / 1_000_000
+
+    def summary_lines(self) -> list[str]:
+        if not self.calls:
+            return []
+        lines = [
+            f"Chiamate API: {self.calls}",
+            f"Token prompt: {self.prompt_tokens} ({self.cached_tokens} in cache, "
+            f"{self.cache_hit_rate:.0%})",
+            f"Token completamento: {self.completion_tokens}",
+            f"Costo stimato: ${self.cost():.4f} (senza cache ${self.cost_without_cache():.4f})",
+        ]
+        uncached_calls = self.calls - self.cached_calls
+        if self.cached_calls and uncached_calls:
+            lines.append(
+                f"Latenza media: {self.cached_latency / self.cached_calls:.1f}s con cache, "
+                f"{self.uncached_latency / uncached_calls:.1f}s senza"
+            )
+        else:
+            lines.append(f"Latenza media: {(self.cached_latency + self.uncached_latency) / self.calls:.1f}s")
+        return lines
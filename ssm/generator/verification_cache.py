@@ -0,0 +1,127 @@
+"""
+Local cache of verifier verdicts.
+
+Verdicts (is_valid, issues, suggested_fix) are keyed by a hash of the
+normalized question content, the verifier prompt version and the model, so
+re-verifying a mostly unchanged set only sends the questions that changed.
+Editing a question, changing the verification prompts or switching model all
+produce a different key.
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from . import config
+from .prompts import VERIFICATION_PROMPT, VERIFICATION_SYSTEM_PROMPT
+
+# Derived from the prompt text, so any prompt edit invalidates old verdicts
+VERIFIER_PROMPT_VERSION = hashlib.sha256(
+    (VERIFICATION_SYSTEM_PROMPT + VERIFICATION_PROMPT).encode("utf-8")
+).hexdigest()[:12]
+
+
+def _normalize(text) -> str:
+    return re.sub(r"\s+", " ", str(text or "")).strip()
+
+
+def question_content_hash(question: dict) -> str:
+    """Hash of the fields the verifier judges, ignoring whitespace and key order."""
+    content = {
+        "materia": _normalize(question.get("materia")),
+        "argomenti": _normalize(question.get("argomenti")),
+        "domanda": _normalize(question.get("domanda")),
+        "risposte": [
+            [_normalize(r.get("text")), bool(r.get("isCorrect"))]
+            for r in question.get("risposte", [])
+            if isinstance(r, dict)
+        ],
+        "risposta_corretta_text": _normalize(question.get("risposta_corretta_text")),
+        "commento": _normalize(question.get("commento")),
+    }
+    encoded = json.dumps(content, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class VerificationCache:
+    """SQLite-backed verdict store, safe to share between threads."""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path or Path(config.CACHE_DIR) / "verification.sqlite")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS verdicts ("
+                " key TEXT PRIMARY KEY, is_valid INTEGER, issues TEXT, suggested_fix TEXT, created REAL)"
+            )
+
+    @staticmethod
+    def key_for(question: dict, model: str) -> str:
+        raw = f"{question_content_hash(question)}:{VERIFIER_PROMPT_VERSION}:{model}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: list[str]) -> dict[str, dict]:
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, is_valid, issues, suggested_fix FROM verdicts WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for key, is_valid, issues, suggested_fix in rows:
+                    found[key] = {
+                        "is_valid": bool(is_valid),
+                        "issues": json.loads(issues),
+                        "suggested_fix": suggested_fix,
+                    }
+        self.hits += len(found)
+        self.misses += len(set(keys)) - len(found)
+        return found
+
+    def put_many(self, verdicts: dict[str, dict]) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?, ?)",
+                [
+                    (
+                        key,
+                        int(bool(v.get("is_valid", True))),
+                        json.dumps(v.get("issues") or [], ensure_ascii=False),
+                        v.get("suggested_fix") or "",
+                        now,
+                    )
+                    for key, v in verdicts.items()
+                ],
+            )
+
+    def summary_lines(self) -> list[str]:
+        total = self.hits + self.misses
+        if not total:
+            return []
+        return [f"Cache verifiche: {self.hits}/{total} verdetti riutilizzati ({self.hits / total:.0%})"]
+
+
+_default_cache: Optional[VerificationCache] = None
+_default_lock = threading.Lock()
+
+
+def default_verification_cache() -> Optional[VerificationCache]:
+    """Process-wide cache, or None when disabled in config."""
+    global _default_cache
+    if not config.VERIFICATION_CACHE_ENABLED:
+        return None
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = VerificationCache()
+        return _default_cache
@@ -9,19 +9,22 @@ Usage:
 """
 
 import asyncio
-import json
 import os
 import sys
+import zlib
 from datetime import datetime
 from pathlib import Path
-from threading import Thread
+from threading import Lock, Thread
+from uuid import uuid4
 
-from flask import Flask, render_template_string, request, jsonify, Response
+from flask import Flask, render_template_string, request, jsonify, Response, send_file
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import RequestEntityTooLarge
 
 # Add parent directory to path for imports
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
-from ssm.generator import config
+from ssm.generator import codec, config
 from ssm.generator.pipeline import (
     generate_questions_batch,
     verify_questions,
@@ -29,20 +32,62 @@ from ssm.generator.pipeline import (
     validate_question_structure,
     extract_text,
 )
+from ssm.generator.bank import BankWriter, default_bank_path
+from ssm.generator.bank_index import BankIndex, CursorExpiredError
+from ssm.generator.cancellation import CancelToken, JobCancelledError
+from ssm.generator.diversity import digest_key, load_bank_digests
+from ssm.generator.retrieval import load_index, select_context
+from ssm.generator.rules import filter_by_rules
+from ssm.generator.session import ApiSession
+from ssm.generator.images import default_image_store
+from ssm.generator.static_assets import IMMUTABLE_CACHE_CONTROL, AssetStore
+from ssm.generator.tokens import count_tokens, max_batch_size
+from ssm.generator.uploads import UploadError, save_upload, submit_extraction, upload_path
 
 import httpx
 
+
+class CodecJSONProvider(DefaultJSONProvider):
+    """Request bodies and API responses through the fast codec (progress polls carry whole question lists)."""
+
+    def loads(self, s, **kwargs):
+        return codec.loads(s)
+
+    def dumps(self, obj, **kwargs):
+        if kwargs.get("indent") is None:
+            try:
+                return codec.dumps_line(obj)
+            except TypeError:  # Dates and other types only Flask's default() handles
+                pass
+        return super().dumps(obj, **kwargs)
+
+
 app = Flask(__name__)
+app.json = CodecJSONProvider(app)
+# Bodies above this are refused while streaming, before they are spooled to disk
+app.config["MAX_CONTENT_LENGTH"] = config.UPLOAD_MAX_BYTES + 64 * 1024
+
+# Generation progress per job id; each request thread only writes its own entry
+jobs = {}
+jobs_lock = Lock()
+latest_job_id = None
+# Cancel tokens of the running jobs, kept apart from the JSON-serialised status
+job_tokens = {}
 
-# Store generation progress
-generation_status = {
-    "running": False,
-    "progress": 0,
-    "total": 0,
-    "message": "",
-    "questions": [],
-    "errors": []
-}
+
+MAX_TRACKED_JOBS = 100
+
+
+def new_job_status(total):
+    return {
+        "running": True,
+        "cancelled": False,
+        "progress": 0,
+        "total": total,
+        "message": "Avvio generazione...",
+        "questions": [],
+        "errors": []
+    }
 
 HTML_TEMPLATE = '''
 <!DOCTYPE html>
@@ -371,6 +416,14 @@ HTML_TEMPLATE = '''
                     <input type="text" id="argomento" placeholder="Es: Scompenso cardiaco, Aritmie...">
                 </div>
 
+                <div class="form-group">
+                    <label>PDF o TXT di riferimento (opzionale)</label>
+                    <div class="file-input-wrapper">
+                        <input type="file" id="contextFile" accept=".pdf,.txt">
+                        <div class="file-input-display" id="contextFileDisplay">Trascina o seleziona un file (max {{ max_upload_mb }} MB)</div>
+                    </div>
+                </div>
+
                 <div class="form-group">
                     <label>Testo di riferimento (opzionale)</label>
                     <textarea id="contextText" rows="4" placeholder="Incolla qui testo da libri, appunti o materiale di studio..."></textarea>
@@ -388,6 +441,7 @@ HTML_TEMPLATE = '''
                         <div class="progress-fill" id="progressFill"></div>
                     </div>
                     <div class="status-message" id="statusMessage">Inizializzazione...</div>
+                    <button type="button" class="btn-secondary" id="cancelBtn" onclick="cancelJob()" style="margin-top: 10px;">Annulla</button>
                 </div>
 
                 <div class="error" id="errorBox" style="display: none;"></div>
@@ -423,6 +477,36 @@ HTML_TEMPLATE = '''
 
     <script>
         let generatedQuestions = [];
+        let currentJobId = null;
+        let uploadId = null;
+
+        document.getElementById('contextFile').addEventListener('change', async (e) => {
+            const file = e.target.files[0];
+            const display = document.getElementById('contextFileDisplay');
+            const btn = document.getElementById('generateBtn');
+            uploadId = null;
+            if (!file) return;
+
+            display.textContent = `Caricamento ed estrazione di ${file.name}...`;
+            btn.disabled = true;
+            try {
+                const form = new FormData();
+                form.append('file', file);
+                const response = await fetch('/api/upload', { method: 'POST', body: form });
+                const result = await response.json();
+                if (!result.success) {
+                    throw new Error(result.error);
+                }
+                uploadId = result.upload_id;
+                display.textContent = `${file.name}: ${result.pages} pagine, ~${result.tokens} token` +
+                    (result.tokens_saved ? ` (${result.tokens_saved} rimossi dalla pulizia)` : '') +
+                    (result.images ? `, ${result.images} figure` : '');
+            } catch (error) {
+                display.textContent = 'Errore: ' + error.message;
+            } finally {
+                btn.disabled = false;
+            }
+        });
 
         // Check API key status on load
         fetch('/api/status')
@@ -451,11 +535,17 @@ HTML_TEMPLATE = '''
                 materia = document.getElementById('argomento').value || 'Medicina Generale';
             }
 
+            const jobId = (crypto.randomUUID ? crypto.randomUUID() : String(Date.now()) + Math.random()).replace(/-/g, '');
+            currentJobId = jobId;
+            document.getElementById('cancelBtn').disabled = false;
+
             const data = {
+                job_id: jobId,
                 materia: materia,
                 argomento: document.getElementById('argomento').value || materia,
                 count: parseInt(document.getElementById('count').value),
                 context_text: document.getElementById('contextText').value || null,
+                upload_id: uploadId,
                 skip_verification: document.getElementById('skipVerification').checked,
                 api_key: document.getElementById('apiKey').value || null
             };
@@ -469,7 +559,7 @@ HTML_TEMPLATE = '''
 
                 // Poll for progress
                 const pollInterval = setInterval(async () => {
-                    const statusRes = await fetch('/api/progress');
+                    const statusRes = await fetch('/api/progress?job_id=' + jobId);
                     const status = await statusRes.json();
 
                     document.getElementById('progressFill').style.width =
@@ -487,6 +577,9 @@ HTML_TEMPLATE = '''
                 if (result.success) {
                     generatedQuestions = result.questions;
                     showResults(result);
+                    if (result.cancelled) {
+                        document.getElementById('statusMessage').textContent = result.message;
+                    }
                 } else {
                     throw new Error(result.error);
                 }
@@ -495,11 +588,26 @@ HTML_TEMPLATE = '''
                 errorBox.textContent = error.message;
                 errorBox.style.display = 'block';
             } finally {
+                currentJobId = null;
                 btn.disabled = false;
+                document.getElementById('cancelBtn').disabled = true;
                 document.getElementById('progressFill').style.width = '100%';
             }
         });
 
+        async function cancelJob() {
+            if (!currentJobId) return;
+            document.getElementById('cancelBtn').disabled = true;
+            await fetch('/api/jobs/' + currentJobId + '/cancel', { method: 'POST' });
+        }
+
+        // Leaving the page stops the job instead of letting it spend API calls nobody will see
+        window.addEventListener('pagehide', () => {
+            if (currentJobId && navigator.sendBeacon) {
+                navigator.sendBeacon('/api/jobs/' + currentJobId + '/cancel');
+            }
+        });
+
         function showResults(result) {
             document.getElementById('resultsCard').style.display = 'block';
             document.getElementById('statGenerated').textContent = result.total_generated;
@@ -564,134 +672,302 @@ HTML_TEMPLATE = '''
 '''
 
 
+SITE_ROOT = Path(__file__).parent.parent.parent
+
+assets = AssetStore()
+# The template only depends on config, so it is rendered once and served from memory
+assets.register("generator.html",
+                lambda: render_template_string(HTML_TEMPLATE, max_upload_mb=config.UPLOAD_MAX_BYTES // (1024 * 1024)).encode("utf-8"),
+                "text/html; charset=utf-8")
+assets.register("quiz.html", SITE_ROOT / "ssm" / "index.html", "text/html; charset=utf-8")
+assets.register("home.html", SITE_ROOT / "index.html", "text/html; charset=utf-8")
+assets.register("domande_unite_no_duplicati.jsonl", default_bank_path(), "application/jsonl; charset=utf-8")
+
+
 @app.route('/')
 def index():
-    return render_template_string(HTML_TEMPLATE)
+    return AssetStore.respond(assets.get("generator.html"), request)
+
+
+@app.route('/home/')
+def home_page():
+    asset = assets.get("home.html")
+    if asset is None:
+        return Response(status=404)
+    return AssetStore.respond(asset, request)
+
+
+@app.route('/quiz/')
+def quiz_page():
+    asset = assets.get("quiz.html")
+    if asset is None:
+        return Response(status=404)
+    return AssetStore.respond(asset, request)
+
+
+@app.route('/quiz/domande_unite_no_duplicati.jsonl')
+def quiz_bank():
+    asset = assets.get("domande_unite_no_duplicati.jsonl")
+    if asset is None:
+        return Response(status=404)
+    return AssetStore.respond(asset, request)
+
+
+@app.route('/quiz/img/<name>')
+def quiz_image(name):
+    # Extracted figures are content-addressed, so they never change once written
+    path = default_image_store().path_for(name)
+    if path.suffix not in (".webp", ".avif", ".png", ".jpeg", ".jpg") or not path.is_file():
+        return Response(status=404)
+    response = send_file(path, conditional=True, etag=True)
+    response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    return response
 
 
 @app.route('/api/status')
 def api_status():
     return jsonify({
-        "api_key_configured": bool(config.OPENAI_API_KEY),
+        "api_key_configured": bool(config.OPENAI_API_KEY or config.OPENAI_ENDPOINTS_FILE),
         "model": config.OPENAI_MODEL
     })
 
 
 @app.route('/api/progress')
 def api_progress():
-    return jsonify(generation_status)
+    job_id = request.args.get('job_id') or latest_job_id
+    with jobs_lock:
+        status = jobs.get(job_id)
+    if status is None:
+        return jsonify({**new_job_status(0), "running": False, "message": ""})
+    return jsonify(status)
 
 
 @app.route('/api/generate', methods=['POST'])
 def api_generate():
-    global generation_status
+    global latest_job_id
 
     data = request.json
     materia = data.get('materia', 'Medicina Generale')
     argomento = data.get('argomento', materia)
     count = min(data.get('count', 10), 50)  # Max 50 questions
     context_text = data.get('context_text')
+    upload_id = data.get('upload_id')
     skip_verification = data.get('skip_verification', False)
-    api_key = data.get('api_key') or config.OPENAI_API_KEY
+    job_id = data.get('job_id') or uuid4().hex
+
+    # The user's key lives only in this request's session, never in global config
+    cancel = CancelToken(config.JOB_DEADLINE_SECONDS)
+    session = ApiSession.from_config(api_key=data.get('api_key') or None, cancel=cancel)
 
-    if not api_key:
+    if not session.has_credentials:
         return jsonify({"success": False, "error": "API key non configurata"})
 
-    generation_status = {
-        "running": True,
-        "progress": 0,
-        "total": count,
-        "message": "Avvio generazione...",
-        "questions": [],
-        "errors": []
-    }
+    document = None
+    if upload_id:
+        path = upload_path(upload_id)
+        if path is None:
+            return jsonify({"success": False, "error": "File caricato non trovato: caricalo di nuovo"})
+        try:
+            # Normally an extraction cache hit; a miss re-extracts on the worker pool
+            document = submit_extraction(path).result(timeout=config.UPLOAD_EXTRACTION_TIMEOUT_SECONDS)
+        except Exception as e:
+            return jsonify({"success": False, "error": f"Estrazione fallita: {e}"})
+
+    status = new_job_status(count)
+    with jobs_lock:
+        # Forget the oldest finished jobs (dicts keep insertion order)
+        finished = [jid for jid, job in jobs.items() if not job["running"]]
+        for jid in finished[:max(0, len(jobs) - MAX_TRACKED_JOBS)]:
+            del jobs[jid]
+        jobs[job_id] = status
+        job_tokens[job_id] = cancel
+        latest_job_id = job_id
 
     try:
         # Run async generation in sync context
         questions = asyncio.run(run_generation(
-            api_key=api_key,
+            session=session,
+            status=status,
             materia=materia,
             argomento=argomento,
             count=count,
             context_text=context_text,
-            skip_verification=skip_verification
+            skip_verification=skip_verification,
+            document=document,
         ))
 
-        generation_status["running"] = False
-        generation_status["message"] = "Completato!"
+        status["running"] = False
+        status["cancelled"] = cancel.cancelled
+        if cancel.cancelled:
+            status["message"] = f"Annullato ({cancel.reason}): {len(questions)} domande conservate"
+        else:
+            status["message"] = "Completato!"
 
         return jsonify({
             "success": True,
+            "job_id": job_id,
+            "cancelled": cancel.cancelled,
+            "message": status["message"],
             "questions": questions,
-            "total_generated": generation_status["progress"],
-            "excluded": generation_status["progress"] - len(questions)
+            "total_generated": status["progress"],
+            "excluded": status["progress"] - len(questions)
         })
 
     except Exception as e:
-        generation_status["running"] = False
-        generation_status["message"] = f"Errore: {str(e)}"
+        status["running"] = False
+        status["message"] = f"Errore: {str(e)}"
         return jsonify({"success": False, "error": str(e)})
 
+    finally:
+        with jobs_lock:
+            job_tokens.pop(job_id, None)
 
-async def run_generation(api_key, materia, argomento, count, context_text, skip_verification):
-    global generation_status
 
-    all_questions = []
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def api_cancel_job(job_id):
+    with jobs_lock:
+        status = jobs.get(job_id)
+        cancel = job_tokens.get(job_id)
+    if status is None:
+        return jsonify({"success": False, "error": "Job non trovato"}), 404
+    if cancel is None or not status["running"]:
+        return jsonify({"success": False, "error": "Job già terminato"})
 
-    async with httpx.AsyncClient() as client:
-        # Temporarily override API key
-        original_key = config.OPENAI_API_KEY
-        config.OPENAI_API_KEY = api_key
+    cancel.cancel("annullato dall'utente")
+    status["message"] = "Annullamento in corso..."
+    return jsonify({"success": True, "job_id": job_id})
 
-        try:
-            remaining = count
-            batch_num = 0
 
-            while remaining > 0:
-                batch_size = min(remaining, config.DEFAULT_BATCH_SIZE)
-                batch_num += 1
+async def run_generation(session, status, materia, argomento, count, context_text, skip_verification, document=None):
+    """
+    Generate, filter and verify; once cancelled, return the questions already accepted.
 
-                generation_status["message"] = f"Generazione batch {batch_num}..."
+    With an uploaded ``document`` each batch gets its own slice of it (BM25-selected
+    chunks and their figures when an argomento is set) instead of ``context_text``.
+    """
+    all_questions = []
+    cancel = session.cancel
+    index = None
+    if document is not None and argomento and argomento != materia:
+        index = await asyncio.to_thread(load_index, document)
+    digest = None
+    if config.DIVERSITY_ENABLED:
+        key = digest_key(materia, argomento)
+        digest = (await asyncio.to_thread(load_bank_digests, default_bank_path(), [key]))[key]
 
+    async with httpx.AsyncClient() as client:
+        remaining = count
+        batch_num = 0
+
+        while remaining > 0 and not cancel.cancelled:
+            batch_size = min(remaining, config.DEFAULT_BATCH_SIZE, max_batch_size())
+            batch_num += 1
+
+            status["message"] = f"Generazione batch {batch_num}..."
+
+            batch_context, images = context_text, None
+            if document is not None:
+                batch_context, pages = document.text, None
+                if index is not None:
+                    batch_context, pages = select_context(document, index, argomento, batch_index=batch_num - 1)
+                images = document.images_for(pages, batch_num - 1)
+
+            try:
+                if session.breaker is not None:
+                    # Pause the job while the API (or every pooled endpoint) is down
+                    await cancel.guard(session.breaker.wait_ready())
+                await cancel.guard(session.limiter.acquire())
                 questions = await generate_questions_batch(
                     client,
                     materia=materia,
                     argomento=argomento,
                     count=batch_size,
-                    context_text=context_text,
+                    context_text=batch_context,
+                    session=session,
+                    exclude=digest.exclusions(pending=all_questions) if digest else None,
+                    images=images,
                 )
+            except JobCancelledError:
+                break
+
+            status["progress"] += len(questions)
+
+            questions, rejections = filter_by_rules(questions)
+            if rejections:
+                rejected = ", ".join(f"{rule} {n}" for rule, n in rejections.most_common())
+                status["errors"].append(f"Batch {batch_num} scarti per regola: {rejected}")
+            if digest is not None:
+                unique = digest.filter_new(questions, pending=all_questions)
+                if len(unique) < len(questions):
+                    status["errors"].append(f"Batch {batch_num}: {len(questions) - len(unique)} duplicati scartati")
+                questions = unique
+            all_questions.extend(questions)
+
+            remaining -= batch_size
+
+        # Verify questions
+        if not skip_verification and all_questions:
+            status["message"] = "Verifica domande..."
+
+            try:
+                cancel.check()
+                verifications = await verify_questions(client, all_questions, session=session)
+                all_questions = filter_valid_questions(all_questions, verifications)
+            except JobCancelledError:
+                # Only verified questions count as accepted
+                status["errors"].append(f"Annullato prima della verifica: {len(all_questions)} domande scartate")
+                all_questions = []
+            except Exception as e:
+                status["errors"].append(f"Verifica fallita ({e}): {len(all_questions)} domande non verificate scartate")
+                all_questions = []
+
+        # Validate structure
+        valid_questions = []
+        for q in all_questions:
+            q.setdefault("has_image", False)
+            q.setdefault("image_src", None)
+            q.setdefault("argomenti", q.get("materia", ""))
+            if validate_question_structure(q):
+                valid_questions.append(q)
+
+        return valid_questions
+
+
+@app.route('/api/upload', methods=['POST'])
+def api_upload():
+    """Store an uploaded PDF/TXT and extract it, returning the id to pass to /api/generate."""
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        return jsonify({"success": False, "error": "Nessun file caricato"}), 400
 
-                all_questions.extend(questions)
-                generation_status["progress"] = len(all_questions)
-
-                remaining -= batch_size
-
-                if remaining > 0:
-                    await asyncio.sleep(config.RATE_LIMIT_DELAY_SECONDS)
-
-            # Verify questions
-            if not skip_verification and all_questions:
-                generation_status["message"] = "Verifica domande..."
+    try:
+        path = save_upload(upload.stream, upload.filename)
+    except UploadError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
 
-                try:
-                    verifications = await verify_questions(client, all_questions)
-                    all_questions = filter_valid_questions(all_questions, verifications)
-                except Exception as e:
-                    generation_status["errors"].append(f"Verifica fallita: {e}")
+    try:
+        document = submit_extraction(path).result(timeout=config.UPLOAD_EXTRACTION_TIMEOUT_SECONDS)
+    except Exception as e:
+        return jsonify({"success": False, "error": f"Estrazione fallita: {e}"})
 
-            # Validate structure
-            valid_questions = []
-            for q in all_questions:
-                q.setdefault("has_image", False)
-                q.setdefault("image_src", None)
-                q.setdefault("argomenti", q.get("materia", ""))
-                if validate_question_structure(q):
-                    valid_questions.append(q)
+    return jsonify({
+        "success": True,
+        "upload_id": path.name,
+        "filename": upload.filename,
+        "pages": len(document.pages),
+        "chars": len(document.text),
+        "tokens": count_tokens(document.text),
+        "tokens_saved": document.cleaning.tokens_saved if document.cleaning else 0,
+        "images": len(document.images),
+    })
 
-            return valid_questions
 
-        finally:
-            config.OPENAI_API_KEY = original_key
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    return jsonify({
+        "success": False,
+        "error": f"File troppo grande (max {config.UPLOAD_MAX_BYTES // (1024 * 1024)} MB)"
+    }), 413
 
 
 @app.route('/api/append', methods=['POST'])
@@ -702,27 +978,88 @@ def api_append():
     if not questions:
         return jsonify({"success": False, "error": "Nessuna domanda da salvare"})
 
-    # Find the main jsonl file
-    base_path = Path(__file__).parent.parent
-    target_file = base_path / "domande_unite_no_duplicati.jsonl"
-
-    if not target_file.exists():
-        target_file = base_path / "domande_unite.jsonl"
-
     try:
-        with open(target_file, "a", encoding="utf-8") as f:
-            for q in questions:
-                f.write(json.dumps(q, ensure_ascii=False) + "\n")
+        result = get_bank_writer().append(questions)
 
         return jsonify({
             "success": True,
-            "count": len(questions),
-            "file": target_file.name
+            "count": result.written,
+            "rejected": result.rejected,
+            "file": get_bank_writer().bank_path.name
         })
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
 
+_bank_writer = None
+_bank_writer_lock = Lock()
+
+
+def get_bank_writer():
+    """Single group-commit writer shared by all request threads."""
+    global _bank_writer
+    with _bank_writer_lock:
+        if _bank_writer is None:
+            _bank_writer = BankWriter()
+        return _bank_writer
+
+
+_bank_index = None
+_bank_index_lock = Lock()
+
+
+def get_bank_index():
+    """Shared in-memory index of the bank, refreshed on each query."""
+    global _bank_index
+    with _bank_index_lock:
+        if _bank_index is None:
+            _bank_index = BankIndex(default_bank_path())
+    _bank_index.refresh()
+    return _bank_index
+
+
+@app.route('/api/questions')
+def api_questions():
+    index = get_bank_index()
+
+    # The ETag covers both the bank state and the query, so repeat polls are 304s
+    etag = f"{index.etag}-{zlib.crc32(request.query_string):x}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    args = request.args
+    has_image = args.get('has_image')
+    fields = args.get('fields')
+
+    try:
+        limit = min(max(int(args.get('limit', 50)), 1), 500)
+        result = index.query(
+            materia=args.get('materia'),
+            argomenti=args.get('argomenti'),
+            has_image=None if has_image is None else has_image.lower() in ('1', 'true', 'si', 'yes'),
+            text=args.get('q'),
+            cursor=args.get('cursor'),
+            limit=limit,
+            fields=[f.strip() for f in fields.split(',') if f.strip()] if fields else None,
+        )
+    except CursorExpiredError as e:
+        return jsonify({"success": False, "error": str(e)}), 409
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    response = jsonify({
+        "success": True,
+        "total": result.total,
+        "next_cursor": result.next_cursor,
+        "questions": result.items
+    })
+    response.set_etag(etag)
+    response.last_modified = index.last_modified
+    return response.make_conditional(request)
+
+
 def main():
     print("=" * 50)
     print("SSM Question Generator - Web UI")
@@ -733,7 +1070,10 @@ def main():
     print("Premi Ctrl+C per terminare")
     print()
 
-    app.run(host='0.0.0.0', port=5000, debug=False)
+    with app.app_context():
+        assets.preload()
+
+    app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
 
 
 if __name__ == '__main__':
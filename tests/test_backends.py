@@ -0,0 +1,103 @@
+import asyncio
+import time
+
+import pytest
+
+from ssm.generator.backends import Endpoint, EndpointPool, PoolBreaker
+from ssm.generator.resilience import CircuitBreaker, CircuitOpenError
+
+
+def make_pool(*names: str, cooldown: float = 60.0) -> EndpointPool:
+    endpoints = [Endpoint(base_url=f"http://{name}", api_key="k", name=name) for name in names]
+    for endpoint in endpoints:
+        endpoint.breaker = CircuitBreaker(failure_rate=0.5, window=4, min_calls=1, cooldown=cooldown)
+    return EndpointPool(endpoints)
+
+
+def test_total_outage_fails_fast():
+    pool = make_pool("a", "b")
+    for endpoint in pool.endpoints:
+        endpoint.breaker.record(False)
+
+    started = time.monotonic()
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(pool.acquire())
+    assert time.monotonic() - started < 1.0
+    assert all(e.in_flight == 0 for e in pool.endpoints)
+
+    breaker = PoolBreaker(pool)
+    assert not breaker.allows_request()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    assert breaker.fast_failures == 1
+
+
+def test_pool_breaker_waits_for_first_probe():
+    pool = make_pool("a", "b", cooldown=0.2)
+    for endpoint in pool.endpoints:
+        endpoint.breaker.record(False)
+    breaker = PoolBreaker(pool)
+
+    asyncio.run(asyncio.wait_for(breaker.wait_ready(), timeout=2.0))
+    assert breaker.allows_request()
+
+
+def test_acquire_picks_least_loaded_endpoint():
+    pool = make_pool("a", "b")
+    a, b = pool.endpoints
+
+    async def run():
+        first = await pool.acquire()
+        second = await pool.acquire()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert {first, second} == {a, b}
+    assert a.in_flight == b.in_flight == 1
+
+    pool.release(a, True, 0.1)
+    assert a.in_flight == 0 and a.requests == 1
+
+
+def test_acquire_avoids_given_endpoint_when_possible():
+    pool = make_pool("a", "b")
+    a, b = pool.endpoints
+    assert asyncio.run(pool.acquire(avoid=a)) is b
+
+    single = make_pool("c")
+    only = single.endpoints[0]
+    assert asyncio.run(single.acquire(avoid=only)) is only
+
+
+def test_acquire_skips_open_endpoint():
+    pool = make_pool("a", "b")
+    a, b = pool.endpoints
+    a.breaker.record(False)
+    for _ in range(3):
+        assert asyncio.run(pool.acquire()) is b
+    assert a.in_flight == 0
+
+
+def test_cancelled_acquire_gives_the_slot_back():
+    endpoint = Endpoint(base_url="http://a", api_key="k", rpm=1)
+    pool = EndpointPool([endpoint])
+
+    async def run():
+        await pool.acquire()
+        pool.release(endpoint, True)
+        # The next slot is a minute away: cancel while waiting for it
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(pool.acquire(), timeout=0.1)
+
+    asyncio.run(run())
+    assert endpoint.in_flight == 0
+
+
+def test_cancelled_probe_is_handed_out_again():
+    pool = make_pool("a", cooldown=0.0)
+    endpoint = pool.endpoints[0]
+    endpoint.breaker.record(False)
+
+    probe = asyncio.run(pool.acquire())
+    pool.abandon(probe)
+    assert asyncio.run(pool.acquire()) is endpoint
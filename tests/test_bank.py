@@ -0,0 +1,80 @@
+import json
+
+from ssm.generator import codec
+from ssm.generator.bank import compact_bank, index_path_for, repair_tail
+
+
+def question(domanda: str, materia: str = "Pediatria") -> dict:
+    risposte = [{"id": i, "text": f"Risposta {i}", "isCorrect": i == 1} for i in range(1, 6)]
+    return {
+        "materia": materia,
+        "argomenti": materia,
+        "domanda": domanda,
+        "has_image": False,
+        "image_src": None,
+        "risposte": risposte,
+        "risposta_corretta_text": "Risposta 1",
+        "commento": "Commento",
+    }
+
+
+def line(q: dict) -> str:
+    return codec.dumps_line(q) + "\n"
+
+
+def test_repair_tail_leaves_complete_bank_alone(tmp_path):
+    bank = tmp_path / "bank.jsonl"
+    content = line(question("Prima?"))
+    bank.write_text(content, encoding="utf-8")
+
+    assert repair_tail(bank) == 0
+    assert bank.read_text(encoding="utf-8") == content
+
+
+def test_repair_tail_adds_missing_newline_to_valid_record(tmp_path):
+    bank = tmp_path / "bank.jsonl"
+    content = line(question("Prima?")) + codec.dumps_line(question("Seconda?"))
+    bank.write_text(content, encoding="utf-8")
+
+    assert repair_tail(bank) == 0
+    assert bank.read_text(encoding="utf-8") == content + "\n"
+
+
+def test_repair_tail_moves_torn_record_aside(tmp_path):
+    bank = tmp_path / "bank.jsonl"
+    complete = line(question("Prima?"))
+    torn = '{"materia": "Pediatria", "domanda": "Sec'
+    bank.write_text(complete + torn, encoding="utf-8")
+
+    assert repair_tail(bank) == len(torn)
+    assert bank.read_text(encoding="utf-8") == complete
+    assert (tmp_path / "bank.jsonl.corrupt").read_text(encoding="utf-8") == torn + "\n"
+
+
+def test_compact_bank_keeps_order_and_drops_later_duplicates(tmp_path):
+    bank = tmp_path / "bank.jsonl"
+    first, second, third = question("Prima?"), question("Seconda?", "Cardiologia"), question("Terza?")
+    duplicate = question("  PRIMA? ")
+    bank.write_text(line(first) + line(second) + "\n" + line(duplicate) + line(third), encoding="utf-8")
+
+    result = compact_bank(bank)
+
+    assert (result.kept, result.duplicates, result.invalid, result.shifted) == (3, 1, 0, 1)
+    kept = [json.loads(text) for text in bank.read_text(encoding="utf-8").splitlines()]
+    assert [q["domanda"] for q in kept] == ["Prima?", "Seconda?", "Terza?"]
+
+    index = json.loads(index_path_for(bank).read_text(encoding="utf-8"))
+    assert index["count"] == 3
+    assert index["materie"]["Pediatria"]["count"] == 2
+    assert index["size"] == bank.stat().st_size
+
+
+def test_compact_bank_moves_invalid_lines_aside(tmp_path):
+    bank = tmp_path / "bank.jsonl"
+    bank.write_text(line(question("Prima?")) + "non json\n" + line(question("Seconda?")), encoding="utf-8")
+
+    result = compact_bank(bank)
+
+    assert (result.kept, result.invalid, result.shifted) == (2, 1, 1)
+    assert len(bank.read_text(encoding="utf-8").splitlines()) == 2
+    assert (tmp_path / "bank.jsonl.corrupt").read_text(encoding="utf-8") == "non json\n"
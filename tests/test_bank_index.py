@@ -0,0 +1,40 @@
+from ssm.generator import codec
+from ssm.generator.bank_index import BankIndex
+
+
+def question(materia: str, domanda: str) -> dict:
+    risposte = [{"id": i, "text": f"Risposta {i}", "isCorrect": i == 1} for i in range(1, 6)]
+    return {
+        "materia": materia,
+        "argomenti": materia,
+        "domanda": domanda,
+        "has_image": False,
+        "image_src": None,
+        "risposte": risposte,
+        "risposta_corretta_text": "Risposta 1",
+        "commento": "Commento",
+    }
+
+
+def make_index(tmp_path) -> BankIndex:
+    bank = tmp_path / "bank.jsonl"
+    lines = [
+        question("Pediatria", "Il bambino con febbre e esantema"),
+        question("Cardiologia", "Il paziente con dolore toracico"),
+    ]
+    bank.write_text("".join(codec.dumps_line(q) + "\n" for q in lines), encoding="utf-8")
+    index = BankIndex(bank)
+    index.refresh()
+    return index
+
+
+def test_text_query_matches_terms(tmp_path):
+    result = make_index(tmp_path).query(text="esantema")
+    assert [item["materia"] for item in result.items] == ["Pediatria"]
+
+
+def test_stopword_only_query_matches_nothing(tmp_path):
+    index = make_index(tmp_path)
+    assert index.query(text="il").total == 0
+    assert index.query(text="?!").total == 0
+    assert index.query().total == 2
@@ -0,0 +1,44 @@
+import gzip
+import json
+
+from ssm.generator.extraction_cache import ExtractionCache
+from ssm.generator.pipeline import build_document
+
+
+def make_cache(tmp_path):
+    cache = ExtractionCache(cache_dir=tmp_path)
+    document = build_document([(1, "Prima pagina " * 50), (2, "Seconda pagina " * 50)])
+    cache.put("doc", document)
+    return cache, document
+
+
+def test_round_trip(tmp_path):
+    cache, document = make_cache(tmp_path)
+    cached = cache.get("doc")
+    assert cached.text == document.text
+    assert cached.pages == document.pages
+    assert cached.chunks == document.chunks
+
+
+def test_truncated_entry_is_a_miss_and_deleted(tmp_path):
+    cache, _ = make_cache(tmp_path)
+    path = cache.path_for("doc")
+    data = path.read_bytes()
+    path.write_bytes(data[: len(data) // 2])
+
+    assert cache.get("doc") is None
+    assert not path.exists()
+
+
+def test_entry_missing_fields_is_a_miss_and_deleted(tmp_path):
+    cache, _ = make_cache(tmp_path)
+    path = cache.path_for("doc")
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump({"text": "solo testo"}, f)
+
+    assert cache.get("doc") is None
+    assert not path.exists()
+
+
+def test_missing_entry_is_a_miss(tmp_path):
+    assert ExtractionCache(cache_dir=tmp_path).get("assente") is None
@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+import pytest
+
+from ssm.generator.resilience import CircuitBreaker, CircuitOpenError
+
+
+def open_breaker(cooldown: float = 60.0) -> CircuitBreaker:
+    breaker = CircuitBreaker(failure_rate=0.5, window=4, min_calls=2, cooldown=cooldown)
+    breaker.record(False)
+    breaker.record(False)
+    return breaker
+
+
+def test_opens_on_failure_rate():
+    breaker = CircuitBreaker(failure_rate=0.5, window=4, min_calls=4, cooldown=60)
+    for success in (True, False, True):
+        breaker.record(success)
+    assert breaker.state == "closed"
+    breaker.record(False)
+    assert breaker.state == "open"
+    assert breaker.opens == 1
+
+
+def test_open_breaker_fails_fast():
+    breaker = open_breaker()
+    assert not breaker.allows_request()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    assert breaker.fast_failures == 1
+
+
+def test_half_open_allows_a_single_probe():
+    breaker = open_breaker(cooldown=0.0)
+    breaker.check()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+    breaker.record(True)
+    assert breaker.state == "closed"
+    breaker.check()
+
+
+def test_failed_probe_reopens():
+    breaker = open_breaker(cooldown=0.0)
+    breaker.check()
+    breaker.record(False)
+    assert breaker.opens == 2
+
+
+def test_abandoned_probe_is_handed_out_again():
+    breaker = open_breaker(cooldown=0.0)
+    breaker.check()
+    breaker.abandon()
+    breaker.check()
+    assert breaker.state == "half_open"
+
+
+def test_wait_ready_returns_after_cooldown():
+    breaker = open_breaker(cooldown=0.2)
+    started = time.monotonic()
+    asyncio.run(asyncio.wait_for(breaker.wait_ready(), timeout=2.0))
+    assert time.monotonic() - started >= 0.2
+    assert breaker.allows_request()
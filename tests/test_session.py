@@ -0,0 +1,43 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from ssm.generator import config
+from ssm.generator.backends import PoolBreaker
+from ssm.generator.pipeline import call_openai_api
+from ssm.generator.resilience import CircuitBreaker, CircuitOpenError
+from ssm.generator.session import ApiSession
+
+
+@pytest.fixture
+def pooled_session(tmp_path, monkeypatch):
+    endpoints_file = tmp_path / "endpoints.json"
+    endpoints_file.write_text(json.dumps([{"base_url": "http://a", "api_key": "k"}]))
+    monkeypatch.setattr(config, "OPENAI_ENDPOINTS_FILE", str(endpoints_file))
+    monkeypatch.setattr(config, "CIRCUIT_BREAKER_ENABLED", True)
+    return ApiSession.from_config()
+
+
+def test_pooled_session_has_pool_breaker(pooled_session):
+    assert isinstance(pooled_session.breaker, PoolBreaker)
+    assert pooled_session.breaker.pool is pooled_session.pool
+
+
+def test_pooled_call_fails_fast_during_outage(pooled_session):
+    endpoint = pooled_session.pool.endpoints[0]
+    endpoint.breaker = CircuitBreaker(min_calls=1, cooldown=60)
+    endpoint.breaker.record(False)
+
+    async def call():
+        transport = httpx.MockTransport(lambda request: httpx.Response(500))
+        async with httpx.AsyncClient(transport=transport) as client:
+            await call_openai_api(client, [{"role": "user", "content": "x"}], session=pooled_session)
+
+    started = time.monotonic()
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(call())
+    assert time.monotonic() - started < 1.0
+    assert endpoint.in_flight == 0